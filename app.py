@@ -1,19 +1,80 @@
 import os
 import json
+import atexit
+import multiprocessing
 import concurrent.futures
 
 from flask import Flask
 from extensions import db, login_manager
+from database import engine_options, configure_sqlite, upgrade_schema
+from pixel_cache import PixelCache
+from previews import PreviewCache
+from change_feed import ChangeFeed, track_image_changes
+from models import track_library_revision
+from metrics import Metrics
 from blueprints.auth import auth_bp
 from blueprints.main import main_bp
 from blueprints.api import api_bp
+from blueprints.playlists import playlists_bp
+from blueprints.metrics import metrics_bp
 
 def create_app(test_config=None):
     app = Flask(__name__)
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
+    # SQLite by default; set DATABASE_URL (e.g. postgresql+psycopg2://...) for a database server
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
+    # Connection pool of a database server, per worker process (ignored for SQLite)
+    app.config['DATABASE_POOL_SIZE'] = int(os.environ.get('DATABASE_POOL_SIZE', 10))
+    app.config['DATABASE_MAX_OVERFLOW'] = int(os.environ.get('DATABASE_MAX_OVERFLOW', 20))
+    app.config['DATABASE_POOL_TIMEOUT'] = 30
+    app.config['DATABASE_POOL_RECYCLE'] = 1800
+    # SQLite: WAL lets device polls read while uploads commit; wait for locks instead of failing
+    app.config['SQLITE_JOURNAL_MODE'] = 'WAL'
+    app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = 5000
     app.config['UPLOAD_FOLDER'] = os.path.join('static', 'uploads')
     app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024  # 2MB limit
+    # Largest decoded size of an upload; checked on the header so compressed bombs are never decoded
+    app.config['UPLOAD_MAX_PIXELS'] = 16 * 1024 * 1024
+    # Most frames an animated upload may have; all frames together count towards UPLOAD_MAX_PIXELS
+    app.config['ANIMATION_MAX_FRAMES'] = 256
+    # Request size and image count limits for /api/images/import; each image is limited by MAX_CONTENT_LENGTH
+    app.config['IMPORT_MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024
+    app.config['IMPORT_MAX_ITEMS'] = 5000
+    # Total size of the images of one import once zip archives are expanded, checked before inflating
+    app.config['IMPORT_MAX_TOTAL_BYTES'] = 256 * 1024 * 1024
+    # Images decoded, written and inserted at a time; bounds the decoded pixels held in memory
+    app.config['IMPORT_CHUNK_SIZE'] = 16
+    # Seconds devices may reuse API responses before revalidating with If-None-Match
+    app.config['API_CACHE_MAX_AGE'] = 0
+    # Seconds clients may cache files served from fingerprinted /api/files/ URLs
+    app.config['ASSET_MAX_AGE'] = 365 * 24 * 60 * 60
+    # On-disk artifact format: 'bmp', or 'raw' for header + packed RGB (optionally zlib-compressed)
+    app.config['STORAGE_FORMAT'] = 'bmp'
+    app.config['STORAGE_COMPRESS'] = False
+    # Default and maximum number of images per /api/images page
+    app.config['API_PAGE_SIZE'] = 100
+    app.config['API_MAX_PAGE_SIZE'] = 1000
+    # Memory budget for decoded pixel buffers held by each worker process
+    app.config['PIXEL_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+    # Gallery previews: allowed sizes (longest side in pixels), default size and format, disk budget
+    app.config['PREVIEW_SIZES'] = (64, 128, 256)
+    app.config['PREVIEW_SIZE'] = 128
+    app.config['PREVIEW_FORMAT'] = 'png'
+    app.config['PREVIEW_CACHE_MAX_BYTES'] = 32 * 1024 * 1024
+    # Earlier versions kept per image for /api/image/<id>/delta; older ones are deleted on the next edit
+    app.config['IMAGE_MAX_VERSIONS'] = 10
+    # Image change events kept for /api/changes, and how long a request may wait for one
+    app.config['CHANGE_FEED_HISTORY'] = 1000
+    app.config['CHANGE_FEED_TIMEOUT'] = 25
+    # Seconds between keep-alive comments on the /api/changes/stream connection
+    app.config['CHANGE_FEED_KEEPALIVE'] = 15
+    # Worker processes that render per-display variants at ingest (None: one per CPU, 0: render inline)
+    app.config['RENDER_PROCESSES'] = None
+    # How render workers are started; 'spawn' where the fork server is not available (Windows)
+    app.config['RENDER_START_METHOD'] = 'forkserver'
+    # Collect request and query metrics and serve them at /metrics
+    app.config['METRICS_ENABLED'] = True
 
     # Load displays configuration
     displays_path = os.path.join(os.path.dirname(__file__), 'displays.json')
@@ -26,22 +87,63 @@ def create_app(test_config=None):
     if test_config:
         app.config.update(test_config)
 
+    # Explicit engine options (from test_config) win over the DATABASE_* settings
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
 
     # ThreadPoolExecutor for offloading I/O tasks
     app.executor = concurrent.futures.ThreadPoolExecutor()
 
+    # Process pool for CPU-bound variant rendering; workers start on first use.
+    # The first submit usually comes from an executor thread, and forking a
+    # threaded process can copy locks held by other threads, so workers are
+    # started from a single-threaded fork server instead.
+    app.render_pool = None
+    if app.config['RENDER_PROCESSES'] != 0:
+        start_method = app.config['RENDER_START_METHOD']
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = 'spawn'
+        app.render_pool = concurrent.futures.ProcessPoolExecutor(
+            app.config['RENDER_PROCESSES'], mp_context=multiprocessing.get_context(start_method))
+        atexit.register(app.render_pool.shutdown, cancel_futures=True)
+
+    # Byte-bounded LRU cache for decoded pixel data
+    app.pixel_cache = PixelCache(app.config['PIXEL_CACHE_MAX_BYTES'])
+
+    # Size-bounded directory of encoded gallery previews
+    preview_folder = app.config.get('PREVIEW_FOLDER') or os.path.join(app.config['UPLOAD_FOLDER'], 'previews')
+    app.preview_cache = PreviewCache(preview_folder, app.config['PREVIEW_CACHE_MAX_BYTES'])
+
+    # Fans image create/update/delete events out to waiting devices
+    app.change_feed = ChangeFeed(app.config['CHANGE_FEED_HISTORY'])
+    track_image_changes(db.session)
+    # Lets /api/images revalidate with one primary key read
+    track_library_revision(db.session)
+
     db.init_app(app)
+    with app.app_context():
+        configure_sqlite(db.engine, app.config)
+        # Request latency and DB query histograms, plus cache and executor gauges
+        app.metrics = None
+        if app.config['METRICS_ENABLED']:
+            app.metrics = Metrics()
+            app.metrics.init_app(app, db.engine)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(playlists_bp, url_prefix='/api')
+    if app.metrics:
+        app.register_blueprint(metrics_bp)
 
     with app.app_context():
         db.create_all()
+        upgrade_schema(db.engine, db.metadata)
 
     return app
 
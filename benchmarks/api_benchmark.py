@@ -0,0 +1,293 @@
+"""
+Load test for the device-facing API.
+
+Seeds a fresh application with users and images of several sizes, drives
+/api/images, /api/image/<id>/rgb, /save_drawing (raw and data URL bodies) and
+/upload from concurrent clients, and reports latency percentiles, throughput
+and peak RSS as JSON so runs can be compared.
+
+Run from the repository root:
+
+    python -m benchmarks.api_benchmark --images 200 --concurrency 8 --output before.json
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from app import create_app, db
+from models import User
+from storage import encode_raw
+from utils import save_image_artifact
+from PIL import Image as PILImage
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# save_drawing posts the raw pixel body the drawing editor sends; save_drawing_data_url
+# the older JSON body with a base64 PNG data URL
+SCENARIOS = ('list_images', 'image_rgb', 'save_drawing', 'save_drawing_data_url', 'upload')
+
+PASSWORD = 'benchmark'
+
+def parse_sizes(value):
+    """
+    Parses a comma separated list of WIDTHxHEIGHT sizes.
+    """
+    sizes = []
+    for size in value.split(','):
+        width, height = size.lower().split('x')
+        sizes.append((int(width), int(height)))
+    return sizes
+
+def percentile(sorted_values, q):
+    """
+    Returns the q-th percentile (0-100) of sorted_values, interpolating
+    linearly between the closest ranks.
+    """
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+def peak_rss_bytes():
+    """
+    Returns the peak resident set size of this process in bytes, or None
+    where the resource module is unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def random_image(rng, size):
+    """
+    Returns an RGB image of random pixels, so every image has distinct content.
+    """
+    return PILImage.frombytes('RGB', size, rng.randbytes(size[0] * size[1] * 3))
+
+def encode_png(pil_image):
+    buf = io.BytesIO()
+    pil_image.save(buf, 'PNG')
+    return buf.getvalue()
+
+def seed(app, users, images, sizes, rng):
+    """
+    Creates users and images directly, bypassing HTTP.
+
+    Returns:
+        Tuple of (usernames, image ids).
+    """
+    usernames = [f'bench{index}' for index in range(users)]
+    with app.app_context():
+        user_ids = []
+        for username in usernames:
+            user = User(username=username)
+            user.set_password(PASSWORD)
+            db.session.add(user)
+            db.session.flush()
+            user_ids.append(user.id)
+        db.session.commit()
+
+        image_ids = []
+        for index in range(images):
+            db_image = save_image_artifact(
+                random_image(rng, sizes[index % len(sizes)]),
+                user_id=user_ids[index % len(user_ids)],
+                upload_folder=app.config['UPLOAD_FOLDER'],
+                metadata={'display_name': 'Benchmark'},
+                cache=app.pixel_cache,
+                storage_format=app.config['STORAGE_FORMAT'],
+                compress=app.config['STORAGE_COMPRESS']
+            )
+            image_ids.append(db_image.id)
+    return usernames, image_ids
+
+def make_request(scenario, client, rng, image_ids, sizes):
+    """
+    Sends one request of scenario and returns the response.
+    """
+    if scenario == 'list_images':
+        return client.get('/api/images')
+    if scenario == 'image_rgb':
+        return client.get(f'/api/image/{rng.choice(image_ids)}/rgb')
+    if scenario == 'save_drawing':
+        size = rng.choice(sizes)
+        body = encode_raw(size[0], size[1], random_image(rng, size).tobytes())
+        return client.post('/save_drawing?display_name=Benchmark', data=body,
+                           content_type='application/octet-stream')
+    if scenario == 'save_drawing_data_url':
+        data_url = 'data:image/png;base64,' + base64.b64encode(
+            encode_png(random_image(rng, rng.choice(sizes)))).decode('ascii')
+        return client.post('/save_drawing', json={'image': data_url, 'display_name': 'Benchmark'})
+    if scenario == 'upload':
+        data = encode_png(random_image(rng, rng.choice(sizes)))
+        return client.post('/upload', data={'file': (io.BytesIO(data), 'bench.png')},
+                           content_type='multipart/form-data')
+    raise ValueError(f'Unknown scenario: {scenario}')
+
+def run_scenario(app, scenario, requests, concurrency, usernames, image_ids, sizes, seed_value):
+    """
+    Sends requests requests of scenario from concurrency clients, each logged
+    in as one of the seeded users.
+
+    Returns:
+        Dictionary of latency percentiles in milliseconds, throughput and error count.
+    """
+    def worker(index):
+        rng = random.Random(f'{seed_value}-{scenario}-{index}')
+        client = app.test_client()
+        client.post('/login', data={'username': usernames[index % len(usernames)], 'password': PASSWORD})
+        count = requests // concurrency + (1 if index < requests % concurrency else 0)
+        latencies = []
+        errors = 0
+        for _ in range(count):
+            start = time.perf_counter()
+            response = make_request(scenario, client, rng, image_ids, sizes)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+            # /save_drawing reports failures in the body
+            if response.status_code >= 400 or (response.is_json and response.get_json().get('success') is False):
+                errors += 1
+            response.close()
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for worker_latencies, _ in results for latency in worker_latencies)
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'duration_s': round(elapsed, 4),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 50), 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 3) if latencies else None,
+        'max_ms': round(latencies[-1], 3) if latencies else None,
+    }
+
+def run_benchmark(users=4, images=100, sizes=((16, 8), (32, 16), (64, 32), (128, 64)), requests=200,
+                  concurrency=4, scenarios=SCENARIOS, seed_value=0, config=None):
+    """
+    Runs the benchmark against a new application in a temporary directory.
+
+    Args:
+        users: Number of users to seed.
+        images: Number of images to seed.
+        sizes: Image sizes to cycle through when seeding and posting.
+        requests: Requests per scenario.
+        concurrency: Concurrent clients per scenario.
+        scenarios: Names from SCENARIOS, run in order.
+        seed_value: Seed for the random image content and image choice.
+        config: Optional extra application config, e.g. {'STORAGE_FORMAT': 'raw'}.
+
+    Returns:
+        JSON-serializable dictionary with the settings, environment and one
+        result per scenario.
+    """
+    unknown = [scenario for scenario in scenarios if scenario not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(unknown)}")
+
+    work_dir = tempfile.mkdtemp(prefix='fpac-bench-')
+    app = create_app({
+        'TESTING': True,
+        # A file database, so SQLite locking behaves as in production
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(work_dir, 'bench.db'),
+        'UPLOAD_FOLDER': os.path.join(work_dir, 'uploads'),
+        **(config or {})
+    })
+    try:
+        rng = random.Random(seed_value)
+        seed_started = time.perf_counter()
+        usernames, image_ids = seed(app, users, images, list(sizes), rng)
+        seed_duration = time.perf_counter() - seed_started
+
+        results = {}
+        for scenario in scenarios:
+            results[scenario] = run_scenario(app, scenario, requests, concurrency, usernames, image_ids,
+                                             list(sizes), seed_value)
+            results[scenario]['peak_rss_bytes'] = peak_rss_bytes()
+    finally:
+        if app.executor:
+            app.executor.shutdown(wait=True)
+        if app.render_pool:
+            app.render_pool.shutdown(wait=True)
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'settings': {
+            'users': users,
+            'images': images,
+            'sizes': [f'{width}x{height}' for width, height in sizes],
+            'requests': requests,
+            'concurrency': concurrency,
+            'seed': seed_value,
+            'config': config or {},
+        },
+        'seed_duration_s': round(seed_duration, 4),
+        'results': results,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the device-facing API.')
+    parser.add_argument('--users', type=int, default=4, help='users to seed')
+    parser.add_argument('--images', type=int, default=100, help='images to seed')
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('16x8,32x16,64x32,128x64'),
+                        help='comma separated image sizes, e.g. 32x16,64x32')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent clients')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma separated scenarios to run ({', '.join(SCENARIOS)})")
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--storage-format', choices=('bmp', 'raw'), default='bmp')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(
+        users=args.users,
+        images=args.images,
+        sizes=args.sizes,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        scenarios=[scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()],
+        seed_value=args.seed,
+        config={'STORAGE_FORMAT': args.storage_format}
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -1,67 +1,819 @@
-import functools
-from flask import Blueprint, url_for, current_app, redirect
-from models import Image
+import base64
+import binascii
+import hashlib
+import json
+import zipfile
+from datetime import datetime
+from flask import Blueprint, url_for, current_app, redirect, request, make_response, send_file, Response
+from flask_login import login_required, current_user
+from werkzeug.security import safe_join
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import joinedload
+from extensions import db
+from models import Image, ImageVersion, ImageVariant, LibraryRevision
+from packing import (PIXEL_FORMATS, BYTES_PER_PIXEL, pack_pixels, pack_header, pack_stream_header,
+                     frame_interval_ms, encode_delta_runs, pack_delta, pack_animation_header)
+from processing import display_options, display_settings, process_pixels
+from palette import palettize, expand_palette, run_lengths
+from previews import PREVIEW_FORMATS, render_preview
+from storage import is_raw_file, map_raw_file, read_raw_header
+from utils import (render_scroll_frames, delete_image_artifact, ensure_bmp_file, ensure_raw_file,
+                   build_display_variants, import_image_batch, build_variants_task, file_fingerprint)
 import os
 from PIL import Image as PILImage
 
 api_bp = Blueprint('api', __name__)
 
-@functools.lru_cache(maxsize=128)
-def load_image_data(filepath, mtime):
+def not_modified(etag):
     """
-    Load image data from disk and return width, height, and pixel data.
-    This function is cached based on filepath and mtime.
+    Returns an empty 304 response if the client already holds the given ETag,
+    otherwise None.
     """
-    image = PILImage.open(filepath)
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
+    if request.if_none_match.contains(etag):
+        return set_cache_headers(current_app.response_class(status=304), etag)
+    return None
 
-    # Force loading of image data
-    image.load()
+def not_ready(img):
+    """
+    Returns a 409 error response if img's file is not available yet, otherwise None.
+    """
+    if img.status != 'ready':
+        return {'error': 'Image is not ready', 'status': img.status}, 409
+    return None
+
+def set_cache_headers(response, etag):
+    """
+    Attaches the ETag and a Cache-Control policy that makes clients revalidate.
+    """
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['API_CACHE_MAX_AGE']
+    response.cache_control.must_revalidate = True
+    return response
+
+def first_frame(width, height, payload, frame_height, bytes_per_pixel=3):
+    """
+    Returns (width, frame_height, payload) for the first frame of a frame strip
+    without copying, or the arguments unchanged for single-frame images.
+    """
+    if frame_height is None or frame_height >= height:
+        return width, height, payload
+    return width, frame_height, memoryview(payload)[:width * frame_height * bytes_per_pixel]
+
+def load_cached_pixels(filepath, mtime):
+    """
+    Load the cached form of an image file and return width, height, palette and pixels.
+
+    Uncompressed raw files are mapped rather than copied, so their pages live in
+    the shared page cache instead of this worker's heap; palette is then None
+    and pixels are packed RGB888. Other files are decoded once and, when they
+    use at most 256 colours (as pixel art usually does), kept as a palette of
+    packed RGB888 colours plus one index byte per pixel, a third of the size.
+    Results are kept in the application's pixel cache, keyed on filepath and mtime.
+    """
+    def load():
+        if is_raw_file(filepath):
+            width, height, rgb = map_raw_file(filepath)
+            if isinstance(rgb, memoryview):
+                return (width, height, None, rgb), len(rgb)
+        else:
+            with PILImage.open(filepath) as image:
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                width, height, rgb = image.width, image.height, image.tobytes()
+        indexed = palettize(rgb)
+        if indexed is None:
+            return (width, height, None, rgb), len(rgb)
+        palette, indices = indexed
+        return (width, height, palette, indices), len(palette) + len(indices)
+
+    return current_app.pixel_cache.get_or_load((filepath, mtime), load)
+
+def load_image_data(filepath, mtime, frame_height=None):
+    """
+    Return width, height, and packed RGB888 bytes of an image file, see
+    load_cached_pixels().
+
+    Animated images are stored as a strip of frames; with frame_height only the
+    first frame is returned.
+    """
+    width, height, palette, pixels = load_cached_pixels(filepath, mtime)
+    if palette is None:
+        return first_frame(width, height, pixels, frame_height)
+    width, height, indices = first_frame(width, height, pixels, frame_height, 1)
+    return width, height, expand_palette(palette, indices)
+
+def load_palette_image(filepath, mtime, frame_height=None):
+    """
+    Return width, height, palette and index bytes of an image file, or None if
+    it uses more than 256 colours. Files whose cached form is RGB888 are
+    converted once and the result is cached separately.
+    """
+    width, height, palette, pixels = load_cached_pixels(filepath, mtime)
+    if palette is None:
+        def load():
+            indexed = palettize(pixels)
+            if indexed is None:
+                return (None,), 1
+            return indexed, len(indexed[0]) + len(indexed[1])
+
+        indexed = current_app.pixel_cache.get_or_load((filepath, mtime, 'palette'), load)
+        if indexed[0] is None:
+            return None
+        palette, pixels = indexed
+    width, height, indices = first_frame(width, height, pixels, frame_height, 1)
+    return width, height, palette, indices
+
+def load_packed_image(filepath, mtime, pixel_format, frame_height=None):
+    """
+    Return width, height, and pixel bytes packed in the given format.
+    This function is cached based on filepath, mtime and pixel format.
+
+    The whole frame strip is packed and cached once; with frame_height only
+    the first frame is returned.
+    """
+    def load():
+        width, height, rgb = load_image_data(filepath, mtime)
+        if pixel_format == 'rgb888':
+            payload = rgb
+        else:
+            payload = pack_pixels(PILImage.frombytes('RGB', (width, height), rgb), pixel_format)
+        return (width, height, payload), len(payload)
+
+    width, height, payload = current_app.pixel_cache.get_or_load((filepath, mtime, 'packed', pixel_format), load)
+    return first_frame(width, height, payload, frame_height, BYTES_PER_PIXEL[pixel_format])
+
+def load_display_image(filepath, mtime, display_config, scroll_direction, scroll_speed, pixel_format,
+                       frame_height=None):
+    """
+    Return width, height, and pixel bytes processed for a display (see
+    processing.process_pixels()) and packed in the given format.
+    This function is cached based on filepath, mtime, display settings, scroll settings and pixel format.
+    """
+    def load():
+        width, height, rgb = load_image_data(filepath, mtime, frame_height)
+        width, height, rgb = process_pixels(width, height, rgb, display_config, scroll_direction, scroll_speed)
+        if pixel_format == 'rgb888':
+            payload = rgb
+        else:
+            payload = pack_pixels(PILImage.frombytes('RGB', (width, height), rgb), pixel_format)
+        return (width, height, payload), len(payload)
+
+    key = (filepath, mtime, 'display', display_config['name'], display_config['width'], display_config['height'],
+           display_options(display_config), scroll_direction, scroll_speed, pixel_format, frame_height)
+    return current_app.pixel_cache.get_or_load(key, load)
+
+def find_display_variant(img, display_config):
+    """
+    Returns the up-to-date ImageVariant of img for a display. Variants that are
+    missing (e.g. for a display added later) or stale are rendered on demand.
+    """
+    settings = display_settings(display_config)
+    variant = ImageVariant.query.filter_by(image_id=img.id, display_name=display_config['name']).first()
+    if variant is not None and variant.version == img.version and variant.settings == settings:
+        return variant
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    filepath = os.path.join(upload_folder, img.filename)
+    width, height, rgb = load_image_data(filepath, os.path.getmtime(filepath), img.height)
+    try:
+        return build_display_variants(img, width, height, rgb, [display_config], upload_folder)[0]
+    except IntegrityError:
+        # Another request stored the variant first
+        db.session.rollback()
+        return ImageVariant.query.filter_by(image_id=img.id, display_name=display_config['name']).one()
+
+def load_scroll_frames(filepath, mtime, display_config, scroll_direction, pixel_format, frame_height=None):
+    """
+    Return frame count and the concatenated packed frames for a scrolling image.
+    This function is cached based on filepath, mtime, display, direction and pixel format.
+    """
+    def load():
+        width, height, rgb = load_image_data(filepath, mtime, frame_height)
+        frames = render_scroll_frames(PILImage.frombytes('RGB', (width, height), rgb), display_config, scroll_direction)
+        payload = b''.join(pack_pixels(frame, pixel_format) for frame in frames)
+        return (len(frames), payload), len(payload)
+
+    key = (filepath, mtime, 'frames', display_config['name'], display_config['width'],
+           display_config['height'], scroll_direction, pixel_format, frame_height)
+    return current_app.pixel_cache.get_or_load(key, load)
+
+def load_image_delta(img, since, filepath, mtime):
+    """
+    Return the delta update that brings a display from version since to img's
+    current version, falling back to a full frame when the old buffer is gone
+    or had other dimensions.
+    This function is cached based on filepath, mtime, image id and both versions.
+    """
+    previous = None
+    if since < img.version:
+        previous = ImageVersion.query.filter_by(image_id=img.id, version=since).first()
+
+    def load():
+        width, height, rgb = load_image_data(filepath, mtime, img.height)
+        records = None
+        if since == img.version:
+            records = b''
+        elif previous is not None and (previous.width, previous.height) == (width, height):
+            old_path = os.path.join(current_app.config['UPLOAD_FOLDER'], previous.filename)
+            if os.path.exists(old_path):
+                _, _, old_rgb = load_image_data(old_path, os.path.getmtime(old_path), previous.height)
+                records = encode_delta_runs(old_rgb, rgb, width)
+        payload = pack_delta(since, img.version, width, height, rgb, records)
+        return payload, len(payload)
 
-    pixels = list(image.getdata())
-    return image.width, image.height, pixels
+    return current_app.pixel_cache.get_or_load((filepath, mtime, 'delta', img.id, since, img.version), load)
+
+def read_import_items(files, max_item_bytes, max_items, max_total_bytes):
+    """
+    Collects the images of a bulk import from uploaded files. Zip archives are
+    expanded; directories and hidden entries inside them are skipped.
+
+    Returns:
+        List of (name, bytes) tuples, with an exception instead of bytes for
+        entries that were rejected.
+
+    Raises:
+        ValueError: If there are more than max_items images, or together they
+            are larger than max_total_bytes. Zip entries are checked before
+            they are inflated.
+    """
+    items = []
+    total = 0
+
+    def check(size):
+        # Called before each item is read, with the number of bytes it will take
+        nonlocal total
+        total += size
+        if len(items) >= max_items:
+            raise ValueError(f'At most {max_items} images per import')
+        if total > max_total_bytes:
+            raise ValueError(f'Images are larger than {max_total_bytes} bytes together')
+
+    for file in files:
+        if not file.filename.lower().endswith('.zip'):
+            data = file.read(max_item_bytes + 1)
+            if len(data) > max_item_bytes:
+                data = ValueError(f'File is larger than {max_item_bytes} bytes')
+            check(0 if isinstance(data, Exception) else len(data))
+            items.append((file.filename, data))
+            continue
+        try:
+            archive = zipfile.ZipFile(file.stream)
+        except zipfile.BadZipFile as e:
+            check(0)
+            items.append((file.filename, e))
+            continue
+        with archive:
+            for info in archive.infolist():
+                basename = os.path.basename(info.filename)
+                if info.is_dir() or not basename or basename.startswith('.') or info.filename.startswith('__MACOSX/'):
+                    continue
+                # Checked against the declared size so zip bombs are never inflated;
+                # zipfile stops inflating an entry at its declared size
+                if info.file_size > max_item_bytes:
+                    check(0)
+                    items.append((info.filename, ValueError(f'File is larger than {max_item_bytes} bytes')))
+                    continue
+                check(info.file_size)
+                try:
+                    items.append((info.filename, archive.read(info)))
+                except (zipfile.BadZipFile, OSError) as e:
+                    items.append((info.filename, e))
+    return items
+
+def find_display(name):
+    """
+    Returns the configuration of the display called name, or None.
+    """
+    for display in current_app.config.get('DISPLAYS', []):
+        if display.get('name') == name:
+            return display
+    return None
+
+# Fields a client can request from /api/images, in output order
+LIST_FIELDS = {
+    'id': lambda img, urls: img.id,
+    'filename': lambda img, urls: img.filename,
+    'width': lambda img, urls: img.width,
+    'height': lambda img, urls: img.height,
+    'url': lambda img, urls: urls['download'] + str(img.id) if is_raw_file(img.filename) else file_url(img.filename, urls),
+    'display_name': lambda img, urls: img.display_name,
+    'scroll_direction': lambda img, urls: img.scroll_direction,
+    'scroll_speed': lambda img, urls: img.scroll_speed,
+    'version': lambda img, urls: img.version,
+    'preview_url': lambda img, urls: urls['preview'] % img.id,
+    'username': lambda img, urls: img.author.username if img.author else 'Unknown',
+}
+
+def file_url(filename, urls):
+    """
+    Returns the fingerprinted /api/files/ URL of a stored file, see api_get_file().
+    """
+    return f"{urls['files']}{file_fingerprint(filename, current_app.config['UPLOAD_FOLDER'])}/{filename}"
+
+def parse_fields(value):
+    """
+    Parses a comma separated fields= argument. All fields are returned if empty.
+    """
+    if not value:
+        return tuple(LIST_FIELDS)
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    unknown = [field for field in fields if field not in LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def encode_cursor(img):
+    """
+    Returns an opaque cursor pointing just after img in (created_at, id) order.
+    """
+    raw = f"{img.created_at.isoformat()}|{img.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor produced by encode_cursor into a (created_at, id) tuple.
+    """
+    if not cursor:
+        return None
+    try:
+        created_at, image_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(image_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+def serialize_image(img, fields, urls=None):
+    """
+    Builds the listing entry for img restricted to the requested fields.
+    """
+    return {field: LIST_FIELDS[field](img, urls) for field in fields}
 
 @api_bp.route('/images')
 def api_list_images():
-    images = Image.query.all()
-    image_list = []
-    for img in images:
-        image_list.append({
-            'id': img.id,
-            'filename': img.filename,
-            'width': img.width,
-            'height': img.height,
-            'url': url_for('static', filename='uploads/' + img.filename, _external=True),
-            'display_name': img.display_name,
-            'scroll_direction': img.scroll_direction,
-            'scroll_speed': img.scroll_speed,
-            'username': img.author.username if img.author else 'Unknown'
-        })
-    return {'images': image_list}
+    # The revision is bumped on every image insert, update and delete
+    etag = hashlib.sha1(repr((LibraryRevision.current(), request.url)).encode('utf-8')).hexdigest()
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    try:
+        limit = int(request.args.get('limit', current_app.config['API_PAGE_SIZE']))
+        fields = parse_fields(request.args.get('fields'))
+        cursor = decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    limit = max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+    query = Image.query.filter(Image.status == 'ready')
+    if 'username' in fields:
+        # Load authors in the same SELECT instead of one lazy load per row
+        query = query.options(joinedload(Image.author))
+    user_id = request.args.get('user_id', type=int)
+    if user_id is not None:
+        query = query.filter(Image.user_id == user_id)
+    display_name = request.args.get('display_name')
+    if display_name is not None:
+        query = query.filter(Image.display_name == display_name)
+    if cursor is not None:
+        # ix_image_status_created_at_id orders by (status, created_at, id),
+        # so with the status filter above this is a range scan.
+        query = query.filter(tuple_(Image.created_at, Image.id) > cursor)
+
+    # Fetch one extra row to find out whether there is a next page
+    images = query.order_by(Image.created_at, Image.id).limit(limit + 1).all()
+    next_cursor = encode_cursor(images[limit - 1]) if len(images) > limit else None
+
+    urls = None
+    if 'url' in fields or 'preview_url' in fields:
+        # Resolve URL prefixes once per request rather than once per row
+        preview = url_for('api.api_get_image_preview', image_id=0, _external=True)
+        urls = {
+            'files': url_for('api.api_get_file', fingerprint='-', filename='-', _external=True)[:-3],
+            'download': url_for('api.api_download_image', image_id=0, _external=True)[:-1],
+            'preview': '/%d/'.join(preview.rsplit('/0/', 1)),
+        }
+    image_list = [serialize_image(img, fields, urls) for img in images[:limit]]
+    return set_cache_headers(make_response({'images': image_list, 'next_cursor': next_cursor}), etag)
+
+@api_bp.route('/changes')
+def api_get_changes():
+    feed = current_app.change_feed
+    # Without since, wait for the next change after now
+    since = request.args.get('since', feed.last_id, type=int)
+    max_timeout = current_app.config['CHANGE_FEED_TIMEOUT']
+    timeout = max(0, min(request.args.get('timeout', max_timeout, type=float), max_timeout))
+
+    changes, last_id, reset = feed.wait(since, timeout, request.args.get('display_name'))
+    return {'changes': changes, 'last_id': last_id, 'reset': reset}
+
+@api_bp.route('/changes/stream')
+def api_stream_changes():
+    feed = current_app.change_feed
+    display_name = request.args.get('display_name')
+    keepalive = current_app.config['CHANGE_FEED_KEEPALIVE']
+    # Browsers send Last-Event-ID when they reconnect
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', feed.last_id, type=int)
+
+    def stream():
+        last_id = since
+        while True:
+            changes, last_id, reset = feed.wait(last_id, keepalive, display_name)
+            if reset:
+                yield f"id: {last_id}\nevent: reset\ndata: {{}}\n\n"
+            for change in changes:
+                yield f"id: {change['id']}\nevent: {change['type']}\ndata: {json.dumps(change)}\n\n"
+            if not changes and not reset:
+                # Comment line: keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_bp.route('/images/import', methods=['POST'])
+@login_required
+def api_import_images():
+    # Batches may be larger than a single upload; must be set before the body is read
+    request.max_content_length = current_app.config['IMPORT_MAX_CONTENT_LENGTH']
+
+    display_name = request.form.get('display_name')
+    display_config = None
+    if display_name:
+        display_config = find_display(display_name)
+        if display_config is None:
+            return {'error': f'Unknown display: {display_name}'}, 400
+
+    try:
+        items = read_import_items(request.files.getlist('files'), current_app.config['MAX_CONTENT_LENGTH'],
+                                  current_app.config['IMPORT_MAX_ITEMS'], current_app.config['IMPORT_MAX_TOTAL_BYTES'])
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    if not items:
+        return {'error': 'No images to import'}, 400
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    try:
+        report, imported = import_image_batch(
+            items,
+            user_id=current_user.id,
+            upload_folder=upload_folder,
+            metadata={
+                'display_name': display_name or None,
+                'scroll_direction': request.form.get('scroll_direction', 'none'),
+                'scroll_speed': request.form.get('scroll_speed', 0, type=int)
+            },
+            display_config=display_config,
+            max_pixels=current_app.config['UPLOAD_MAX_PIXELS'],
+            storage_format=current_app.config['STORAGE_FORMAT'],
+            compress=current_app.config['STORAGE_COMPRESS'],
+            executor=current_app.executor,
+            render_pool=current_app.render_pool,
+            max_frames=current_app.config['ANIMATION_MAX_FRAMES'],
+            chunk_size=current_app.config['IMPORT_CHUNK_SIZE']
+        )
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Database error during import: {e}")
+        return {'error': 'Database error'}, 500
+
+    # Bulk inserts bypass the session, so announce the new images here
+    for image_id, _, _, _ in imported:
+        current_app.change_feed.publish('created', image_id, display_name=display_name or None,
+                                        status='ready', version=1)
+
+    displays = current_app.config.get('DISPLAYS', [])
+    if imported and displays:
+        app = current_app._get_current_object()
+        if current_app.executor:
+            current_app.executor.submit(build_variants_task, app, imported, displays, upload_folder,
+                                        current_app.render_pool)
+        else:
+            build_variants_task(app, imported, displays, upload_folder, current_app.render_pool)
+
+    return {
+        'imported': len(imported),
+        'failed': len(report) - len(imported),
+        'items': report
+    }
+
+@api_bp.route('/image/<int:image_id>/status')
+def api_get_image_status(image_id):
+    img = Image.query.get_or_404(image_id)
+    return {'id': img.id, 'status': img.status, 'version': img.version}
+
+@api_bp.route('/image/<int:image_id>', methods=['DELETE'])
+@login_required
+def api_delete_image(image_id):
+    img = Image.query.get_or_404(image_id)
+    if img.user_id != current_user.id:
+        return {'error': 'Forbidden'}, 403
+    delete_image_artifact(img, current_app.config['UPLOAD_FOLDER'], cache=current_app.pixel_cache)
+    return {'success': True}
 
 @api_bp.route('/download/<int:image_id>')
 def api_download_image(image_id):
     img = Image.query.get_or_404(image_id)
-    return redirect(url_for('static', filename='uploads/' + img.filename))
+    filename = img.filename
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    if is_raw_file(filename):
+        try:
+            bmp_path = ensure_bmp_file(os.path.join(upload_folder, filename))
+        except Exception as e:
+            return {'error': str(e)}, 500
+        filename = os.path.relpath(bmp_path, upload_folder).replace(os.sep, '/')
+    return redirect(url_for('api.api_get_file', fingerprint=file_fingerprint(filename, upload_folder),
+                            filename=filename))
+
+@api_bp.route('/files/<fingerprint>/<path:filename>')
+def api_get_file(fingerprint, filename):
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    filepath = safe_join(upload_folder, filename)
+    if filepath is None or not os.path.isfile(filepath):
+        return {'error': 'Not found'}, 404
+
+    # A stale fingerprint means the file changed since the URL was handed out
+    current = file_fingerprint(filename, upload_folder)
+    if fingerprint != current:
+        return redirect(url_for('api.api_get_file', fingerprint=current, filename=filename))
+
+    # The URL changes whenever the content does, so clients never need to
+    # revalidate. send_file hands the file to the WSGI server (sendfile() or
+    # X-Sendfile) and answers Range requests.
+    response = send_file(filepath, conditional=True, etag=current)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['ASSET_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
 
 @api_bp.route('/image/<int:image_id>/rgb')
 def api_get_image_rgb(image_id):
     img = Image.query.get_or_404(image_id)
+    error = not_ready(img)
+    if error is not None:
+        return error
+
+    # ?display= serves the variant rendered for that display
+    display_name = request.args.get('display')
+    display_config = None
+    if display_name is not None:
+        display_config = find_display(display_name)
+        if display_config is None:
+            return {'error': f'Unknown display: {display_name}'}, 400
+    # ?format=palette returns a palette and one index per pixel, ?rle=1 run-length encodes the indices
+    pixel_format = request.args.get('format', 'rgb').lower()
+    if pixel_format not in ('rgb', 'palette'):
+        return {'error': f'Unknown format: {pixel_format}'}, 400
+    rle = request.args.get('rle', '0').lower() in ('1', 'true')
     filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], img.filename)
 
     try:
+        if display_config is not None:
+            variant = find_display_variant(img, display_config)
+            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], variant.filename)
         mtime = os.path.getmtime(filepath)
-        width, height, pixels = load_image_data(filepath, mtime)
+        etag = img.etag(mtime, 'rgb', filepath, pixel_format, rle)
+        response = not_modified(etag)
+        if response is not None:
+            return response
 
-        return {
-            'width': width,
-            'height': height,
-            'display_name': img.display_name,
+        data = {
+            'display_name': display_name or img.display_name,
             # Return scrolling configuration for display client
             'scroll_direction': img.scroll_direction,
             'scroll_speed': img.scroll_speed,
-            'pixels': pixels
+            # Animated images: the pixels are those of the first frame
+            'frame_count': img.frame_count,
+            'frame_durations': img.frame_durations,
         }
+        frame_height = None if display_config else img.height
+        indexed = load_palette_image(filepath, mtime, frame_height) if pixel_format == 'palette' else None
+        if indexed is not None:
+            width, height, palette, indices = indexed
+            data['format'] = 'palette'
+            data['palette'] = list(zip(*[iter(palette)] * 3))
+            if rle:
+                data['runs'] = run_lengths(indices)
+            else:
+                data['indices'] = list(indices)
+        else:
+            # Images with more than 256 colours fall back to plain pixels
+            width, height, rgb = load_image_data(filepath, mtime, frame_height)
+            data['format'] = 'rgb'
+            # Group the flat buffer into (r, g, b) triples without a Python-level loop
+            data['pixels'] = list(zip(*[iter(rgb)] * 3))
+
+        response = make_response({'width': width, 'height': height, **data})
+        return set_cache_headers(response, etag)
     except Exception as e:
         return {'error': str(e)}, 500
+
+@api_bp.route('/image/<int:image_id>/packed')
+def api_get_image_packed(image_id):
+    pixel_format = request.args.get('format', 'rgb888').lower()
+    if pixel_format not in PIXEL_FORMATS:
+        return {'error': f'Unknown format: {pixel_format}'}, 400
+
+    img = Image.query.get_or_404(image_id)
+    error = not_ready(img)
+    if error is not None:
+        return error
+
+    # ?display= runs the pixels through that display's processing pipeline
+    display_name = request.args.get('display')
+    display_config = None
+    if display_name is not None:
+        display_config = find_display(display_name)
+        if display_config is None:
+            return {'error': f'Unknown display: {display_name}'}, 400
+        try:
+            options = display_options(display_config)
+        except ValueError as e:
+            return {'error': f'Invalid settings for display {display_name}: {e}'}, 500
+
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], img.filename)
+
+    try:
+        mtime = os.path.getmtime(filepath)
+        if display_config is None:
+            etag = img.etag(mtime, 'packed', pixel_format)
+        else:
+            etag = img.etag(mtime, 'packed', pixel_format, display_name, display_config['width'],
+                            display_config['height'], options)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        if display_config is None:
+            width, height, payload = load_packed_image(filepath, mtime, pixel_format, img.height)
+        else:
+            width, height, payload = load_display_image(filepath, mtime, display_config, img.scroll_direction,
+                                                        img.scroll_speed, pixel_format, img.height)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+    header = pack_header(width, height, pixel_format, img.scroll_direction, img.scroll_speed)
+    response = current_app.response_class(header + payload, mimetype='application/octet-stream')
+    return set_cache_headers(response, etag)
+
+@api_bp.route('/image/<int:image_id>/delta')
+def api_get_image_delta(image_id):
+    img = Image.query.get_or_404(image_id)
+    error = not_ready(img)
+    if error is not None:
+        return error
+    since = request.args.get('since', type=int)
+    if since is None or not 1 <= since <= img.version:
+        return {'error': f'since must be a version between 1 and {img.version}'}, 400
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], img.filename)
+
+    try:
+        mtime = os.path.getmtime(filepath)
+        etag = img.etag(mtime, 'delta', since)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        payload = load_image_delta(img, since, filepath, mtime)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+    response = current_app.response_class(payload, mimetype='application/octet-stream')
+    response.headers['X-Image-Version'] = str(img.version)
+    return set_cache_headers(response, etag)
+
+@api_bp.route('/image/<int:image_id>/frames')
+def api_get_image_frames(image_id):
+    pixel_format = request.args.get('format', 'rgb888').lower()
+    if pixel_format not in PIXEL_FORMATS:
+        return {'error': f'Unknown format: {pixel_format}'}, 400
+
+    img = Image.query.get_or_404(image_id)
+    error = not_ready(img)
+    if error is not None:
+        return error
+    display_name = request.args.get('display', img.display_name)
+    display_config = find_display(display_name)
+    if display_config is None:
+        return {'error': f'Unknown display: {display_name}'}, 400
+
+    scroll_direction = img.scroll_direction if img.scroll_speed else 'none'
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], img.filename)
+
+    try:
+        mtime = os.path.getmtime(filepath)
+        etag = img.etag(mtime, 'frames', display_name, display_config['width'], display_config['height'], pixel_format)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        frame_count, payload = load_scroll_frames(filepath, mtime, display_config, scroll_direction, pixel_format,
+                                                  img.height)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+    interval = frame_interval_ms(img.scroll_speed) if frame_count > 1 else 0
+    header = pack_stream_header(display_config['width'], display_config['height'], frame_count, interval, pixel_format)
+    response = current_app.response_class(header + payload, mimetype='application/octet-stream')
+    return set_cache_headers(response, etag)
+
+@api_bp.route('/image/<int:image_id>/animation')
+def api_get_image_animation(image_id):
+    pixel_format = request.args.get('format', 'rgb888').lower()
+    if pixel_format not in PIXEL_FORMATS:
+        return {'error': f'Unknown format: {pixel_format}'}, 400
+
+    img = Image.query.get_or_404(image_id)
+    error = not_ready(img)
+    if error is not None:
+        return error
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], img.filename)
+
+    try:
+        mtime = os.path.getmtime(filepath)
+        etag = img.etag(mtime, 'animation', pixel_format)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        # The strip is packed once and cached; frames follow each other in it
+        _, _, payload = load_packed_image(filepath, mtime, pixel_format)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+    durations = img.frame_durations or [0]
+    header = pack_animation_header(img.width, img.height, durations, pixel_format)
+    response = current_app.response_class(header + payload, mimetype='application/octet-stream')
+    return set_cache_headers(response, etag)
+
+@api_bp.route('/image/<int:image_id>/preview')
+def api_get_image_preview(image_id):
+    size = request.args.get('size', current_app.config['PREVIEW_SIZE'], type=int)
+    if size not in current_app.config['PREVIEW_SIZES']:
+        return {'error': f"size must be one of {', '.join(map(str, current_app.config['PREVIEW_SIZES']))}"}, 400
+    preview_format = request.args.get('format', current_app.config['PREVIEW_FORMAT']).lower()
+    if preview_format not in PREVIEW_FORMATS:
+        return {'error': f'Unknown format: {preview_format}'}, 400
+
+    img = Image.query.get_or_404(image_id)
+    error = not_ready(img)
+    if error is not None:
+        return error
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], img.filename)
+    pil_format, mimetype, options = PREVIEW_FORMATS[preview_format]
+
+    try:
+        mtime = os.path.getmtime(filepath)
+        etag = img.etag(mtime, 'preview', size, preview_format)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        # Named after the pixels rather than the image, so identical images share a preview
+        key = hashlib.sha1(repr((img.filename, mtime, img.height)).encode('utf-8')).hexdigest()
+        name = f"{key}-{size}.{preview_format}"
+
+        def render():
+            width, height, rgb = load_image_data(filepath, mtime, img.height)
+            return render_preview(width, height, rgb, size)
+
+        preview_path = current_app.preview_cache.get_or_create(name, render, pil_format, options)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+    response = send_file(preview_path, mimetype=mimetype, etag=etag, conditional=True)
+    return set_cache_headers(response, etag)
+
+@api_bp.route('/image/<int:image_id>/raw')
+def api_get_image_raw(image_id):
+    img = Image.query.get_or_404(image_id)
+    error = not_ready(img)
+    if error is not None:
+        return error
+
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], img.filename)
+
+    try:
+        mtime = os.path.getmtime(filepath)
+        etag = img.etag(mtime, 'raw')
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        raw_path = ensure_raw_file(filepath)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+    # send_file hands the open file to the WSGI server, which can use sendfile()
+    # (or X-Sendfile with USE_X_SENDFILE), and answers Range requests itself.
+    _, width, height = read_raw_header(raw_path)
+    response = send_file(raw_path, mimetype='application/octet-stream', etag=etag, conditional=True)
+    response.headers['X-Image-Width'] = str(width)
+    response.headers['X-Image-Height'] = str(height)
+    response.headers['X-Frame-Count'] = str(img.frame_count or 1)
+    response.headers['X-Scroll-Direction'] = img.scroll_direction or 'none'
+    response.headers['X-Scroll-Speed'] = str(img.scroll_speed or 0)
+    return set_cache_headers(response, etag)
@@ -1,54 +1,107 @@
 import base64
 import io
-from flask import Blueprint, render_template, request, current_app, redirect, url_for, flash
+from flask import Blueprint, render_template, request, current_app, redirect, url_for, flash, abort
 from flask_login import login_required, current_user
 from PIL import Image as PILImage
 from PIL import UnidentifiedImageError
 from sqlalchemy.exc import SQLAlchemyError
-from utils import save_image_artifact, resize_image_to_display
+from extensions import db
+from models import Image
+from utils import (save_image_artifact, resize_image_to_display, open_upload_image, open_pixel_upload, read_frames,
+                   frame_strip, check_dimensions)
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 def index():
-    return render_template('index.html', displays=current_app.config.get('DISPLAYS', []))
+    return render_template('index.html', displays=current_app.config.get('DISPLAYS', []),
+                           preview_size=current_app.config['PREVIEW_SIZE'])
 
 @main_bp.route('/draw')
 @login_required
 def draw():
-    return render_template('draw.html', displays=current_app.config.get('DISPLAYS', []))
+    # ?image_id= opens one of the user's drawings for editing
+    edit_image = None
+    image_id = request.args.get('image_id', type=int)
+    if image_id is not None:
+        img = Image.query.get_or_404(image_id)
+        if img.user_id != current_user.id:
+            abort(403)
+        edit_image = {
+            'id': img.id,
+            'display_name': img.display_name,
+            'scroll_direction': img.scroll_direction,
+            'scroll_speed': img.scroll_speed,
+            'rgb_url': url_for('api.api_get_image_rgb', image_id=img.id)
+        }
+    return render_template('draw.html', displays=current_app.config.get('DISPLAYS', []), edit_image=edit_image)
 
 @main_bp.route('/save_drawing', methods=['POST'])
 @login_required
 def save_drawing():
-    data = request.get_json()
-    image_data = data['image']
-    display_name = data.get('display_name')
-    scroll_direction = data.get('scroll_direction', 'none')
-    scroll_speed = data.get('scroll_speed', 0)
+    # The editor sends its pixel grid as a raw pixel body with the fields in
+    # the query string; the JSON body with a PNG data URL is still accepted.
+    raw_upload = request.mimetype == 'application/octet-stream'
+    if raw_upload:
+        data = request.args.to_dict()
+        data['scroll_speed'] = request.args.get('scroll_speed', type=int)
+        data['image_id'] = request.args.get('image_id', type=int)
+        data = {key: value for key, value in data.items() if value is not None}
+    else:
+        data = request.get_json()
+    # Only the fields sent are applied, so an edit keeps the others
+    metadata = {key: data[key] for key in ('display_name', 'scroll_direction', 'scroll_speed') if key in data}
+    image_id = data.get('image_id')
 
-    # Remove header of data URL
-    image_data = image_data.replace('data:image/png;base64,', '')
-    image_bytes = base64.b64decode(image_data)
+    # With an image_id the drawing is saved as a new version of that image
+    existing = None
+    if image_id is not None:
+        existing = db.session.get(Image, image_id)
+        if existing is None:
+            return {'success': False, 'error': 'Image not found'}, 404
+        if existing.user_id != current_user.id:
+            return {'success': False, 'error': 'Forbidden'}, 403
 
-    # Save as BMP
     try:
-        image = PILImage.open(io.BytesIO(image_bytes))
+        if raw_upload:
+            try:
+                image = open_pixel_upload(request.get_data(), current_app.config['UPLOAD_MAX_PIXELS'])
+            except ValueError as e:
+                return {'success': False, 'error': str(e)}, 400
+        else:
+            # Remove header of data URL
+            image_data = data['image'].replace('data:image/png;base64,', '')
+            image_bytes = base64.b64decode(image_data)
+            image = PILImage.open(io.BytesIO(image_bytes))
+            # Only the header has been read so far
+            if image.width * image.height > current_app.config['UPLOAD_MAX_PIXELS']:
+                return {'success': False, 'error': 'Image is too large'}, 400
+            try:
+                check_dimensions(image.width, image.height)
+            except ValueError as e:
+                return {'success': False, 'error': str(e)}, 400
 
-        save_image_artifact(
+        version_before = existing.version if existing is not None else None
+        db_image = save_image_artifact(
             pil_image=image,
             user_id=current_user.id,
             upload_folder=current_app.config['UPLOAD_FOLDER'],
-            filename_prefix="drawing_",
-            metadata={
-                'display_name': display_name,
-                'scroll_direction': scroll_direction,
-                'scroll_speed': scroll_speed
-            },
-            executor=current_app.executor
+            metadata=metadata,
+            executor=current_app.executor,
+            cache=current_app.pixel_cache,
+            storage_format=current_app.config['STORAGE_FORMAT'],
+            compress=current_app.config['STORAGE_COMPRESS'],
+            image=existing,
+            displays=current_app.config.get('DISPLAYS', []),
+            render_pool=current_app.render_pool,
+            max_versions=current_app.config['IMAGE_MAX_VERSIONS']
         )
 
-        return {'success': True}
+        status, version = db_image.status, db_image.version
+        if existing is not None and version == version_before:
+            # The edit is written in the background and applied once the file is durable
+            status, version = 'pending', version + 1
+        return {'success': True, 'id': db_image.id, 'status': status, 'version': version}
     except UnidentifiedImageError as e:
         current_app.logger.error(f"Invalid image format: {e}")
         return {'success': False, 'error': 'Invalid image format'}
@@ -83,32 +136,45 @@ def upload():
                 scroll_speed = 0
 
             displays = current_app.config.get('DISPLAYS', [])
+            display_config = None
+            if display_index is not None:
+                try:
+                    idx = int(display_index)
+                    if 0 <= idx < len(displays):
+                        display_config = displays[idx]
+                except ValueError:
+                    pass
 
             try:
-                image = PILImage.open(file)
+                # Size limits are checked on the header, before any pixels are decoded
+                image = open_upload_image(file, current_app.config['UPLOAD_MAX_PIXELS'],
+                                          display_config, scroll_direction, scroll_speed)
                 display_name = None
 
-                if display_index is not None:
-                    try:
-                        idx = int(display_index)
-                        if 0 <= idx < len(displays):
-                            display_config = displays[idx]
-                            image = resize_image_to_display(image, display_config, scroll_direction, scroll_speed)
-                            display_name = display_config.get('name')
-                    except ValueError:
-                        pass
+                # Animations are decoded once here and stored as a strip of frames
+                frames, durations = read_frames(image, current_app.config['ANIMATION_MAX_FRAMES'])
+                if display_config is not None:
+                    frames = [resize_image_to_display(frame, display_config, scroll_direction, scroll_speed)
+                              for frame in frames]
+                    display_name = display_config.get('name')
+                image = frame_strip(frames)
 
                 save_image_artifact(
                     pil_image=image,
                     user_id=current_user.id,
                     upload_folder=current_app.config['UPLOAD_FOLDER'],
-                    filename_prefix="upload_",
                     metadata={
                         'display_name': display_name,
                         'scroll_direction': scroll_direction,
                         'scroll_speed': scroll_speed
                     },
-                    executor=current_app.executor
+                    executor=current_app.executor,
+                    cache=current_app.pixel_cache,
+                    storage_format=current_app.config['STORAGE_FORMAT'],
+                    compress=current_app.config['STORAGE_COMPRESS'],
+                    displays=displays,
+                    render_pool=current_app.render_pool,
+                    frame_durations=durations
                 )
 
                 flash('File uploaded successfully')
@@ -0,0 +1,14 @@
+from flask import Blueprint, Response, current_app
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """
+    Returns the request, database, cache and executor metrics of this
+    worker process for Prometheus to scrape.
+    """
+    return Response(current_app.metrics.render(current_app), content_type=CONTENT_TYPE)
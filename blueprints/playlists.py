@@ -0,0 +1,188 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from flask import Blueprint, current_app, request
+from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
+from extensions import db
+from models import Image, Playlist, PlaylistItem
+from packing import PIXEL_FORMATS, pack_bundle
+from utils import playlist_cache_key
+from blueprints.api import find_display, load_packed_image, not_modified, set_cache_headers
+
+playlists_bp = Blueprint('playlists', __name__)
+
+DEFAULT_DWELL_MS = 5000
+
+def playlist_to_dict(playlist):
+    return {
+        'id': playlist.id,
+        'name': playlist.name,
+        'display_name': playlist.display_name,
+        'items': [{'image_id': item.image_id, 'dwell_ms': item.dwell_ms} for item in playlist.items]
+    }
+
+def parse_playlist_items(entries):
+    """
+    Validates the 'items' of a playlist request body.
+
+    Each entry is either an image id or a dict with 'image_id' and optional 'dwell_ms'.
+
+    Returns:
+        List of PlaylistItem instances in order.
+
+    Raises:
+        ValueError: If the entries are malformed or reference unknown images.
+    """
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('items must be a non-empty list')
+
+    items = []
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            entry = {'image_id': entry}
+        try:
+            image_id = int(entry['image_id'])
+            dwell_ms = int(entry.get('dwell_ms', DEFAULT_DWELL_MS))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'Invalid playlist item at position {position}')
+        if dwell_ms <= 0:
+            raise ValueError(f'dwell_ms must be positive at position {position}')
+        items.append(PlaylistItem(image_id=image_id, position=position, dwell_ms=dwell_ms))
+
+    image_ids = {item.image_id for item in items}
+    found = {row.id for row in db.session.query(Image.id).filter(Image.id.in_(image_ids))}
+    missing = sorted(image_ids - found)
+    if missing:
+        raise ValueError(f"Unknown images: {', '.join(str(i) for i in missing)}")
+    return items
+
+def load_playlist(playlist_id):
+    """
+    Loads a playlist with its items and their images in a single query.
+    """
+    return (Playlist.query
+            .options(joinedload(Playlist.items).joinedload(PlaylistItem.image))
+            .filter(Playlist.id == playlist_id)
+            .first_or_404())
+
+def playlist_members(playlist):
+    """
+    Returns the ready members of a playlist and an ETag covering all of them.
+
+    Returns:
+        Tuple of (list of (item, image, filepath, mtime), etag).
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    members = []
+    for item in playlist.items:
+        img = item.image
+        # Skip images that were deleted or are still being written
+        if img is None or img.status != 'ready':
+            continue
+        filepath = os.path.join(upload_folder, img.filename)
+        members.append((item, img, filepath, os.path.getmtime(filepath)))
+
+    # Any change to a member's file, metadata, position or dwell time changes the tag
+    fingerprint = tuple((item.dwell_ms, img.etag(mtime)) for item, img, _, mtime in members)
+    etag = hashlib.sha1(repr((playlist.id, fingerprint)).encode('utf-8')).hexdigest()
+    return members, etag
+
+def load_playlist_bundle(playlist_id, etag, members, pixel_format):
+    """
+    Return the packed bundle for a playlist.
+    This function is cached based on playlist id, member ETag and pixel format.
+    """
+    def load():
+        items = []
+        for item, img, filepath, mtime in members:
+            width, height, payload = load_packed_image(filepath, mtime, pixel_format, img.height)
+            items.append({
+                'image_id': img.id,
+                'width': width,
+                'height': height,
+                'dwell_ms': item.dwell_ms,
+                'scroll_direction': img.scroll_direction,
+                'scroll_speed': img.scroll_speed,
+                'payload': payload
+            })
+        bundle = pack_bundle(items, pixel_format)
+        return bundle, len(bundle)
+
+    return current_app.pixel_cache.get_or_load((playlist_cache_key(playlist_id), etag, pixel_format), load)
+
+def bundle_response(playlist):
+    pixel_format = request.args.get('format', 'rgb888').lower()
+    if pixel_format not in PIXEL_FORMATS:
+        return {'error': f'Unknown format: {pixel_format}'}, 400
+
+    try:
+        members, etag = playlist_members(playlist)
+        etag = hashlib.sha1(f'{etag}:{pixel_format}'.encode('utf-8')).hexdigest()
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        bundle = load_playlist_bundle(playlist.id, etag, members, pixel_format)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+    response = current_app.response_class(bundle, mimetype='application/octet-stream')
+    return set_cache_headers(response, etag)
+
+@playlists_bp.route('/playlists', methods=['POST'])
+@login_required
+def api_create_playlist():
+    data = request.get_json(silent=True) or {}
+    display_name = data.get('display_name')
+    if find_display(display_name) is None:
+        return {'error': f'Unknown display: {display_name}'}, 400
+
+    try:
+        items = parse_playlist_items(data.get('items'))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    playlist = Playlist(name=data.get('name'), display_name=display_name, user_id=current_user.id, items=items)
+    db.session.add(playlist)
+    db.session.commit()
+    return playlist_to_dict(playlist), 201
+
+@playlists_bp.route('/playlist/<int:playlist_id>', methods=['GET'])
+def api_get_playlist(playlist_id):
+    return playlist_to_dict(load_playlist(playlist_id))
+
+@playlists_bp.route('/playlist/<int:playlist_id>', methods=['PUT'])
+@login_required
+def api_update_playlist(playlist_id):
+    playlist = load_playlist(playlist_id)
+    if playlist.user_id != current_user.id:
+        return {'error': 'Forbidden'}, 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        if 'items' in data:
+            playlist.items = parse_playlist_items(data['items'])
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    if 'name' in data:
+        playlist.name = data['name']
+    # Item changes do not touch the playlist row, so bump updated_at explicitly
+    playlist.updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    db.session.commit()
+
+    current_app.pixel_cache.invalidate(playlist_cache_key(playlist.id))
+    return playlist_to_dict(playlist)
+
+@playlists_bp.route('/playlist/<int:playlist_id>/bundle')
+def api_get_playlist_bundle(playlist_id):
+    return bundle_response(load_playlist(playlist_id))
+
+@playlists_bp.route('/display/<display_name>/bundle')
+def api_get_display_bundle(display_name):
+    # A display shows its most recently edited playlist
+    playlist = (Playlist.query
+                .filter(Playlist.display_name == display_name)
+                .order_by(Playlist.updated_at.desc(), Playlist.id.desc())
+                .first_or_404())
+    return bundle_response(load_playlist(playlist.id))
@@ -0,0 +1,123 @@
+import threading
+from collections import deque
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from models import Image
+
+class ChangeFeed:
+    """
+    In-process publish/subscribe channel for image changes.
+
+    Every event gets the next change id, so subscribers only need to remember
+    the last id they saw. The most recent events are kept in a bounded history;
+    waiting subscribers block on a condition variable and cost no work until
+    something is published.
+    """
+
+    def __init__(self, history=1000):
+        self.last_id = 0
+        self._events = deque(maxlen=history)
+        self._condition = threading.Condition()
+
+    def publish(self, change_type, image_id, **fields):
+        """
+        Appends an event and wakes every waiting subscriber.
+
+        Args:
+            change_type: 'created', 'updated' or 'deleted'.
+            image_id: The id of the changed image.
+            **fields: Extra event fields, e.g. 'display_name' and 'status'.
+
+        Returns:
+            The change id of the new event.
+        """
+        with self._condition:
+            self.last_id += 1
+            self._events.append(dict(fields, id=self.last_id, type=change_type, image_id=image_id))
+            self._condition.notify_all()
+            return self.last_id
+
+    def changes_since(self, since, display_name=None):
+        """
+        Returns the events after change id since.
+
+        Args:
+            since: The last change id the subscriber has seen.
+            display_name: Optional display name; only events for images on
+                that display (before or after the change) are returned.
+
+        Returns:
+            Tuple of (events, last_id, reset). last_id is the newest change id,
+            including events filtered out, and is what the subscriber passes as
+            since next time. reset is True when the subscriber missed events,
+            because they dropped out of the history or since comes from an
+            earlier process; it should then reload the full image list.
+        """
+        with self._condition:
+            return self._changes_since(since, display_name)
+
+    def wait(self, since, timeout, display_name=None):
+        """
+        Like changes_since(), but blocks for up to timeout seconds until there
+        is at least one matching event.
+        """
+        def ready():
+            events, _, reset = self._changes_since(since, display_name)
+            return events or reset
+
+        with self._condition:
+            self._condition.wait_for(ready, timeout)
+            return self._changes_since(since, display_name)
+
+    def _changes_since(self, since, display_name):
+        oldest = self._events[0]['id'] if self._events else self.last_id + 1
+        reset = since > self.last_id or since < oldest - 1
+        # Walk back from the newest event; idle subscribers stop immediately
+        events = []
+        for change in reversed(self._events):
+            if change['id'] <= since:
+                break
+            if _matches(change, display_name):
+                events.append(change)
+        events.reverse()
+        return events, self.last_id, reset
+
+def _matches(change, display_name):
+    if display_name is None:
+        return True
+    return display_name in (change.get('display_name'), change.get('previous_display_name'))
+
+def track_image_changes(session):
+    """
+    Publishes an event to current_app.change_feed for every Image that a
+    commit on session created, updated or deleted. Safe to call repeatedly.
+    """
+    if not event.contains(session, 'after_flush', _collect_image_changes):
+        event.listen(session, 'after_flush', _collect_image_changes)
+        event.listen(session, 'after_commit', _publish_image_changes)
+        event.listen(session, 'after_soft_rollback', _discard_image_changes)
+
+def _collect_image_changes(session, flush_context):
+    pending = session.info.setdefault('image_changes', [])
+    for change_type, objects in (('created', session.new), ('updated', session.dirty), ('deleted', session.deleted)):
+        for obj in objects:
+            if not isinstance(obj, Image):
+                continue
+            if change_type == 'updated' and not session.is_modified(obj, include_collections=False):
+                continue
+            fields = {'display_name': obj.display_name, 'status': obj.status, 'version': obj.version}
+            previous = inspect(obj).attrs.display_name.history.deleted
+            if previous and previous[0] != obj.display_name:
+                fields['previous_display_name'] = previous[0]
+            pending.append((change_type, obj.id, fields))
+
+def _publish_image_changes(session):
+    pending = session.info.pop('image_changes', [])
+    feed = getattr(current_app, 'change_feed', None) if has_app_context() else None
+    if feed is None:
+        return
+    for change_type, image_id, fields in pending:
+        feed.publish(change_type, image_id, **fields)
+
+def _discard_image_changes(session, previous_transaction):
+    session.info.pop('image_changes', None)
@@ -0,0 +1,89 @@
+from sqlalchemy import event, inspect, literal, text
+from sqlalchemy.engine import make_url
+
+# PRAGMA synchronous levels accepted in SQLITE_SYNCHRONOUS
+SQLITE_SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+def is_sqlite(uri):
+    """
+    Returns True if uri points at an SQLite database.
+    """
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+def engine_options(config):
+    """
+    Builds SQLALCHEMY_ENGINE_OPTIONS from the DATABASE_* settings.
+
+    Server databases (e.g. PostgreSQL) get a connection pool sized for the
+    web workers plus the background executor, with connections checked before
+    use and recycled before servers or proxies drop them. SQLite opens its
+    file directly and only gets the time a connection waits for a lock.
+    """
+    if is_sqlite(config['SQLALCHEMY_DATABASE_URI']):
+        # Seconds sqlite3 waits for a lock; PRAGMA busy_timeout below refines it
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}}
+    return {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+def configure_sqlite(engine, config):
+    """
+    Applies the SQLITE_* pragmas to every new connection of engine.
+
+    WAL lets readers keep reading the last committed state while a writer
+    commits, so device polls do not stall behind uploads. With WAL,
+    synchronous=NORMAL only syncs at checkpoints and is still safe against
+    corruption; a power loss can at most lose the last transactions.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    journal_mode = config['SQLITE_JOURNAL_MODE']
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+    if synchronous not in SQLITE_SYNCHRONOUS_LEVELS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SQLITE_SYNCHRONOUS_LEVELS)}")
+    busy_timeout = int(config['SQLITE_BUSY_TIMEOUT_MS'])
+    # In-memory databases have no journal file to switch
+    in_memory = engine.url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if journal_mode and not in_memory:
+                cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+            cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+            cursor.execute(f"PRAGMA synchronous={synchronous}")
+        finally:
+            cursor.close()
+
+def upgrade_schema(engine, metadata):
+    """
+    Adds the columns and indexes of metadata that are missing from existing
+    tables, e.g. when a database created by an earlier release is opened.
+
+    create_all() only creates missing tables and never alters existing ones.
+    Added columns that are NOT NULL get their scalar default as server default,
+    so existing rows are filled in.
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            missing = [column for column in table.columns if column.name not in existing]
+            for column in missing:
+                ddl = f"{preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}"
+                if not column.nullable:
+                    default = literal(column.default.arg, column.type).compile(
+                        dialect=engine.dialect, compile_kwargs={'literal_binds': True})
+                    ddl += f" NOT NULL DEFAULT {default}"
+                connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+            if missing:
+                for index in table.indexes:
+                    index.create(connection, checkfirst=True)
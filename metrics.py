@@ -0,0 +1,193 @@
+import bisect
+import threading
+import time
+from flask import g, request
+from sqlalchemy import event
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Statement kinds DB queries are grouped by
+QUERY_OPERATIONS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+class Counter:
+    """
+    Monotonic counter, one value per combination of label values.
+    """
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in values:
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, one series per combination of
+    label values. Observing costs one bisect and one lock acquisition.
+    """
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+class Metrics:
+    """
+    The metrics of one application: request and DB query instrumentation plus
+    gauges read from the caches and executors when the metrics are rendered.
+    """
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            'fpac_http_request_duration_seconds', 'Time spent handling requests.', ('endpoint', 'method'))
+        self.response_size = Histogram(
+            'fpac_http_response_size_bytes', 'Size of response bodies with a known length.', ('endpoint',),
+            SIZE_BUCKETS)
+        self.requests = Counter(
+            'fpac_http_requests_total', 'Requests handled, by response status.', ('endpoint', 'method', 'status'))
+        self.query_duration = Histogram(
+            'fpac_db_query_duration_seconds', 'Time spent executing database statements.', ('operation',),
+            QUERY_BUCKETS)
+
+    def init_app(self, app, engine):
+        """
+        Instruments app's requests through request hooks and engine's
+        statements through SQLAlchemy cursor events.
+        """
+        app.before_request(_start_timer)
+        app.after_request(self._observe_request)
+        event.listen(engine, 'before_cursor_execute', _start_query)
+        event.listen(engine, 'after_cursor_execute', self._observe_query)
+
+    def _observe_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        self.request_duration.observe(time.perf_counter() - started, endpoint, request.method)
+        self.requests.inc(endpoint, request.method, str(response.status_code))
+        # Streamed responses (e.g. Server-Sent Events) have no length
+        if response.content_length is not None:
+            self.response_size.observe(response.content_length, endpoint)
+        return response
+
+    def _observe_query(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('metrics_query_started', None)
+        if started is None:
+            return
+        words = statement.split(None, 1)
+        operation = words[0].upper() if words else ''
+        if operation not in QUERY_OPERATIONS:
+            operation = 'OTHER'
+        self.query_duration.observe(time.perf_counter() - started, operation)
+
+    def render(self, app):
+        """
+        Returns all metrics of app in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in (self.request_duration, self.response_size, self.requests, self.query_duration):
+            lines.extend(metric.collect())
+
+        for prefix, cache in (('fpac_pixel_cache', app.pixel_cache), ('fpac_preview_cache', app.preview_cache)):
+            stats = cache.stats()
+            for key in ('hits', 'misses', 'evictions'):
+                lines.extend(_sample(f"{prefix}_{key}_total", 'counter', f"Cache {key}.", stats[key]))
+            count_key = 'entries' if 'entries' in stats else 'files'
+            lines.extend(_sample(f"{prefix}_{count_key}", 'gauge', f"Cached {count_key}.", stats[count_key]))
+            lines.extend(_sample(f"{prefix}_bytes", 'gauge', 'Bytes held.', stats['bytes']))
+            lines.extend(_sample(f"{prefix}_max_bytes", 'gauge', 'Byte budget.', stats['max_bytes']))
+
+        queued, threads, idle = executor_state(app.executor)
+        lines.extend(_sample('fpac_executor_queue_depth', 'gauge', 'Tasks waiting for a background thread.', queued))
+        lines.extend(_sample('fpac_executor_threads', 'gauge', 'Background threads started.', threads))
+        lines.extend(_sample('fpac_executor_active_threads', 'gauge', 'Background threads running a task.',
+                             threads - idle))
+        pending = len(getattr(app.render_pool, '_pending_work_items', ())) if app.render_pool else 0
+        lines.extend(_sample('fpac_render_pool_pending', 'gauge', 'Variant renders submitted and not finished.',
+                             pending))
+        lines.extend(_sample('fpac_change_feed_last_id', 'gauge', 'Id of the newest change event.',
+                             app.change_feed.last_id))
+        return '\n'.join(lines) + '\n'
+
+def executor_state(executor):
+    """
+    Returns (queued tasks, started threads, idle threads) of a
+    ThreadPoolExecutor, read without locking. Zeros if there is none.
+    """
+    if executor is None:
+        return 0, 0, 0
+    work_queue = getattr(executor, '_work_queue', None)
+    idle = getattr(executor, '_idle_semaphore', None)
+    return (
+        work_queue.qsize() if work_queue is not None else 0,
+        len(getattr(executor, '_threads', ())),
+        idle._value if idle is not None else 0,
+    )
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    # Statements on one connection never overlap; a failed one is overwritten by the next
+    conn.info['metrics_query_started'] = time.perf_counter()
+
+def _sample(name, metric_type, help_text, value):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {_number(value)}"]
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
@@ -1,5 +1,7 @@
+import hashlib
 from extensions import db
 from flask_login import UserMixin
+from sqlalchemy import event, inspect, insert, update
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timezone
 
@@ -16,10 +18,18 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
 class Image(db.Model):
+    # Serves the /api/images keyset pagination: WHERE status = 'ready' ORDER BY created_at, id.
+    # A single-column index on status would make SQLite filter by it and sort the whole table.
+    __table_args__ = (db.Index('ix_image_status_created_at_id', 'status', 'created_at', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(128), nullable=False)
+    # SHA-256 of the decoded pixels; records with the same hash share one file
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, index=True, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+    updated_at = db.Column(db.DateTime, index=True, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None),
+                           onupdate=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
     
     # Store original dimensions or just rely on the file
     width = db.Column(db.Integer)
@@ -29,3 +39,151 @@ class Image(db.Model):
     display_name = db.Column(db.String(64), nullable=True)
     scroll_direction = db.Column(db.String(10), nullable=True, default='none')
     scroll_speed = db.Column(db.Integer, nullable=True, default=0)
+
+    # Animated images are stored as a vertical strip of frame_count frames of width x height
+    frame_count = db.Column(db.Integer, nullable=False, default=1)
+    # Per-frame display times in milliseconds, None for still images
+    frame_durations = db.Column(db.JSON, nullable=True)
+
+    # Ingest state: 'pending' while the file is written in the background, then 'ready' or 'failed'
+    status = db.Column(db.String(16), nullable=False, default='ready')
+
+    # Bumped on every edit; earlier versions are kept in ImageVersion for delta sync
+    version = db.Column(db.Integer, nullable=False, default=1)
+    versions = db.relationship('ImageVersion', backref='image', order_by='ImageVersion.version',
+                               cascade='all, delete-orphan')
+    # Renderings for each configured display, built at ingest
+    variants = db.relationship('ImageVariant', backref='image', cascade='all, delete-orphan')
+
+    @staticmethod
+    def references_to(content_hash):
+        """
+        Returns how many images and stored versions point at the file for content_hash.
+        """
+        return (Image.query.filter_by(content_hash=content_hash).count() +
+                ImageVersion.query.filter_by(content_hash=content_hash).count())
+
+    def reference_count(self):
+        """
+        Returns how many records, including this one, point at this image's file.
+        """
+        if self.content_hash is None:
+            return 1
+        return Image.references_to(self.content_hash)
+
+    def etag(self, mtime, *variant):
+        """
+        Returns a strong ETag for a representation of this image.
+        It changes whenever the backing file or any metadata column changes.
+        """
+        key = repr((self.id, self.version, mtime, self.filename, self.width, self.height, self.display_name,
+                    self.scroll_direction, self.scroll_speed, self.frame_count, self.frame_durations) + variant)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+class ImageVersion(db.Model):
+    """
+    A previous version of an Image, kept so displays can fetch only what changed.
+    """
+    __table_args__ = (db.UniqueConstraint('image_id', 'version'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('image.id'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    filename = db.Column(db.String(128), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+
+class ImageVariant(db.Model):
+    """
+    An image rendered for one display: fitted to its size and processed with
+    its settings, stored as an uncompressed raw pixel file in wiring order.
+    """
+    __table_args__ = (db.UniqueConstraint('image_id', 'display_name'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('image.id'), nullable=False, index=True)
+    display_name = db.Column(db.String(64), nullable=False)
+    # Image version and display settings the variant was rendered from; stale if either changed
+    version = db.Column(db.Integer, nullable=False)
+    settings = db.Column(db.String(40), nullable=False)
+    # Content-addressed like images, so identical renderings share one file
+    filename = db.Column(db.String(128), nullable=False, index=True)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+
+class Playlist(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=True)
+    # Display from displays.json this playlist is shown on
+    display_name = db.Column(db.String(64), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+    updated_at = db.Column(db.DateTime, index=True, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None),
+                           onupdate=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+
+    items = db.relationship('PlaylistItem', backref='playlist', order_by='PlaylistItem.position',
+                            cascade='all, delete-orphan')
+
+class PlaylistItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlist.id'), nullable=False, index=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('image.id', ondelete='CASCADE'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    # How long the display shows the image before moving on
+    dwell_ms = db.Column(db.Integer, nullable=False, default=5000)
+
+    # Deleting an image removes it from every playlist
+    image = db.relationship('Image', backref=db.backref('playlist_items', cascade='all, delete-orphan'))
+
+class LibraryRevision(db.Model):
+    """
+    Single-row counter that is bumped in the same transaction as every
+    insert, update and delete of an Image, so the image listing can be
+    revalidated with one primary key read.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def current():
+        """
+        Returns the current revision, or 0 before the first image change.
+        """
+        return db.session.query(LibraryRevision.revision).filter_by(id=1).scalar() or 0
+
+def bump_library_revision(connection):
+    """
+    Increments the library revision on connection, creating the row on first use.
+    """
+    table = LibraryRevision.__table__
+    result = connection.execute(update(table).where(table.c.id == 1).values(revision=table.c.revision + 1))
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(id=1, revision=1))
+
+def track_library_revision(session):
+    """
+    Bumps the library revision whenever a flush or a bulk statement on session
+    changes Image rows. Safe to call repeatedly.
+    """
+    if not event.contains(session, 'after_flush', _bump_on_flush):
+        event.listen(session, 'after_flush', _bump_on_flush)
+        event.listen(session, 'do_orm_execute', _bump_on_bulk_statement)
+
+def _bump_on_flush(session, flush_context):
+    for obj in (*session.new, *session.deleted, *session.dirty):
+        if not isinstance(obj, Image):
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        bump_library_revision(session.connection())
+        return
+
+def _bump_on_bulk_statement(orm_execute_state):
+    # e.g. the bulk INSERT of /api/images/import, which bypasses the flush
+    if orm_execute_state.is_select or orm_execute_state.bind_mapper is not inspect(Image):
+        return
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        bump_library_revision(orm_execute_state.session.connection())
@@ -0,0 +1,263 @@
+import struct
+from PIL import Image as PILImage
+from PIL import ImageChops
+
+# Wire formats understood by the ESP32 firmware. The numeric codes are part of
+# the binary header, so never renumber existing entries.
+PIXEL_FORMATS = {
+    'rgb888': 0,
+    'rgb565': 1,
+    'grb': 2,
+}
+
+# Bytes each pixel takes once packed
+BYTES_PER_PIXEL = {
+    'rgb888': 3,
+    'rgb565': 2,
+    'grb': 3,
+}
+
+SCROLL_DIRECTIONS = {
+    'none': 0,
+    'left': 1,
+    'right': 2,
+    'up': 3,
+    'down': 4,
+}
+
+FRAME_MAGIC = b'FPAC'
+FRAME_VERSION = 1
+
+# magic, version, pixel format, width, height, scroll direction, scroll speed
+FRAME_HEADER = struct.Struct('<4sBBHHBH')
+
+STREAM_MAGIC = b'FPAS'
+STREAM_VERSION = 1
+
+# magic, version, pixel format, frame width, frame height, frame count, frame interval (ms)
+STREAM_HEADER = struct.Struct('<4sBBHHIH')
+
+BUNDLE_MAGIC = b'FPAB'
+BUNDLE_VERSION = 1
+
+# magic, version, pixel format, item count
+BUNDLE_HEADER = struct.Struct('<4sBBH')
+
+# image id, width, height, dwell (ms), scroll direction, scroll speed, payload length
+BUNDLE_ITEM_HEADER = struct.Struct('<IHHIBHI')
+
+ANIMATION_MAGIC = b'FPAN'
+ANIMATION_VERSION = 1
+
+# magic, version, pixel format, frame width, frame height, frame count
+ANIMATION_HEADER = struct.Struct('<4sBBHHH')
+
+DELTA_MAGIC = b'FPAD'
+DELTA_VERSION = 1
+
+# Delta payload kinds: changed-pixel run records, or a full RGB888 frame
+DELTA_KIND_RUNS = 0
+DELTA_KIND_FULL = 1
+
+# magic, version, kind, from version, to version, width, height, record count
+DELTA_HEADER = struct.Struct('<4sBBIIHHI')
+
+# pixel offset (row-major), run length, RGB888 colour of every pixel in the run
+DELTA_RECORD = struct.Struct('<IH3s')
+
+def pack_pixels(pil_image, pixel_format='rgb888'):
+    """
+    Packs the pixels of a PIL Image into a flat byte string.
+
+    All channel shuffling is done by PIL in C, so no Python code runs per pixel.
+
+    Args:
+        pil_image: PIL Image object.
+        pixel_format: One of PIXEL_FORMATS ('rgb888', 'rgb565', 'grb').
+
+    Returns:
+        bytes: Row-major pixel data. RGB565 values are stored big-endian,
+        the other formats use three bytes per pixel.
+
+    Raises:
+        ValueError: If pixel_format is unknown.
+    """
+    if pixel_format not in PIXEL_FORMATS:
+        raise ValueError(f"Unknown pixel format: {pixel_format}")
+
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+
+    if pixel_format == 'rgb888':
+        return pil_image.tobytes()
+
+    r, g, b = pil_image.split()
+
+    if pixel_format == 'grb':
+        return PILImage.merge('RGB', (g, r, b)).tobytes()
+
+    # RGB565: the masked channels never share bits, so adding them is an OR.
+    high = ImageChops.add(r.point(lambda v: v & 0xF8), g.point(lambda v: v >> 5))
+    low = ImageChops.add(g.point(lambda v: (v & 0x1C) << 3), b.point(lambda v: v >> 3))
+    return PILImage.merge('LA', (high, low)).tobytes()
+
+def pack_header(width, height, pixel_format='rgb888', scroll_direction='none', scroll_speed=0):
+    """
+    Builds the fixed-size header that precedes a packed frame.
+
+    Args:
+        width: Frame width in pixels.
+        height: Frame height in pixels.
+        pixel_format: One of PIXEL_FORMATS.
+        scroll_direction: One of SCROLL_DIRECTIONS. Unknown values map to 'none'.
+        scroll_speed: Scroll speed in pixels per second.
+
+    Returns:
+        bytes: FRAME_HEADER.size bytes.
+    """
+    return FRAME_HEADER.pack(
+        FRAME_MAGIC,
+        FRAME_VERSION,
+        PIXEL_FORMATS[pixel_format],
+        width,
+        height,
+        SCROLL_DIRECTIONS.get(scroll_direction or 'none', 0),
+        max(0, min(int(scroll_speed or 0), 0xFFFF))
+    )
+
+
+def pack_stream_header(width, height, frame_count, frame_interval_ms, pixel_format='rgb888'):
+    """
+    Builds the fixed-size header that precedes a packed frame sequence.
+
+    Args:
+        width: Frame width in pixels.
+        height: Frame height in pixels.
+        frame_count: Number of frames that follow the header.
+        frame_interval_ms: Time each frame is shown for, 0 for a still image.
+        pixel_format: One of PIXEL_FORMATS.
+
+    Returns:
+        bytes: STREAM_HEADER.size bytes.
+    """
+    return STREAM_HEADER.pack(
+        STREAM_MAGIC,
+        STREAM_VERSION,
+        PIXEL_FORMATS[pixel_format],
+        width,
+        height,
+        frame_count,
+        max(0, min(int(frame_interval_ms), 0xFFFF))
+    )
+
+def pack_animation_header(width, height, durations, pixel_format='rgb888'):
+    """
+    Builds the header that precedes a packed animation.
+
+    Args:
+        width: Frame width in pixels.
+        height: Frame height in pixels.
+        durations: Display time of each frame in milliseconds.
+        pixel_format: One of PIXEL_FORMATS.
+
+    Returns:
+        bytes: ANIMATION_HEADER followed by one little-endian uint16 duration per frame.
+    """
+    header = ANIMATION_HEADER.pack(ANIMATION_MAGIC, ANIMATION_VERSION, PIXEL_FORMATS[pixel_format],
+                                   width, height, len(durations))
+    clamped = [max(0, min(int(d), 0xFFFF)) for d in durations]
+    return header + struct.pack(f'<{len(clamped)}H', *clamped)
+
+def frame_interval_ms(scroll_speed):
+    """
+    Returns how long each one-pixel scroll step lasts for a speed in px/s.
+    """
+    if not scroll_speed or scroll_speed <= 0:
+        return 0
+    return max(1, round(1000 / scroll_speed))
+
+def pack_bundle(items, pixel_format='rgb888'):
+    """
+    Packs several images into one playlist bundle.
+
+    Args:
+        items: Iterable of dicts with 'image_id', 'width', 'height', 'dwell_ms',
+            'scroll_direction', 'scroll_speed' and 'payload' (packed pixels).
+        pixel_format: One of PIXEL_FORMATS, the format of every payload.
+
+    Returns:
+        bytes: BUNDLE_HEADER, then for each item a BUNDLE_ITEM_HEADER followed
+        by its payload.
+    """
+    items = list(items)
+    parts = [BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, PIXEL_FORMATS[pixel_format], len(items))]
+    for item in items:
+        parts.append(BUNDLE_ITEM_HEADER.pack(
+            item['image_id'],
+            item['width'],
+            item['height'],
+            item['dwell_ms'],
+            SCROLL_DIRECTIONS.get(item['scroll_direction'] or 'none', 0),
+            max(0, min(int(item['scroll_speed'] or 0), 0xFFFF)),
+            len(item['payload'])
+        ))
+        parts.append(item['payload'])
+    return b''.join(parts)
+
+def encode_delta_runs(old_rgb, new_rgb, width):
+    """
+    Encodes the pixels that differ between two equally sized RGB888 buffers.
+
+    Consecutive changed pixels of the same new colour form one run. Unchanged
+    rows are skipped with a single buffer comparison each.
+
+    Args:
+        old_rgb: Previous packed RGB888 pixels (bytes or memoryview).
+        new_rgb: Current packed RGB888 pixels, the same length as old_rgb.
+        width: Image width in pixels.
+
+    Returns:
+        bytes: Concatenated DELTA_RECORD entries.
+    """
+    runs = []
+    row_bytes = width * 3
+    for row_start in range(0, len(new_rgb), row_bytes):
+        row_end = row_start + row_bytes
+        if old_rgb[row_start:row_end] == new_rgb[row_start:row_end]:
+            continue
+        for i in range(row_start, row_end, 3):
+            pixel = bytes(new_rgb[i:i + 3])
+            if old_rgb[i:i + 3] == pixel:
+                continue
+            offset = i // 3
+            if runs:
+                last = runs[-1]
+                if last[0] + last[1] == offset and last[2] == pixel and last[1] < 0xFFFF:
+                    last[1] += 1
+                    continue
+            runs.append([offset, 1, pixel])
+    return b''.join(DELTA_RECORD.pack(*run) for run in runs)
+
+def pack_delta(from_version, to_version, width, height, rgb, records=None):
+    """
+    Builds a delta update from from_version to to_version of an image.
+
+    Args:
+        from_version: The version the display currently shows.
+        to_version: The version the update brings it to.
+        width: Image width in pixels.
+        height: Image height in pixels.
+        rgb: Packed RGB888 pixels of to_version.
+        records: Output of encode_delta_runs(), or None if no delta is available.
+
+    Returns:
+        bytes: DELTA_HEADER followed by the run records, or by the full RGB888
+        frame when no delta is available or it would not be smaller.
+    """
+    if records is None or len(records) >= len(rgb):
+        header = DELTA_HEADER.pack(DELTA_MAGIC, DELTA_VERSION, DELTA_KIND_FULL,
+                                   from_version, to_version, width, height, 0)
+        return header + bytes(rgb)
+    header = DELTA_HEADER.pack(DELTA_MAGIC, DELTA_VERSION, DELTA_KIND_RUNS, from_version, to_version,
+                               width, height, len(records) // DELTA_RECORD.size)
+    return header + records
@@ -0,0 +1,46 @@
+import numpy as np
+
+# Indices are stored one byte per pixel
+MAX_PALETTE_COLORS = 256
+
+def palettize(rgb, max_colors=MAX_PALETTE_COLORS):
+    """
+    Splits packed RGB888 pixels into a palette and one index byte per pixel.
+
+    Args:
+        rgb: Packed RGB888 pixels (bytes or memoryview).
+        max_colors: Largest palette size, at most 256.
+
+    Returns:
+        Tuple of (palette, indices) bytes, with the palette as packed RGB888
+        colours in ascending order, or None if the pixels use more than
+        max_colors distinct colours.
+    """
+    pixels = np.frombuffer(rgb, dtype=np.uint8).reshape(-1, 3)
+    keys = (pixels[:, 0].astype(np.uint32) << 16) | (pixels[:, 1].astype(np.uint32) << 8) | pixels[:, 2]
+    colors, indices = np.unique(keys, return_inverse=True)
+    if len(colors) > max_colors:
+        return None
+    palette = np.stack([colors >> 16, (colors >> 8) & 0xFF, colors & 0xFF], axis=1).astype(np.uint8)
+    return palette.tobytes(), indices.astype(np.uint8).tobytes()
+
+def expand_palette(palette, indices):
+    """
+    Returns the packed RGB888 pixels for palette indices, see palettize().
+    """
+    colors = np.frombuffer(palette, dtype=np.uint8).reshape(-1, 3)
+    return colors[np.frombuffer(indices, dtype=np.uint8)].tobytes()
+
+def run_lengths(indices):
+    """
+    Run-length encodes palette indices.
+
+    Returns:
+        List of [index, count] pairs covering the pixels in order.
+    """
+    values = np.frombuffer(indices, dtype=np.uint8)
+    if not len(values):
+        return []
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    counts = np.diff(np.append(starts, len(values)))
+    return [[int(index), int(count)] for index, count in zip(values[starts], counts)]
@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+
+class PixelCache:
+    """
+    Thread-safe LRU cache for decoded pixel buffers, bounded by total size in bytes.
+
+    Keys are tuples whose first element is the path of the file the value was
+    derived from, so every cached representation of a file can be dropped at
+    once with invalidate().
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        """
+        Stores value under key, evicting least recently used entries until the
+        cache fits in max_bytes. Values larger than max_bytes are not stored.
+
+        Args:
+            key: Tuple whose first element is the source file path.
+            value: The object to cache.
+            size: Number of bytes value accounts for.
+        """
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for key, calling loader() on a miss.
+
+        Args:
+            key: Cache key, see put().
+            loader: Callable returning a (value, size) tuple.
+        """
+        value = self.get(key)
+        if value is None:
+            value, size = loader()
+            self.put(key, value, size)
+        return value
+
+    def invalidate(self, filepath):
+        """
+        Drops every entry derived from filepath.
+
+        Returns:
+            The number of entries removed.
+        """
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == filepath]
+            for key in stale:
+                self.current_bytes -= self._entries.pop(key)[1]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,117 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image as PILImage
+from storage import write_atomic
+
+# Encoders for gallery previews; both are lossless so pixel edges stay sharp
+PREVIEW_FORMATS = {
+    'png': ('PNG', 'image/png', {'optimize': True}),
+    'webp': ('WEBP', 'image/webp', {'lossless': True}),
+}
+
+def render_preview(width, height, rgb, size):
+    """
+    Renders a gallery preview of packed RGB888 pixels that fits in a size x size box.
+
+    Small images are upscaled by the largest whole factor that fits, so every
+    pixel becomes a sharp square. Larger images are scaled down, keeping the
+    aspect ratio. Both use nearest-neighbour sampling.
+
+    Returns:
+        RGB PIL Image object.
+    """
+    image = PILImage.frombytes('RGB', (width, height), bytes(rgb))
+    longest = max(width, height)
+    if longest <= size:
+        factor = size // longest
+        target = (width * factor, height * factor)
+    else:
+        target = (max(1, width * size // longest), max(1, height * size // longest))
+    if target == image.size:
+        return image
+    return image.resize(target, resample=PILImage.NEAREST)
+
+class PreviewCache:
+    """
+    Directory of encoded preview files, bounded by total size in bytes.
+
+    Files are named by a key that changes whenever their source changes, so
+    they never need invalidating; the least recently used files are deleted
+    once the directory grows beyond max_bytes. Files already in the directory
+    are adopted at startup, oldest first.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+        if os.path.isdir(folder):
+            existing = []
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if name.endswith('.tmp') or not os.path.isfile(path):
+                    continue
+                stat = os.stat(path)
+                existing.append((stat.st_mtime, name, stat.st_size))
+            for _, name, size in sorted(existing):
+                self._files[name] = size
+                self.current_bytes += size
+            self._evict()
+
+    def get_or_create(self, name, render, pil_format, options=None):
+        """
+        Returns the path of the preview file name, rendering and encoding it on a miss.
+
+        Args:
+            name: File name, unique for the source pixels, size and format.
+            render: Callable returning the PIL Image to encode.
+            pil_format: PIL format name, e.g. 'PNG'.
+            options: Optional keyword arguments for PIL's save().
+        """
+        path = os.path.join(self.folder, name)
+        with self._lock:
+            if name in self._files and os.path.exists(path):
+                self._files.move_to_end(name)
+                self.hits += 1
+                return path
+            self.misses += 1
+
+        image = render()
+        write_atomic(path, lambda f: image.save(f, pil_format, **(options or {})))
+        size = os.path.getsize(path)
+
+        with self._lock:
+            self.current_bytes -= self._files.pop(name, 0)
+            self._files[name] = size
+            self.current_bytes += size
+            self._evict()
+        return path
+
+    def _evict(self):
+        # The newest file is kept even if it alone exceeds the budget, so it can be served
+        while self.current_bytes > self.max_bytes and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._files),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
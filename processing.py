@@ -0,0 +1,198 @@
+import functools
+import hashlib
+import numpy as np
+
+# Order in which pixels are sent down the LED chain:
+# - 'progressive': row by row, every row left to right.
+# - 'serpentine': row by row, odd rows right to left (zigzag wiring).
+# - 'vertical_serpentine': column by column, odd columns bottom to top.
+LAYOUTS = ('progressive', 'serpentine', 'vertical_serpentine')
+
+# 4x4 Bayer matrix as threshold offsets in [-0.5, 0.5)
+BAYER_4X4 = (np.array([
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+], dtype=np.float32) + 0.5) / 16 - 0.5
+
+# Upper bound on pixels x palette colours compared at once when mapping to a
+# palette, which keeps the distance array at a few MB whatever the image size
+QUANTIZE_BLOCK = 1 << 20
+
+def target_size(width, height, display_config, scroll_direction='none', scroll_speed=0):
+    """
+    Returns the (width, height) an image is fitted to on a display.
+
+    Still images are scaled down, keeping the aspect ratio, until they fit the
+    display. Scrolling images are only scaled along the axis they do not scroll
+    along. Images that already fit keep their size.
+    """
+    d_width = display_config['width']
+    d_height = display_config['height']
+    scrolling = (scroll_speed or 0) > 0 and scroll_direction not in (None, 'none')
+
+    if not scrolling:
+        if width <= d_width and height <= d_height:
+            return width, height
+        ratio = min(d_width / width, d_height / height)
+        return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+    if scroll_direction in ('left', 'right') and height > d_height:
+        return max(1, int((width / height) * d_height)), d_height
+    if scroll_direction in ('up', 'down') and width > d_width:
+        return d_width, max(1, int((height / width) * d_width))
+    return width, height
+
+def display_options(display_config):
+    """
+    Reads and validates the processing settings of a display.
+
+    Recognised keys are 'gamma' (default 1.0), 'max_brightness' (0-255, default
+    255), 'color_depth' (bits per channel, 1-8, default 8), 'palette' (list of
+    '#rrggbb' strings or [r, g, b] lists), 'dither' (default False) and
+    'layout' (one of LAYOUTS, default 'progressive').
+
+    Returns:
+        Hashable tuple of (gamma, max_brightness, color_depth, palette, dither, layout).
+
+    Raises:
+        ValueError: If a setting is out of range.
+    """
+    gamma = float(display_config.get('gamma', 1.0))
+    max_brightness = int(display_config.get('max_brightness', 255))
+    color_depth = int(display_config.get('color_depth', 8))
+    palette = display_config.get('palette')
+    dither = bool(display_config.get('dither', False))
+    layout = display_config.get('layout', 'progressive')
+
+    if gamma <= 0:
+        raise ValueError("gamma must be positive")
+    if not 0 <= max_brightness <= 255:
+        raise ValueError("max_brightness must be between 0 and 255")
+    if not 1 <= color_depth <= 8:
+        raise ValueError("color_depth must be between 1 and 8")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout}")
+    if palette is not None:
+        palette = tuple(_parse_color(color) for color in palette)
+        if not palette:
+            raise ValueError("palette must not be empty")
+    return gamma, max_brightness, color_depth, palette, dither, layout
+
+def display_settings(display_config):
+    """
+    Returns a fingerprint of everything that affects how an image is rendered
+    for a display. Raises ValueError like display_options().
+    """
+    key = repr((display_config['width'], display_config['height'], display_options(display_config)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _parse_color(color):
+    if isinstance(color, str):
+        value = color.lstrip('#')
+        if len(value) != 6:
+            raise ValueError(f"Invalid palette colour: {color}")
+        return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    if len(color) != 3 or not all(0 <= int(c) <= 255 for c in color):
+        raise ValueError(f"Invalid palette colour: {color}")
+    return tuple(int(c) for c in color)
+
+@functools.lru_cache(maxsize=64)
+def tone_lut(gamma, max_brightness):
+    """
+    Returns a 256-entry lookup table applying gamma correction and the
+    brightness cap in one step.
+    """
+    levels = np.arange(256, dtype=np.float64) / 255
+    return np.round(levels ** gamma * max_brightness).astype(np.uint8)
+
+def resize_nearest(pixels, size):
+    """
+    Nearest-neighbour resize of an (height, width, 3) array, sampling pixel
+    centres the way PIL's NEAREST filter does.
+    """
+    width, height = size
+    src_height, src_width = pixels.shape[:2]
+    if (width, height) == (src_width, src_height):
+        return pixels
+    rows = ((np.arange(height) + 0.5) * src_height / height).astype(np.intp)
+    cols = ((np.arange(width) + 0.5) * src_width / width).astype(np.intp)
+    return pixels[rows[:, None], cols[None, :]]
+
+def quantize(pixels, color_depth=8, palette=None, dither=False):
+    """
+    Reduces an (height, width, 3) uint8 array to color_depth bits per channel,
+    or to the nearest colours of palette. With dither, a 4x4 ordered (Bayer)
+    dither is added first, which vectorizes unlike error diffusion.
+    """
+    if palette is None and color_depth == 8:
+        return pixels
+
+    height, width = pixels.shape[:2]
+    values = pixels.astype(np.float32)
+
+    if palette is None:
+        step = 255 / (2 ** color_depth - 1)
+    else:
+        # Approximate spacing of the palette along each channel
+        step = 255 / max(1, round(len(palette) ** (1 / 3)) - 1)
+
+    if dither:
+        offsets = np.tile(BAYER_4X4, (height // 4 + 1, width // 4 + 1))[:height, :width]
+        values += offsets[:, :, None] * step
+
+    if palette is None:
+        return (np.clip(np.round(values / step), 0, 2 ** color_depth - 1) * step).round().astype(np.uint8)
+
+    colors = np.array(palette, dtype=np.float64)
+    values = values.reshape(-1, 3)
+    # |v - c|^2 = |v|^2 - 2 v.c + |c|^2, and |v|^2 does not change which colour is nearest
+    norms = (colors ** 2).sum(axis=-1)
+    nearest = np.empty(len(values), dtype=np.intp)
+    chunk = max(1, QUANTIZE_BLOCK // len(colors))
+    for start in range(0, len(values), chunk):
+        distances = norms - 2 * (values[start:start + chunk] @ colors.T)
+        nearest[start:start + chunk] = distances.argmin(axis=-1)
+    return colors[nearest].astype(np.uint8).reshape(height, width, 3)
+
+def order_pixels(pixels, layout='progressive'):
+    """
+    Rearranges an (height, width, 3) array so that its row-major bytes follow
+    the wiring order of the LED chain (see LAYOUTS).
+    """
+    if layout == 'progressive':
+        return pixels
+    if layout == 'vertical_serpentine':
+        pixels = pixels.transpose(1, 0, 2)
+    ordered = pixels.copy()
+    ordered[1::2] = ordered[1::2, ::-1]
+    return ordered
+
+def process_pixels(width, height, rgb, display_config, scroll_direction='none', scroll_speed=0):
+    """
+    Runs packed RGB888 pixels through a display's processing pipeline: fit to
+    the display, gamma and brightness lookup table, quantization with optional
+    dithering, and reordering for the LED wiring.
+
+    Args:
+        width: Image width in pixels.
+        height: Image height in pixels.
+        rgb: Packed RGB888 pixels (bytes or memoryview).
+        display_config: Display entry from displays.json, see display_options().
+        scroll_direction: The image's scroll direction, used to fit it.
+        scroll_speed: The image's scroll speed.
+
+    Returns:
+        Tuple of (width, height, rgb bytes) in the display's wiring order.
+    """
+    gamma, max_brightness, color_depth, palette, dither, layout = display_options(display_config)
+
+    pixels = np.frombuffer(rgb, dtype=np.uint8).reshape(height, width, 3)
+    width, height = target_size(width, height, display_config, scroll_direction, scroll_speed)
+    pixels = resize_nearest(pixels, (width, height))
+    if (gamma, max_brightness) != (1.0, 255):
+        pixels = tone_lut(gamma, max_brightness)[pixels]
+    pixels = quantize(pixels, color_depth, palette, dither)
+    pixels = order_pixels(pixels, layout)
+    return width, height, np.ascontiguousarray(pixels).tobytes()
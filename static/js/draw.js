@@ -1,4 +1,5 @@
 const displays = window.FPAC.displays;
+const editImage = window.FPAC.editImage;
 const canvas = document.getElementById('pixelCanvas');
 const ctx = canvas.getContext('2d');
 let pixelSize = 10;
@@ -126,6 +127,26 @@ canvas.addEventListener('mouseleave', () => {
     isDrawing = false;
 });
 
+// Packs canvas pixels into the raw pixel file format the server stores:
+// magic 'FPXL', version, flags, width and height (little-endian uint16),
+// followed by RGB888 rows.
+function packPixels(imageData) {
+    const pixelCount = imageData.width * imageData.height;
+    const body = new Uint8Array(10 + pixelCount * 3);
+    const view = new DataView(body.buffer);
+    body.set([0x46, 0x50, 0x58, 0x4c, 1, 0]);
+    view.setUint16(6, imageData.width, true);
+    view.setUint16(8, imageData.height, true);
+
+    const rgba = imageData.data;
+    for (let i = 0, offset = 10; i < pixelCount; i++, offset += 3) {
+        body[offset] = rgba[i * 4];
+        body[offset + 1] = rgba[i * 4 + 1];
+        body[offset + 2] = rgba[i * 4 + 2];
+    }
+    return body;
+}
+
 function saveImage() {
     // Create a temporary canvas to draw the image at 1:1 scale
     const tempCanvas = document.createElement('canvas');
@@ -136,9 +157,6 @@ function saveImage() {
     // Draw the image onto the temp canvas, scaling down
     tempCtx.drawImage(canvas, 0, 0, width, height);
 
-    // Get data URL
-    const dataURL = tempCanvas.toDataURL('image/png');
-
     const displaySelect = document.getElementById('displaySelect');
     let displayName = null;
     if (displaySelect.value) {
@@ -148,18 +166,25 @@ function saveImage() {
     const scrollDirection = document.getElementById('scrollDirection').value;
     const scrollSpeed = parseInt(document.getElementById('scrollSpeed').value);
 
-    // Send to server
-    fetch(window.FPAC.routes.saveDrawing, {
+    // Fields go in the query string, the pixels in the body
+    const params = new URLSearchParams({
+        scroll_direction: scrollDirection,
+        scroll_speed: scrollSpeed
+    });
+    if (displayName !== null) {
+        params.set('display_name', displayName);
+    }
+    if (editImage) {
+        params.set('image_id', editImage.id);
+    }
+
+    // Send the pixel grid as a raw pixel file: no PNG encoding and no base64
+    fetch(window.FPAC.routes.saveDrawing + '?' + params.toString(), {
         method: 'POST',
         headers: {
-            'Content-Type': 'application/json',
+            'Content-Type': 'application/octet-stream',
         },
-        body: JSON.stringify({
-            image: dataURL,
-            display_name: displayName,
-            scroll_direction: scrollDirection,
-            scroll_speed: scrollSpeed
-        }),
+        body: packPixels(tempCtx.getImageData(0, 0, width, height)),
     })
     .then(response => response.json())
     .then(data => {
@@ -176,10 +201,40 @@ function saveImage() {
     });
 }
 
+// Load the pixels of the image being edited onto the canvas
+function loadEditImage() {
+    const displayIndex = displays.findIndex(d => d.name === editImage.display_name);
+    if (displayIndex >= 0) {
+        document.getElementById('displaySelect').value = displayIndex;
+        onDisplayChange();
+    }
+    document.getElementById('scrollDirection').value = editImage.scroll_direction || 'none';
+    document.getElementById('scrollSpeed').value = editImage.scroll_speed || 0;
+
+    fetch(editImage.rgb_url)
+        .then(response => response.json())
+        .then(data => {
+            document.getElementById('width').value = data.width;
+            document.getElementById('height').value = data.height;
+            resizeCanvas();
+            data.pixels.forEach(([r, g, b], i) => {
+                ctx.fillStyle = `rgb(${r}, ${g}, ${b})`;
+                ctx.fillRect((i % width) * pixelSize, Math.floor(i / width) * pixelSize, pixelSize, pixelSize);
+            });
+        })
+        .catch((error) => {
+            console.error('Error:', error);
+            alert('Error loading image');
+        });
+}
+
 // Initialize with default display if available
 if (displays.length > 0) {
     onDisplayChange();
 }
+if (editImage) {
+    loadEditImage();
+}
 
 document.getElementById('scrollDirection').addEventListener('change', function() {
     const speedInput = document.getElementById('scrollSpeed');
@@ -0,0 +1,135 @@
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+
+# Raw pixel files: a fixed header followed by packed RGB888 rows, optionally
+# zlib-compressed. They are read with a single read() and no image decoder.
+RAW_EXTENSION = 'fpx'
+RAW_MAGIC = b'FPXL'
+RAW_VERSION = 1
+RAW_FLAG_ZLIB = 0x01
+
+# magic, version, flags, width, height
+RAW_HEADER = struct.Struct('<4sBBHH')
+
+# Largest width or height the uint16 header fields (here and in packing.py) can hold
+MAX_DIMENSION = 0xFFFF
+
+STORAGE_FORMATS = ('bmp', 'raw')
+
+def storage_extension(storage_format):
+    """
+    Returns the file extension used for artifacts in the given storage format.
+    """
+    if storage_format not in STORAGE_FORMATS:
+        raise ValueError(f"Unknown storage format: {storage_format}")
+    return RAW_EXTENSION if storage_format == 'raw' else 'bmp'
+
+def is_raw_file(filepath):
+    return filepath.endswith('.' + RAW_EXTENSION)
+
+def encode_raw(width, height, rgb, compress=False):
+    """
+    Serializes packed RGB888 pixels into the raw pixel file format.
+
+    Returns:
+        bytes: Header followed by the (optionally compressed) pixel data.
+    """
+    flags = RAW_FLAG_ZLIB if compress else 0
+    payload = zlib.compress(rgb) if compress else rgb
+    return RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, flags, width, height) + payload
+
+def decode_raw(data):
+    """
+    Parses a raw pixel file.
+
+    Args:
+        data: The file contents (bytes, or a memoryview/mmap over them).
+
+    Returns:
+        Tuple of (width, height, rgb bytes).
+
+    Raises:
+        ValueError: If the data is not a valid raw pixel file.
+    """
+    if len(data) < RAW_HEADER.size:
+        raise ValueError("Truncated raw pixel file")
+    magic, version, flags, width, height = RAW_HEADER.unpack_from(data)
+    if magic != RAW_MAGIC or version != RAW_VERSION:
+        raise ValueError("Not a raw pixel file")
+
+    payload = data[RAW_HEADER.size:]
+    rgb = zlib.decompress(payload) if flags & RAW_FLAG_ZLIB else bytes(payload)
+    if len(rgb) != width * height * 3:
+        raise ValueError("Raw pixel file size does not match its dimensions")
+    return width, height, rgb
+
+def read_raw_header(filepath):
+    """
+    Reads only the header of a raw pixel file.
+
+    Returns:
+        Tuple of (flags, width, height).
+    """
+    with open(filepath, 'rb') as f:
+        data = f.read(RAW_HEADER.size)
+    if len(data) < RAW_HEADER.size:
+        raise ValueError("Truncated raw pixel file")
+    magic, version, flags, width, height = RAW_HEADER.unpack(data)
+    if magic != RAW_MAGIC or version != RAW_VERSION:
+        raise ValueError("Not a raw pixel file")
+    return flags, width, height
+
+def read_raw_file(filepath):
+    """
+    Reads a raw pixel file from disk. See decode_raw().
+    """
+    with open(filepath, 'rb') as f:
+        return decode_raw(f.read())
+
+def map_raw_file(filepath):
+    """
+    Memory-maps a raw pixel file. See decode_raw().
+
+    For uncompressed files the returned pixels are a read-only memoryview over
+    the mapping, so no copy is made and the pages are shared with every other
+    process mapping the same file. Compressed files are decompressed into bytes.
+    """
+    with open(filepath, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header = RAW_HEADER.unpack_from(mapping) if len(mapping) >= RAW_HEADER.size else None
+    if header is None or header[2] & RAW_FLAG_ZLIB:
+        # Compressed (or truncated) files are decoded into a private copy
+        try:
+            return decode_raw(mapping)
+        finally:
+            mapping.close()
+
+    magic, version, _, width, height = header
+    if magic != RAW_MAGIC or version != RAW_VERSION or len(mapping) - RAW_HEADER.size != width * height * 3:
+        mapping.close()
+        raise ValueError("Not a valid raw pixel file")
+    return width, height, memoryview(mapping)[RAW_HEADER.size:]
+
+def write_atomic(filepath, write):
+    """
+    Writes a file durably: write(f) fills a uniquely named temporary file that
+    is fsynced and renamed over filepath, so readers never see a partial file
+    and concurrent writers of the same content cannot clobber each other. The
+    temporary file is removed on error.
+    """
+    directory = os.path.dirname(filepath)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
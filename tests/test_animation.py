@@ -0,0 +1,139 @@
+import unittest
+import tempfile
+import shutil
+import io
+import struct
+from app import create_app, db
+from models import User, Image, ImageVariant
+from packing import ANIMATION_HEADER, ANIMATION_MAGIC, PIXEL_FORMATS, FRAME_HEADER
+from utils import read_frames, frame_strip
+from PIL import Image as PILImage
+
+DISPLAY = {'name': 'Panel', 'width': 4, 'height': 2, 'max_width': 8, 'max_height': 4}
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+
+def animated_gif(size=(4, 2), colors=COLORS, durations=(100, 200, 300)):
+    frames = [PILImage.new('RGB', size, color) for color in colors]
+    buf = io.BytesIO()
+    frames[0].save(buf, 'GIF', save_all=True, append_images=frames[1:], duration=list(durations), loop=0)
+    buf.seek(0)
+    return buf
+
+class TestFrames(unittest.TestCase):
+    def test_read_frames(self):
+        with PILImage.open(animated_gif()) as image:
+            frames, durations = read_frames(image, 10)
+        self.assertEqual(durations, [100, 200, 300])
+        self.assertEqual([frame.getpixel((0, 0)) for frame in frames], COLORS)
+
+    def test_still_image_has_no_durations(self):
+        image = PILImage.new('RGB', (4, 2))
+        self.assertEqual(read_frames(image, 10), ([image], None))
+
+    def test_too_many_frames(self):
+        with PILImage.open(animated_gif()) as image:
+            with self.assertRaises(ValueError):
+                read_frames(image, 2)
+
+    def test_frame_strip(self):
+        strip = frame_strip([PILImage.new('RGB', (4, 2), color) for color in COLORS])
+        self.assertEqual(strip.size, (4, 6))
+        self.assertEqual([strip.getpixel((0, y)) for y in (0, 2, 4)], COLORS)
+
+class AnimationAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': [dict(DISPLAY)]
+        })
+        self.app.executor = None
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _upload(self, stream, **form):
+        self.client.post('/upload', data={'file': (stream, 'anim.gif'), **form},
+                         content_type='multipart/form-data')
+        with self.app.app_context():
+            return Image.query.order_by(Image.id.desc()).first().id
+
+    def test_upload_stores_frame_strip(self):
+        image_id = self._upload(animated_gif())
+        with self.app.app_context():
+            img = db.session.get(Image, image_id)
+            self.assertEqual((img.width, img.height, img.frame_count), (4, 2, 3))
+            self.assertEqual(img.frame_durations, [100, 200, 300])
+            # Variants are rendered from the first frame
+            variant = ImageVariant.query.filter_by(image_id=image_id).one()
+            self.assertEqual((variant.width, variant.height), (4, 2))
+
+    def test_animation_endpoint(self):
+        image_id = self._upload(animated_gif())
+        response = self.client.get(f'/api/image/{image_id}/animation')
+        self.assertEqual(response.status_code, 200)
+
+        magic, _, pixel_format, width, height, count = ANIMATION_HEADER.unpack_from(response.data)
+        self.assertEqual(magic, ANIMATION_MAGIC)
+        self.assertEqual((pixel_format, width, height, count), (PIXEL_FORMATS['rgb888'], 4, 2, 3))
+        offset = ANIMATION_HEADER.size
+        self.assertEqual(struct.unpack_from('<3H', response.data, offset), (100, 200, 300))
+
+        frames = response.data[offset + 6:]
+        self.assertEqual(len(frames), 3 * 4 * 2 * 3)
+        self.assertEqual([tuple(frames[i * 24:i * 24 + 3]) for i in range(3)], COLORS)
+
+        etag = response.headers['ETag']
+        response = self.client.get(f'/api/image/{image_id}/animation', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_rgb565_animation(self):
+        image_id = self._upload(animated_gif())
+        response = self.client.get(f'/api/image/{image_id}/animation?format=rgb565')
+        self.assertEqual(len(response.data), ANIMATION_HEADER.size + 6 + 3 * 4 * 2 * 2)
+
+    def test_single_frame_endpoints_serve_first_frame(self):
+        image_id = self._upload(animated_gif())
+        data = self.client.get(f'/api/image/{image_id}/rgb').get_json()
+        self.assertEqual((data['width'], data['height'], data['frame_count']), (4, 2, 3))
+        self.assertEqual(len(data['pixels']), 8)
+        self.assertEqual(tuple(data['pixels'][0]), COLORS[0])
+
+        response = self.client.get(f'/api/image/{image_id}/packed')
+        self.assertEqual(len(response.data), FRAME_HEADER.size + 4 * 2 * 3)
+
+        response = self.client.get(f'/api/image/{image_id}/raw')
+        self.assertEqual(response.headers['X-Frame-Count'], '3')
+
+    def test_still_image_is_one_frame(self):
+        buf = io.BytesIO()
+        PILImage.new('RGB', (4, 2), 'red').save(buf, 'PNG')
+        buf.seek(0)
+        image_id = self._upload(buf)
+
+        response = self.client.get(f'/api/image/{image_id}/animation')
+        *_, count = ANIMATION_HEADER.unpack_from(response.data)
+        self.assertEqual(count, 1)
+        self.assertEqual(struct.unpack_from('<H', response.data, ANIMATION_HEADER.size), (0,))
+
+    def test_frames_count_towards_pixel_limit(self):
+        self.app.config['UPLOAD_MAX_PIXELS'] = 4 * 2 * 2
+        self.client.post('/upload', data={'file': (animated_gif(), 'anim.gif')}, content_type='multipart/form-data')
+        with self.app.app_context():
+            self.assertEqual(Image.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
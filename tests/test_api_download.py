@@ -48,8 +48,14 @@ class ApiDownloadTestCase(unittest.TestCase):
         # Check for redirect
         self.assertEqual(response.status_code, 302)
         # Verify the redirect location
-        # The location should end with /static/uploads/test_image.png
-        self.assertTrue(response.location.endswith(f'/static/uploads/{filename}'))
+        # The location should be the fingerprinted URL of test_image.png
+        self.assertRegex(response.location, rf'/api/files/[0-9a-f]{{16}}/{filename}$')
+
+        response = self.client.get(response.location)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'fake image content')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
 
     def test_download_nonexistent_image(self):
         response = self.client.get('/api/download/999')
@@ -3,6 +3,8 @@ import tempfile
 import shutil
 import os
 import json
+from datetime import datetime, timedelta
+from sqlalchemy import event, text
 from app import create_app, db
 from models import User, Image
 
@@ -76,7 +78,7 @@ class APIListImagesTestCase(unittest.TestCase):
         self.assertEqual(img_data_1['scroll_direction'], 'left')
         self.assertEqual(img_data_1['scroll_speed'], 5)
         # Verify URL structure
-        self.assertIn('uploads/test1.bmp', img_data_1['url'])
+        self.assertRegex(img_data_1['url'], r'/api/files/[0-9a-f]{16}/test1.bmp$')
         self.assertEqual(img_data_1.get('username'), 'testuser')
 
         # Verify the second image
@@ -87,8 +89,179 @@ class APIListImagesTestCase(unittest.TestCase):
         self.assertEqual(img_data_2['display_name'], 'Test Image 2')
         self.assertEqual(img_data_2['scroll_direction'], 'right')
         self.assertEqual(img_data_2['scroll_speed'], 10)
-        self.assertIn('uploads/test2.bmp', img_data_2['url'])
+        self.assertRegex(img_data_2['url'], r'/api/files/[0-9a-f]{16}/test2.bmp$')
         self.assertEqual(img_data_2.get('username'), 'testuser')
 
+class APIListImagesPaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'WTF_CSRF_ENABLED': False
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            alice = User(username='alice')
+            bob = User(username='bob')
+            db.session.add_all([alice, bob])
+            db.session.commit()
+            self.alice_id = alice.id
+            self.bob_id = bob.id
+
+            created_at = datetime(2024, 1, 1)
+            for i in range(5):
+                db.session.add(Image(
+                    filename=f'img{i}.bmp',
+                    user_id=alice.id if i % 2 == 0 else bob.id,
+                    created_at=created_at + timedelta(minutes=i),
+                    width=32,
+                    height=16,
+                    display_name='Wall' if i < 3 else 'Desk',
+                    scroll_direction='left',
+                    scroll_speed=i
+                ))
+            # Same timestamp as img4, ordered after it by id
+            db.session.add(Image(filename='img5.bmp', user_id=alice.id, created_at=created_at + timedelta(minutes=4)))
+            db.session.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_cursor_walks_all_pages_in_order(self):
+        filenames = []
+        cursor = None
+        pages = 0
+        while True:
+            url = '/api/images?limit=2'
+            if cursor:
+                url += f'&cursor={cursor}'
+            data = self.client.get(url).get_json()
+            pages += 1
+            filenames.extend(img['filename'] for img in data['images'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(filenames, [f'img{i}.bmp' for i in range(6)])
+
+    def test_limit_is_capped(self):
+        self.app.config['API_MAX_PAGE_SIZE'] = 4
+        data = self.client.get('/api/images?limit=1000').get_json()
+        self.assertEqual(len(data['images']), 4)
+        self.assertIsNotNone(data['next_cursor'])
+
+    def test_filter_by_user(self):
+        data = self.client.get(f'/api/images?user_id={self.bob_id}').get_json()
+        self.assertEqual([img['filename'] for img in data['images']], ['img1.bmp', 'img3.bmp'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_filter_by_display_name(self):
+        data = self.client.get('/api/images?display_name=Desk').get_json()
+        self.assertEqual([img['filename'] for img in data['images']], ['img3.bmp', 'img4.bmp'])
+
+    def test_field_selection(self):
+        data = self.client.get('/api/images?fields=id,scroll_direction,scroll_speed&limit=1').get_json()
+        self.assertEqual(set(data['images'][0]), {'id', 'scroll_direction', 'scroll_speed'})
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/images?fields=id,password_hash')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/images?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def _listing_plan(self, url):
+        # Capture the SELECT the endpoint runs and ask SQLite how it executes it
+        statements = []
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().startswith('SELECT') and 'ORDER BY' in statement:
+                statements.append((statement, parameters))
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', capture)
+            try:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', capture)
+            self.assertEqual(len(statements), 1)
+            statement, parameters = statements[0]
+            rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+        return ' '.join(row[-1] for row in rows)
+
+    def test_listing_pages_without_sorting(self):
+        cursor = self.client.get('/api/images?limit=2').get_json()['next_cursor']
+
+        # Sorting the whole table for every page would make page cost grow with the library
+        for url in ('/api/images?limit=2', f'/api/images?limit=2&cursor={cursor}'):
+            plan = self._listing_plan(url)
+            self.assertNotIn('TEMP B-TREE', plan, url)
+            self.assertIn('ix_image_status_created_at_id', plan, url)
+
+class APIListImagesQueryCountTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'WTF_CSRF_ENABLED': False
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _add_images(self, start, count):
+        with self.app.app_context():
+            for i in range(start, start + count):
+                # One author per image so lazy loads cannot hit the identity map
+                user = User(username=f'user{i}')
+                db.session.add(user)
+                db.session.flush()
+                db.session.add(Image(filename=f'{user.username}.bmp', user_id=user.id))
+            db.session.commit()
+
+    def _count_list_queries(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.get('/api/images')
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        self.assertEqual(response.status_code, 200)
+        return len(statements), response.get_json()
+
+    def test_query_count_independent_of_row_count(self):
+        self._add_images(0, 2)
+        few_queries, data = self._count_list_queries()
+        self.assertEqual(len(data['images']), 2)
+
+        self._add_images(2, 20)
+        many_queries, data = self._count_list_queries()
+        self.assertEqual(len(data['images']), 22)
+
+        self.assertEqual(few_queries, many_queries)
+        for img in data['images']:
+            self.assertEqual(img['filename'], img['username'] + '.bmp')
+
 if __name__ == '__main__':
     unittest.main()
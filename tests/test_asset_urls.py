@@ -0,0 +1,82 @@
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import base64
+from app import create_app, db
+from models import User, Image
+from PIL import Image as PILImage
+
+class AssetURLTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': []
+        })
+        self.app.executor = None
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _save_drawing(self):
+        img_byte_arr = io.BytesIO()
+        PILImage.new('RGB', (4, 2), 'red').save(img_byte_arr, format='PNG')
+        data_url = 'data:image/png;base64,' + base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+        return self.client.post('/save_drawing', json={'image': data_url}).get_json()['id']
+
+    def _url(self):
+        return self.client.get('/api/images?fields=url').get_json()['images'][0]['url']
+
+    def test_content_addressed_url_uses_hash(self):
+        image_id = self._save_drawing()
+        with self.app.app_context():
+            filename = db.session.get(Image, image_id).filename
+        digest = os.path.basename(filename).split('.')[0]
+        self.assertTrue(self._url().endswith(f'/api/files/{digest[:16]}/{filename}'))
+
+    def test_served_immutable(self):
+        self._save_drawing()
+        response = self.client.get(self._url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/bmp')
+        self.assertEqual(response.cache_control.max_age, 365 * 24 * 60 * 60)
+        self.assertTrue(response.cache_control.immutable)
+        self.assertTrue(response.cache_control.public)
+
+    def test_range_request(self):
+        self._save_drawing()
+        url = self._url()
+        full = self.client.get(url).data
+        response = self.client.get(url, headers={'Range': 'bytes=0-1'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, full[:2])
+
+    def test_stale_fingerprint_redirects(self):
+        with open(os.path.join(self.test_dir, 'legacy.bmp'), 'wb') as f:
+            f.write(b'old')
+        url = '/api/files/0123456789abcdef/legacy.bmp'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(response.location).data, b'old')
+
+    def test_paths_outside_upload_folder_rejected(self):
+        self.assertEqual(self.client.get('/api/files/0123456789abcdef/../app.db').status_code, 404)
+        self.assertEqual(self.client.get('/api/files/0123456789abcdef/missing.bmp').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
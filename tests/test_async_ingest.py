@@ -0,0 +1,145 @@
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import base64
+from unittest.mock import patch
+from app import create_app, db
+from models import User, Image
+from PIL import Image as PILImage
+
+class DeferredExecutor:
+    """Executor stand-in that holds submitted jobs until run_all() is called."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.jobs.append((fn, args, kwargs))
+
+    def run_all(self):
+        jobs, self.jobs = self.jobs, []
+        for fn, args, kwargs in jobs:
+            fn(*args, **kwargs)
+
+class AsyncIngestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir
+        })
+        self.app.executor = DeferredExecutor()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _save_drawing(self, color='red', **fields):
+        img_byte_arr = io.BytesIO()
+        PILImage.new('RGB', (2, 2), color=color).save(img_byte_arr, format='PNG')
+        data_url = 'data:image/png;base64,' + base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+        response = self.client.post('/save_drawing', json=dict(fields, image=data_url))
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_save_returns_pending_id_before_file_is_written(self):
+        data = self._save_drawing()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['status'], 'pending')
+        self.assertEqual(os.listdir(self.test_dir), [])
+
+        status = self.client.get(f"/api/image/{data['id']}/status").get_json()
+        self.assertEqual(status['status'], 'pending')
+
+        response = self.client.get(f"/api/image/{data['id']}/rgb")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get('/api/images').get_json()['images'], [])
+
+    def test_worker_marks_ready(self):
+        data = self._save_drawing()
+        self.app.executor.run_all()
+
+        status = self.client.get(f"/api/image/{data['id']}/status").get_json()
+        self.assertEqual(status['status'], 'ready')
+
+        response = self.client.get(f"/api/image/{data['id']}/rgb")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['pixels'][0], [255, 0, 0])
+        self.assertEqual(len(self.client.get('/api/images').get_json()['images']), 1)
+
+    def test_worker_failure_marks_failed(self):
+        data = self._save_drawing()
+        with patch('utils.os.fsync', side_effect=OSError('Disk full')):
+            self.app.executor.run_all()
+
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Image, data['id']).status, 'failed')
+        # The partially written temporary file was removed
+        self.assertEqual([files for _, _, files in os.walk(self.test_dir) if files], [])
+
+    def test_delete_while_pending_removes_file(self):
+        data = self._save_drawing()
+        self.assertEqual(self.client.delete(f"/api/image/{data['id']}").status_code, 200)
+        self.app.executor.run_all()
+        self.assertEqual([files for _, _, files in os.walk(self.test_dir) if files], [])
+
+    def test_delete_during_pending_edit_removes_file(self):
+        image_id = self._save_drawing()['id']
+        self.app.executor.run_all()
+        self._save_drawing('blue', image_id=image_id)
+        self.assertEqual(self.client.delete(f'/api/image/{image_id}').status_code, 200)
+        self.app.executor.run_all()
+        self.assertEqual([files for _, _, files in os.walk(self.test_dir) if files], [])
+
+    def test_pending_edit_keeps_serving_previous_version(self):
+        image_id = self._save_drawing()['id']
+        self.app.executor.run_all()
+
+        data = self._save_drawing('blue', image_id=image_id, display_name='Panel')
+        self.assertEqual((data['id'], data['status'], data['version']), (image_id, 'pending', 2))
+
+        status = self.client.get(f'/api/image/{image_id}/status').get_json()
+        self.assertEqual((status['status'], status['version']), ('ready', 1))
+        response = self.client.get(f'/api/image/{image_id}/rgb')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['pixels'][0], [255, 0, 0])
+        self.assertEqual(len(self.client.get('/api/images').get_json()['images']), 1)
+
+        self.app.executor.run_all()
+        data = self.client.get(f'/api/image/{image_id}/rgb').get_json()
+        self.assertEqual(data['pixels'][0], [0, 0, 255])
+        self.assertEqual(data['display_name'], 'Panel')
+        self.assertEqual(self.client.get(f'/api/image/{image_id}/status').get_json()['version'], 2)
+
+    def test_failed_edit_keeps_previous_version(self):
+        image_id = self._save_drawing()['id']
+        self.app.executor.run_all()
+
+        self._save_drawing('blue', image_id=image_id, display_name='Panel')
+        with patch('utils.os.fsync', side_effect=OSError('Disk full')):
+            self.app.executor.run_all()
+
+        with self.app.app_context():
+            img = db.session.get(Image, image_id)
+            self.assertEqual((img.status, img.version, img.display_name), ('ready', 1, None))
+            self.assertEqual(img.versions, [])
+        response = self.client.get(f'/api/image/{image_id}/rgb')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['pixels'][0], [255, 0, 0])
+        self.assertEqual(len(self.client.get('/api/images').get_json()['images']), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import json
+import os
+import tempfile
+from benchmarks.api_benchmark import SCENARIOS, percentile, parse_sizes, run_benchmark, main
+
+class TestBenchmarkHelpers(unittest.TestCase):
+    def test_percentile(self):
+        values = [1, 2, 3, 4, 5]
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 100), 5)
+        self.assertAlmostEqual(percentile(values, 95), 4.8)
+        self.assertIsNone(percentile([], 50))
+
+    def test_parse_sizes(self):
+        self.assertEqual(parse_sizes('32x16,64X32'), [(32, 16), (64, 32)])
+
+class BenchmarkSmokeTestCase(unittest.TestCase):
+    def test_every_scenario_runs(self):
+        report = run_benchmark(users=2, images=4, sizes=[(8, 4), (16, 8)], requests=6, concurrency=2,
+                               config={'RENDER_PROCESSES': 0})
+        self.assertEqual(list(report['results']), list(SCENARIOS))
+        for scenario, result in report['results'].items():
+            self.assertEqual(result['requests'], 6, scenario)
+            self.assertEqual(result['errors'], 0, scenario)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+        # The report is plain JSON
+        json.dumps(report)
+
+    def test_cli_writes_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'report.json')
+            main(['--users', '1', '--images', '2', '--requests', '2', '--concurrency', '1',
+                  '--scenarios', 'list_images,image_rgb', '--output', output])
+            with open(output) as f:
+                report = json.load(f)
+        self.assertEqual(list(report['results']), ['list_images', 'image_rgb'])
+
+    def test_unknown_scenario(self):
+        with self.assertRaises(ValueError):
+            run_benchmark(scenarios=['nope'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import zipfile
+from unittest.mock import patch
+from sqlalchemy.exc import SQLAlchemyError
+from app import create_app, db
+from models import User, Image, ImageVariant
+from PIL import Image as PILImage
+from test_animation import animated_gif
+
+def png(color, size=(4, 4)):
+    buf = io.BytesIO()
+    PILImage.new('RGB', size, color).save(buf, 'PNG')
+    return buf.getvalue()
+
+class BulkImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': [{'name': 'Panel', 'width': 2, 'height': 2}],
+            'RENDER_PROCESSES': 2
+        })
+        # Render variants in the request so they can be checked afterwards
+        self.app.executor = None
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        self.app.render_pool.shutdown(wait=True)
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _import(self, files, **form):
+        data = dict(form, files=[(io.BytesIO(content), name) for name, content in files])
+        return self.client.post('/api/images/import', data=data, content_type='multipart/form-data')
+
+    def _zip(self, entries):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w') as archive:
+            for name, content in entries:
+                archive.writestr(name, content)
+        return buf.getvalue()
+
+    def test_multipart_batch_with_report(self):
+        response = self._import([('red.png', png('red')), ('bad.png', b'not an image'), ('blue.png', png('blue'))],
+                                display_name='Panel', scroll_direction='left', scroll_speed='5')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual((data['imported'], data['failed']), (2, 1))
+        self.assertEqual([item['status'] for item in data['items']], ['imported', 'failed', 'imported'])
+        self.assertEqual(data['items'][1]['name'], 'bad.png')
+        self.assertIn('error', data['items'][1])
+
+        with self.app.app_context():
+            images = Image.query.order_by(Image.id).all()
+            self.assertEqual([img.id for img in images], [data['items'][0]['id'], data['items'][2]['id']])
+            img = images[0]
+            self.assertEqual((img.display_name, img.scroll_direction, img.scroll_speed, img.status),
+                             ('Panel', 'left', 5, 'ready'))
+            # Scrolling left keeps the width and fits the height
+            self.assertEqual((img.width, img.height), (2, 2))
+            self.assertTrue(os.path.exists(os.path.join(self.test_dir, img.filename)))
+            self.assertEqual(ImageVariant.query.count(), 2)
+
+    def test_zip_archive(self):
+        archive = self._zip([('sprites/a.png', png('red')), ('sprites/.hidden.png', png('red')),
+                             ('__MACOSX/sprites/._a.png', b'junk'), ('sprites/b.png', png('green'))])
+        data = self._import([('sprites.zip', archive)]).get_json()
+        self.assertEqual([item['name'] for item in data['items']], ['sprites/a.png', 'sprites/b.png'])
+        self.assertEqual(data['imported'], 2)
+
+    def test_duplicates_share_one_file(self):
+        data = self._import([('a.png', png('red')), ('b.png', png('red'))]).get_json()
+        self.assertEqual(data['imported'], 2)
+        with self.app.app_context():
+            self.assertEqual(len({img.filename for img in Image.query}), 1)
+
+    def test_single_transaction(self):
+        with patch('utils.db.session.commit') as commit:
+            self._import([('a.png', png('red')), ('b.png', png('blue')), ('c.png', png('green'))])
+        # One commit for the batch, one per image for its display variants
+        self.assertEqual(commit.call_count, 1 + 3)
+
+    def test_database_error_removes_written_files(self):
+        with patch('utils.db.session.commit', side_effect=SQLAlchemyError('DB Error')):
+            response = self._import([('a.png', png('red'))])
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual([files for _, _, files in os.walk(self.test_dir) if files], [])
+
+    def test_oversized_zip_entry_is_not_inflated(self):
+        self.app.config['MAX_CONTENT_LENGTH'] = 1024
+        archive = self._zip([('big.bmp', b'\0' * 4096), ('ok.png', png('red'))])
+        data = self._import([('batch.zip', archive)]).get_json()
+        self.assertEqual([item['status'] for item in data['items']], ['failed', 'imported'])
+
+    def test_animation_keeps_every_frame(self):
+        data = self._import([('anim.gif', animated_gif().getvalue())]).get_json()
+        self.assertEqual(data['imported'], 1)
+        self.client.post('/upload', data={'file': (animated_gif(), 'anim.gif')}, content_type='multipart/form-data')
+        with self.app.app_context():
+            imported, uploaded = Image.query.order_by(Image.id).all()
+            self.assertEqual((imported.width, imported.height, imported.frame_count), (4, 2, 3))
+            self.assertEqual(imported.frame_durations, [100, 200, 300])
+            # Stored the same way as through /upload, so both share one file
+            self.assertEqual(imported.content_hash, uploaded.content_hash)
+            self.assertEqual(imported.filename, uploaded.filename)
+            with PILImage.open(os.path.join(self.test_dir, imported.filename)) as strip:
+                self.assertEqual(strip.size, (4, 6))
+
+    def test_animation_over_frame_limit_fails(self):
+        self.app.config['ANIMATION_MAX_FRAMES'] = 2
+        data = self._import([('anim.gif', animated_gif().getvalue()), ('a.png', png('red'))]).get_json()
+        self.assertEqual([item['status'] for item in data['items']], ['failed', 'imported'])
+
+    def test_item_limit_checked_before_inflating(self):
+        self.app.config['IMPORT_MAX_ITEMS'] = 2
+        archive = self._zip([(f'{i}.png', png('red')) for i in range(3)])
+        with patch('zipfile.ZipFile.read', side_effect=zipfile.ZipFile.read, autospec=True) as read:
+            response = self._import([('batch.zip', archive)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(read.call_count, 2)
+        with self.app.app_context():
+            self.assertEqual(Image.query.count(), 0)
+
+    def test_total_size_limit(self):
+        archive = self._zip([('a.png', png('red')), ('b.bmp', b'\0' * 4096)])
+        self.app.config['IMPORT_MAX_TOTAL_BYTES'] = 4096
+        with patch('zipfile.ZipFile.read', side_effect=zipfile.ZipFile.read, autospec=True) as read:
+            response = self._import([('batch.zip', archive)])
+        self.assertEqual(response.status_code, 400)
+        # The entry that would exceed the limit is never inflated
+        self.assertEqual(read.call_count, 1)
+
+    def test_imports_in_chunks(self):
+        self.app.config['IMPORT_CHUNK_SIZE'] = 2
+        colors = ['red', 'green', 'blue', 'yellow', 'red']
+        with patch('utils.db.session.commit', side_effect=db.session.commit) as commit:
+            data = self._import([(f'{i}.png', png(color)) for i, color in enumerate(colors)]
+                                + [('bad.png', b'not an image')]).get_json()
+        self.assertEqual(commit.call_count, 1 + 5)
+        self.assertEqual([item['status'] for item in data['items']], ['imported'] * 5 + ['failed'])
+        with self.app.app_context():
+            for item, color in zip(data['items'], colors):
+                img = db.session.get(Image, item['id'])
+                with PILImage.open(os.path.join(self.test_dir, img.filename)) as stored:
+                    self.assertEqual(stored.getpixel((0, 0)), PILImage.new('RGB', (1, 1), color).getpixel((0, 0)))
+                # Variants were rendered from the stored file
+                self.assertEqual(ImageVariant.query.filter_by(image_id=img.id).count(), 1)
+
+    def test_database_error_in_later_chunk_removes_earlier_files(self):
+        self.app.config['IMPORT_CHUNK_SIZE'] = 1
+        with patch('utils.db.session.commit', side_effect=SQLAlchemyError('DB Error')):
+            response = self._import([('a.png', png('red')), ('b.png', png('blue'))])
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual([files for _, _, files in os.walk(self.test_dir) if files], [])
+        with self.app.app_context():
+            self.assertEqual(Image.query.count(), 0)
+
+    def test_publishes_changes(self):
+        since = self.app.change_feed.last_id
+        data = self._import([('a.png', png('red'))]).get_json()
+        changes = self.app.change_feed.changes_since(since)[0]
+        self.assertEqual([(c['type'], c['image_id']) for c in changes], [('created', data['items'][0]['id'])])
+
+    def test_rejects_empty_and_unknown_display(self):
+        self.assertEqual(self._import([]).status_code, 400)
+        self.assertEqual(self._import([('a.png', png('red'))], display_name='Nope').status_code, 400)
+
+    def test_requires_login(self):
+        self.client.get('/logout')
+        response = self._import([('a.png', png('red'))])
+        self.assertNotEqual(response.status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import tempfile
+import shutil
+import io
+import json
+import base64
+import threading
+from app import create_app, db
+from models import User, Image
+from change_feed import ChangeFeed
+from PIL import Image as PILImage
+
+class TestChangeFeed(unittest.TestCase):
+    def test_ids_increase_and_filter_by_display(self):
+        feed = ChangeFeed()
+        self.assertEqual(feed.publish('created', 1, display_name='A'), 1)
+        self.assertEqual(feed.publish('created', 2, display_name='B'), 2)
+        feed.publish('updated', 3, display_name='B', previous_display_name='A')
+
+        changes, last_id, reset = feed.changes_since(0, display_name='A')
+        self.assertEqual([c['image_id'] for c in changes], [1, 3])
+        self.assertEqual((last_id, reset), (3, False))
+        self.assertEqual(feed.changes_since(3)[0], [])
+
+    def test_reset_when_events_were_missed(self):
+        feed = ChangeFeed(history=2)
+        for image_id in range(4):
+            feed.publish('created', image_id)
+        self.assertTrue(feed.changes_since(1)[2])
+        self.assertFalse(feed.changes_since(2)[2])
+        # An id from an earlier process
+        self.assertTrue(feed.changes_since(10)[2])
+
+    def test_wait_wakes_on_publish(self):
+        feed = ChangeFeed()
+        timer = threading.Timer(0.05, feed.publish, args=('deleted', 7))
+        timer.start()
+        changes, last_id, _ = feed.wait(0, timeout=5)
+        timer.join()
+        self.assertEqual([(c['type'], c['image_id']) for c in changes], [('deleted', 7)])
+        self.assertEqual(last_id, 1)
+
+    def test_wait_times_out(self):
+        feed = ChangeFeed()
+        feed.publish('created', 1, display_name='A')
+        changes, last_id, reset = feed.wait(1, timeout=0.01, display_name='A')
+        self.assertEqual((changes, last_id, reset), ([], 1, False))
+
+class ChangeFeedAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir
+        })
+        # Save synchronously so each save is a single commit
+        self.app.executor = None
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _save_drawing(self, **fields):
+        img_byte_arr = io.BytesIO()
+        PILImage.new('RGB', (2, 2), color='red').save(img_byte_arr, format='PNG')
+        data_url = 'data:image/png;base64,' + base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+        return self.client.post('/save_drawing', json={'image': data_url, **fields}).get_json()
+
+    def test_create_update_delete_are_published(self):
+        since = self.app.change_feed.last_id
+        image_id = self._save_drawing(display_name='A')['id']
+        self._save_drawing(image_id=image_id, display_name='B')
+        self.client.delete(f'/api/image/{image_id}')
+
+        data = self.client.get(f'/api/changes?since={since}&timeout=0').get_json()
+        self.assertFalse(data['reset'])
+        self.assertEqual([(c['type'], c['image_id']) for c in data['changes']],
+                         [('created', image_id), ('updated', image_id), ('deleted', image_id)])
+        self.assertEqual(data['changes'][1]['version'], 2)
+        self.assertEqual(data['changes'][1]['previous_display_name'], 'A')
+        self.assertEqual(data['last_id'], data['changes'][-1]['id'])
+
+    def test_display_filter(self):
+        since = self.app.change_feed.last_id
+        self._save_drawing(display_name='A')
+        b_id = self._save_drawing(display_name='B')['id']
+
+        data = self.client.get(f'/api/changes?since={since}&timeout=0&display_name=B').get_json()
+        self.assertEqual([c['image_id'] for c in data['changes']], [b_id])
+
+    def test_rolled_back_changes_are_not_published(self):
+        since = self.app.change_feed.last_id
+        with self.app.app_context():
+            db.session.add(Image(filename='x.bmp', user_id=1, width=1, height=1))
+            db.session.flush()
+            db.session.rollback()
+        self.assertEqual(self.app.change_feed.changes_since(since)[0], [])
+
+    def test_long_poll_times_out_empty(self):
+        data = self.client.get('/api/changes?timeout=0').get_json()
+        self.assertEqual(data['changes'], [])
+
+    def test_stream_sends_events(self):
+        image_id = self._save_drawing(display_name='A')['id']
+        response = self.client.get('/api/changes/stream', headers={'Last-Event-ID': '0'})
+        self.assertEqual(response.mimetype, 'text/event-stream')
+
+        chunk = next(iter(response.response))
+        response.close()
+        lines = chunk.decode('utf-8').split('\n')
+        self.assertEqual(lines[1], 'event: created')
+        self.assertEqual(json.loads(lines[2][len('data: '):])['image_id'], image_id)
+
+if __name__ == '__main__':
+    unittest.main()
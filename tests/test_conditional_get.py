@@ -0,0 +1,148 @@
+import unittest
+import tempfile
+import shutil
+import os
+from unittest.mock import patch
+from app import create_app, db
+from models import User, Image, LibraryRevision
+from sqlalchemy import event, insert
+from PIL import Image as PILImage
+
+class ConditionalGetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+            self.user_id = u.id
+
+            PILImage.new('RGB', (2, 2), color='red').save(os.path.join(self.test_dir, 'etag.bmp'))
+            db_img = Image(filename='etag.bmp', user_id=u.id, width=2, height=2)
+            db.session.add(db_img)
+            db.session.commit()
+            self.img_id = db_img.id
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_rgb_sets_cache_headers(self):
+        response = self.client.get(f'/api/image/{self.img_id}/rgb')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.headers.get('ETag'))
+        self.assertFalse(response.headers['ETag'].startswith('W/'))
+        self.assertIn('must-revalidate', response.headers['Cache-Control'])
+
+    def test_rgb_not_modified_skips_loading(self):
+        etag = self.client.get(f'/api/image/{self.img_id}/rgb').headers['ETag']
+
+        with patch('blueprints.api.load_image_data') as mock_load:
+            response = self.client.get(f'/api/image/{self.img_id}/rgb', headers={'If-None-Match': etag})
+            mock_load.assert_not_called()
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_rgb_etag_changes_with_metadata(self):
+        etag = self.client.get(f'/api/image/{self.img_id}/rgb').headers['ETag']
+
+        with self.app.app_context():
+            img = db.session.get(Image, self.img_id)
+            img.scroll_speed = 7
+            db.session.commit()
+
+        response = self.client.get(f'/api/image/{self.img_id}/rgb', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.get_json()['scroll_speed'], 7)
+
+    def test_rgb_etag_changes_with_file(self):
+        etag = self.client.get(f'/api/image/{self.img_id}/rgb').headers['ETag']
+
+        filepath = os.path.join(self.test_dir, 'etag.bmp')
+        PILImage.new('RGB', (2, 2), color='blue').save(filepath)
+        stat = os.stat(filepath)
+        os.utime(filepath, (stat.st_atime, stat.st_mtime + 10))
+
+        response = self.client.get(f'/api/image/{self.img_id}/rgb', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['pixels'][0], [0, 0, 255])
+
+    def test_packed_etag_differs_per_format(self):
+        etag_888 = self.client.get(f'/api/image/{self.img_id}/packed').headers['ETag']
+        etag_565 = self.client.get(f'/api/image/{self.img_id}/packed?format=rgb565').headers['ETag']
+        self.assertNotEqual(etag_888, etag_565)
+
+        response = self.client.get(f'/api/image/{self.img_id}/packed', headers={'If-None-Match': etag_888})
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_not_modified_until_insert(self):
+        etag = self.client.get('/api/images').headers['ETag']
+
+        response = self.client.get('/api/images', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        with self.app.app_context():
+            db.session.add(Image(filename='other.bmp', user_id=self.user_id, width=1, height=1))
+            db.session.commit()
+
+        response = self.client.get('/api/images', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['images']), 2)
+
+    def test_list_revalidation_is_one_primary_key_read(self):
+        etag = self.client.get('/api/images').headers['ETag']
+        with self.app.app_context():
+            statements = []
+            listener = lambda conn, cursor, statement, *args: statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                response = self.client.get('/api/images', headers={'If-None-Match': etag})
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(statements), 1)
+        self.assertIn('library_revision', statements[0])
+
+    def test_revision_bumped_by_update_and_delete(self):
+        with self.app.app_context():
+            start = LibraryRevision.current()
+            img = db.session.get(Image, self.img_id)
+            img.display_name = 'Panel'
+            db.session.commit()
+            self.assertEqual(LibraryRevision.current(), start + 1)
+
+            db.session.delete(img)
+            db.session.commit()
+            self.assertEqual(LibraryRevision.current(), start + 2)
+
+    def test_revision_not_bumped_by_rollback(self):
+        with self.app.app_context():
+            start = LibraryRevision.current()
+            db.session.add(Image(filename='other.bmp', user_id=self.user_id, width=1, height=1))
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(LibraryRevision.current(), start)
+
+    def test_revision_bumped_by_bulk_insert(self):
+        with self.app.app_context():
+            start = LibraryRevision.current()
+            db.session.execute(insert(Image), [{'filename': 'a.bmp', 'user_id': self.user_id},
+                                               {'filename': 'b.bmp', 'user_id': self.user_id}])
+            db.session.commit()
+            self.assertEqual(LibraryRevision.current(), start + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import base64
+from app import create_app, db
+from models import User, Image
+from PIL import Image as PILImage
+
+class ContentStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            # No display variants, so only image files are stored
+            'DISPLAYS': []
+        })
+        # Save synchronously so files exist when the request returns
+        self.app.executor = None
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            for username in ['test', 'other']:
+                u = User(username=username)
+                u.set_password('password')
+                db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _save_drawing(self, color):
+        img_byte_arr = io.BytesIO()
+        PILImage.new('RGB', (4, 4), color=color).save(img_byte_arr, format='PNG')
+        data_url = 'data:image/png;base64,' + base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+        data = self.client.post('/save_drawing', json={'image': data_url}).get_json()
+        self.assertTrue(data['success'])
+        with self.app.app_context():
+            img = db.session.get(Image, data['id'])
+            return img.id, img.filename
+
+    def _stored_files(self):
+        return sorted(name for _, _, files in os.walk(self.test_dir) for name in files)
+
+    def test_identical_drawings_share_one_file(self):
+        first_id, first_file = self._save_drawing('red')
+        second_id, second_file = self._save_drawing('red')
+        _, other_file = self._save_drawing('blue')
+
+        self.assertNotEqual(first_id, second_id)
+        self.assertEqual(first_file, second_file)
+        self.assertNotEqual(first_file, other_file)
+        self.assertEqual(len(self._stored_files()), 2)
+
+        # Sharded as <aa>/<bb>/<hash>.bmp
+        digest = os.path.basename(first_file)[:-len('.bmp')]
+        self.assertEqual(first_file, f'{digest[:2]}/{digest[2:4]}/{digest}.bmp')
+
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Image, first_id).reference_count(), 2)
+
+    def test_delete_keeps_file_until_last_reference(self):
+        first_id, filename = self._save_drawing('red')
+        second_id, _ = self._save_drawing('red')
+        filepath = os.path.join(self.test_dir, filename)
+
+        response = self.client.delete(f'/api/image/{first_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(os.path.exists(filepath))
+
+        response = self.client.get(f'/api/image/{second_id}/rgb')
+        self.assertEqual(response.status_code, 200)
+
+        self.client.delete(f'/api/image/{second_id}')
+        self.assertFalse(os.path.exists(filepath))
+
+    def test_delete_requires_owner(self):
+        image_id, _ = self._save_drawing('red')
+        self.client.get('/logout')
+        self.client.post('/login', data={'username': 'other', 'password': 'password'})
+
+        response = self.client.delete(f'/api/image/{image_id}')
+        self.assertEqual(response.status_code, 403)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import tempfile
+import shutil
+import os
+from sqlalchemy import create_engine, text
+from app import create_app, db
+from database import engine_options
+from models import User, Image
+
+class TestEngineOptions(unittest.TestCase):
+    def _config(self, uri):
+        return {
+            'SQLALCHEMY_DATABASE_URI': uri,
+            'DATABASE_POOL_SIZE': 5,
+            'DATABASE_MAX_OVERFLOW': 2,
+            'DATABASE_POOL_TIMEOUT': 30,
+            'DATABASE_POOL_RECYCLE': 1800,
+            'SQLITE_BUSY_TIMEOUT_MS': 2500,
+        }
+
+    def test_server_database_gets_pool(self):
+        options = engine_options(self._config('postgresql+psycopg2://fpac@localhost/fpac'))
+        self.assertEqual((options['pool_size'], options['max_overflow']), (5, 2))
+        self.assertTrue(options['pool_pre_ping'])
+
+    def test_sqlite_gets_lock_timeout(self):
+        options = engine_options(self._config('sqlite:///app.db'))
+        self.assertEqual(options, {'connect_args': {'timeout': 2.5}})
+
+# Schema of the first release, before any columns were added to image
+BASELINE_SCHEMA = (
+    "CREATE TABLE user (id INTEGER NOT NULL, username VARCHAR(64) NOT NULL, password_hash VARCHAR(256), "
+    "PRIMARY KEY (id), UNIQUE (username))",
+    "CREATE TABLE image (id INTEGER NOT NULL, filename VARCHAR(128) NOT NULL, user_id INTEGER NOT NULL, "
+    "created_at DATETIME, width INTEGER, height INTEGER, display_name VARCHAR(64), scroll_direction VARCHAR(10), "
+    "scroll_speed INTEGER, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id))",
+    "CREATE INDEX ix_image_created_at ON image (created_at)",
+    "INSERT INTO user (id, username) VALUES (1, 'old')",
+    "INSERT INTO image (id, filename, user_id, created_at, width, height) "
+    "VALUES (1, 'old.bmp', 1, '2024-01-01 00:00:00.000000', 8, 4)",
+)
+
+class SchemaUpgradeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.uri = 'sqlite:///' + os.path.join(self.test_dir, 'app.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_baseline_database_is_upgraded(self):
+        engine = create_engine(self.uri)
+        with engine.begin() as connection:
+            for statement in BASELINE_SCHEMA:
+                connection.execute(text(statement))
+        engine.dispose()
+
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': self.uri,
+            'UPLOAD_FOLDER': os.path.join(self.test_dir, 'uploads')
+        })
+        response = app.test_client().get('/api/images')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([img['filename'] for img in response.get_json()['images']], ['old.bmp'])
+        with app.app_context():
+            image = db.session.get(Image, 1)
+            self.assertEqual((image.status, image.version, image.frame_count), ('ready', 1, 1))
+            self.assertIsNone(image.content_hash)
+            names = db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars().all()
+            self.assertIn('ix_image_status_created_at_id', names)
+            self.assertIn('ix_image_content_hash', names)
+            db.session.remove()
+            db.engine.dispose()
+
+class SQLiteSettingsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.test_dir, 'app.db'),
+            'UPLOAD_FOLDER': os.path.join(self.test_dir, 'uploads'),
+            'SQLITE_BUSY_TIMEOUT_MS': 1234
+        })
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(self.test_dir)
+
+    def test_pragmas_applied(self):
+        with self.app.app_context():
+            pragma = lambda name: db.session.execute(text(f'PRAGMA {name}')).scalar()
+            self.assertEqual(pragma('journal_mode'), 'wal')
+            self.assertEqual(pragma('busy_timeout'), 1234)
+            # NORMAL
+            self.assertEqual(pragma('synchronous'), 1)
+
+    def test_commit_does_not_wait_for_readers(self):
+        with self.app.app_context():
+            # A device poll in the middle of a read transaction on its own connection
+            reader = db.engine.raw_connection()
+            try:
+                cursor = reader.cursor()
+                cursor.execute('BEGIN')
+                self.assertEqual(cursor.execute('SELECT COUNT(*) FROM image').fetchone(), (0,))
+
+                # Without WAL this commit would wait for the reader and time out
+                db.session.add(Image(filename='a.bmp', user_id=1, width=1, height=1))
+                db.session.commit()
+
+                # The reader keeps its snapshot until its transaction ends
+                self.assertEqual(cursor.execute('SELECT COUNT(*) FROM image').fetchone(), (0,))
+                cursor.execute('COMMIT')
+                self.assertEqual(cursor.execute('SELECT COUNT(*) FROM image').fetchone(), (1,))
+            finally:
+                reader.close()
+
+    def test_explicit_engine_options_win(self):
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': os.path.join(self.test_dir, 'uploads'),
+            'SQLALCHEMY_ENGINE_OPTIONS': {'echo': False}
+        })
+        self.assertEqual(app.config['SQLALCHEMY_ENGINE_OPTIONS'], {'echo': False})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import base64
+from app import create_app, db
+from models import User, Image, ImageVersion
+from packing import (DELTA_HEADER, DELTA_MAGIC, DELTA_RECORD, DELTA_KIND_RUNS, DELTA_KIND_FULL,
+                     encode_delta_runs, pack_delta)
+from PIL import Image as PILImage
+
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+BLACK = (0, 0, 0)
+
+class TestDeltaEncoding(unittest.TestCase):
+    def test_runs_merge_same_colour(self):
+        old = bytes(BLACK) * 8
+        new = bytes(BLACK) * 2 + bytes(RED) * 3 + bytes(BLUE) + bytes(BLACK) * 2
+        records = encode_delta_runs(old, new, 4)
+        self.assertEqual(list(DELTA_RECORD.iter_unpack(records)), [
+            (2, 3, bytes(RED)),
+            (5, 1, bytes(BLUE)),
+        ])
+
+    def test_unchanged_buffers_have_no_records(self):
+        rgb = bytes(RED) * 6
+        self.assertEqual(encode_delta_runs(rgb, memoryview(rgb), 3), b'')
+
+    def test_full_frame_fallback(self):
+        rgb = bytes(RED) * 2
+        payload = pack_delta(1, 2, 2, 1, rgb, None)
+        _, _, kind, _, _, _, _, count = DELTA_HEADER.unpack_from(payload)
+        self.assertEqual((kind, count), (DELTA_KIND_FULL, 0))
+        self.assertEqual(payload[DELTA_HEADER.size:], rgb)
+
+        # Records at least as large as the frame also fall back
+        records = DELTA_RECORD.pack(0, 1, bytes(RED))
+        payload = pack_delta(1, 2, 2, 1, rgb, records)
+        self.assertEqual(DELTA_HEADER.unpack_from(payload)[2], DELTA_KIND_FULL)
+
+class DeltaAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            # No display variants, so only image files are stored
+            'DISPLAYS': []
+        })
+        # Save synchronously so files exist when the request returns
+        self.app.executor = None
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            for username in ['test', 'other']:
+                u = User(username=username)
+                u.set_password('password')
+                db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _save_drawing(self, pil_image, **fields):
+        img_byte_arr = io.BytesIO()
+        pil_image.save(img_byte_arr, format='PNG')
+        data_url = 'data:image/png;base64,' + base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+        return self.client.post('/save_drawing', json={'image': data_url, **fields})
+
+    def _drawing(self, size=(64, 32), dots=()):
+        img = PILImage.new('RGB', size, BLACK)
+        for xy in dots:
+            img.putpixel(xy, RED)
+        return img
+
+    def test_edit_creates_new_version(self):
+        data = self._save_drawing(self._drawing(), display_name='Panel', scroll_direction='left').get_json()
+        self.assertEqual(data['version'], 1)
+
+        data = self._save_drawing(self._drawing(dots=[(1, 0)]), image_id=data['id']).get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['version'], 2)
+
+        with self.app.app_context():
+            img = db.session.get(Image, data['id'])
+            self.assertEqual(img.version, 2)
+            # Metadata that was not sent is kept
+            self.assertEqual((img.display_name, img.scroll_direction), ('Panel', 'left'))
+            self.assertEqual([v.version for v in img.versions], [1])
+            self.assertEqual(Image.query.count(), 1)
+
+    def test_edit_requires_owner(self):
+        data = self._save_drawing(self._drawing()).get_json()
+        self.client.get('/logout')
+        self.client.post('/login', data={'username': 'other', 'password': 'password'})
+
+        response = self._save_drawing(self._drawing(dots=[(0, 0)]), image_id=data['id'])
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self._save_drawing(self._drawing(), image_id=999).status_code, 404)
+
+    def test_delta_contains_only_changed_runs(self):
+        image_id = self._save_drawing(self._drawing()).get_json()['id']
+        self._save_drawing(self._drawing(dots=[(1, 0), (2, 0), (5, 3)]), image_id=image_id)
+
+        response = self.client.get(f'/api/image/{image_id}/delta?since=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Image-Version'], '2')
+
+        magic, _, kind, since, version, width, height, count = DELTA_HEADER.unpack_from(response.data)
+        self.assertEqual(magic, DELTA_MAGIC)
+        self.assertEqual((kind, since, version, width, height, count), (DELTA_KIND_RUNS, 1, 2, 64, 32, 2))
+        self.assertEqual(list(DELTA_RECORD.iter_unpack(response.data[DELTA_HEADER.size:])), [
+            (1, 2, bytes(RED)),
+            (3 * 64 + 5, 1, bytes(RED)),
+        ])
+        # Tens of bytes instead of a 6 KiB frame
+        self.assertLess(len(response.data), 64)
+
+    def test_delta_since_current_version_is_empty(self):
+        image_id = self._save_drawing(self._drawing()).get_json()['id']
+        response = self.client.get(f'/api/image/{image_id}/delta?since=1')
+        self.assertEqual(len(response.data), DELTA_HEADER.size)
+        self.assertEqual(DELTA_HEADER.unpack_from(response.data)[-1], 0)
+
+    def test_full_frame_when_dimensions_change(self):
+        image_id = self._save_drawing(self._drawing()).get_json()['id']
+        self._save_drawing(self._drawing(size=(4, 2)), image_id=image_id)
+
+        response = self.client.get(f'/api/image/{image_id}/delta?since=1')
+        _, _, kind, _, _, width, height, _ = DELTA_HEADER.unpack_from(response.data)
+        self.assertEqual((kind, width, height), (DELTA_KIND_FULL, 4, 2))
+        self.assertEqual(response.data[DELTA_HEADER.size:], bytes(BLACK) * 8)
+
+    def test_invalid_since(self):
+        image_id = self._save_drawing(self._drawing()).get_json()['id']
+        for query in ['', '?since=0', '?since=2', '?since=abc']:
+            response = self.client.get(f'/api/image/{image_id}/delta{query}')
+            self.assertEqual(response.status_code, 400)
+
+    def test_delta_conditional_get(self):
+        image_id = self._save_drawing(self._drawing()).get_json()['id']
+        self._save_drawing(self._drawing(dots=[(0, 0)]), image_id=image_id)
+        etag = self.client.get(f'/api/image/{image_id}/delta?since=1').headers['ETag']
+
+        response = self.client.get(f'/api/image/{image_id}/delta?since=1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_delete_removes_version_files(self):
+        image_id = self._save_drawing(self._drawing()).get_json()['id']
+        self._save_drawing(self._drawing(dots=[(0, 0)]), image_id=image_id)
+        # Another image shares the first version's pixels
+        self._save_drawing(self._drawing())
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.test_dir)), 2)
+
+        self.client.delete(f'/api/image/{image_id}')
+        with self.app.app_context():
+            self.assertEqual(ImageVersion.query.count(), 0)
+        # Only the shared first version is left
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.test_dir)), 1)
+
+    def test_old_versions_pruned(self):
+        self.app.config['IMAGE_MAX_VERSIONS'] = 2
+        image_id = self._save_drawing(self._drawing()).get_json()['id']
+        for x in range(1, 5):
+            self._save_drawing(self._drawing(dots=[(x, 0)]), image_id=image_id)
+
+        with self.app.app_context():
+            self.assertEqual([v.version for v in db.session.get(Image, image_id).versions], [3, 4])
+        # The current version and the two kept versions
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.test_dir)), 3)
+
+        # Displays behind the kept versions get a full frame
+        response = self.client.get(f'/api/image/{image_id}/delta?since=1')
+        self.assertEqual(DELTA_HEADER.unpack_from(response.data)[2], DELTA_KIND_FULL)
+        response = self.client.get(f'/api/image/{image_id}/delta?since=4')
+        self.assertEqual(DELTA_HEADER.unpack_from(response.data)[2], DELTA_KIND_RUNS)
+
+    def test_pruned_file_kept_while_referenced(self):
+        self.app.config['IMAGE_MAX_VERSIONS'] = 0
+        image_id = self._save_drawing(self._drawing()).get_json()['id']
+        # Another image shares the first version's pixels
+        other_id = self._save_drawing(self._drawing()).get_json()['id']
+        self._save_drawing(self._drawing(dots=[(0, 0)]), image_id=image_id)
+
+        with self.app.app_context():
+            self.assertEqual(ImageVersion.query.count(), 0)
+        self.assertEqual(self.client.get(f'/api/image/{other_id}/rgb').status_code, 200)
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.test_dir)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
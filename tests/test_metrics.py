@@ -0,0 +1,127 @@
+import unittest
+import tempfile
+import shutil
+import os
+import concurrent.futures
+import threading
+from app import create_app, db
+from models import User, Image
+from metrics import Counter, Histogram, executor_state
+from PIL import Image as PILImage
+
+class TestMetricTypes(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency', 'Latency.', ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, 'a')
+        lines = histogram.collect()
+        self.assertIn('latency_bucket{route="a",le="0.1"} 2', lines)
+        self.assertIn('latency_bucket{route="a",le="1"} 3', lines)
+        self.assertIn('latency_bucket{route="a",le="+Inf"} 4', lines)
+        self.assertIn('latency_sum{route="a"} 3.65', lines)
+        self.assertIn('latency_count{route="a"} 4', lines)
+
+    def test_counter_labels_escaped(self):
+        counter = Counter('events_total', 'Events.', ('name',))
+        counter.inc('say "hi"')
+        counter.inc('say "hi"', amount=2)
+        self.assertIn('events_total{name="say \\"hi\\""} 3', counter.collect())
+
+    def test_executor_state(self):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        release = threading.Event()
+        started = threading.Event()
+        executor.submit(lambda: (started.set(), release.wait()))
+        executor.submit(lambda: None)
+        started.wait()
+        self.assertEqual(executor_state(executor), (1, 1, 0))
+        release.set()
+        executor.shutdown()
+        self.assertEqual(executor_state(None), (0, 0, 0))
+
+class MetricsEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': []
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+
+            PILImage.new('RGB', (4, 2), 'red').save(os.path.join(self.test_dir, 'test.bmp'))
+            db_img = Image(filename='test.bmp', user_id=u.id, width=4, height=2)
+            db.session.add(db_img)
+            db.session.commit()
+            self.img_id = db_img.id
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _metrics(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+        self.assertIn('version=0.0.4', response.content_type)
+        return response.get_data(as_text=True).splitlines()
+
+    def test_request_latency_and_size_per_endpoint(self):
+        self.client.get(f'/api/image/{self.img_id}/rgb')
+        self.client.get(f'/api/image/{self.img_id}/rgb')
+        self.client.get('/api/image/999/rgb')
+        lines = self._metrics()
+        self.assertIn('fpac_http_request_duration_seconds_count{endpoint="api.api_get_image_rgb",method="GET"} 3',
+                      lines)
+        self.assertIn('fpac_http_requests_total{endpoint="api.api_get_image_rgb",method="GET",status="200"} 2',
+                      lines)
+        self.assertIn('fpac_http_requests_total{endpoint="api.api_get_image_rgb",method="GET",status="404"} 1',
+                      lines)
+        self.assertIn('fpac_http_response_size_bytes_count{endpoint="api.api_get_image_rgb"} 3', lines)
+
+    def test_unmatched_routes_share_a_label(self):
+        self.client.get('/no/such/page')
+        self.client.get('/another/missing/page')
+        lines = self._metrics()
+        self.assertIn('fpac_http_requests_total{endpoint="unmatched",method="GET",status="404"} 2', lines)
+
+    def test_database_queries_counted(self):
+        self.client.get(f'/api/image/{self.img_id}/rgb')
+        lines = self._metrics()
+        self.assertTrue(any(line.startswith('fpac_db_query_duration_seconds_count{operation="SELECT"}')
+                            for line in lines))
+
+    def test_cache_and_executor_gauges(self):
+        self.client.get(f'/api/image/{self.img_id}/rgb')
+        self.client.get(f'/api/image/{self.img_id}/rgb')
+        lines = self._metrics()
+        stats = self.app.pixel_cache.stats()
+        self.assertIn(f"fpac_pixel_cache_hits_total {stats['hits']}", lines)
+        self.assertIn(f"fpac_pixel_cache_misses_total {stats['misses']}", lines)
+        self.assertIn(f"fpac_pixel_cache_bytes {stats['bytes']}", lines)
+        self.assertIn('fpac_preview_cache_files 0', lines)
+        self.assertIn('fpac_executor_queue_depth 0', lines)
+        self.assertTrue(any(line.startswith('fpac_executor_active_threads ') for line in lines))
+
+    def test_disabled(self):
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': [],
+            'METRICS_ENABLED': False
+        })
+        self.assertIsNone(app.metrics)
+        self.assertEqual(app.test_client().get('/metrics').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
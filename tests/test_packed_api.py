@@ -0,0 +1,95 @@
+import unittest
+import tempfile
+import shutil
+import os
+from app import create_app, db
+from models import User, Image
+from packing import FRAME_HEADER, FRAME_MAGIC, PIXEL_FORMATS, SCROLL_DIRECTIONS, pack_pixels
+from PIL import Image as PILImage
+
+class PackedAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+
+            # 2x1 image: one orange pixel, one blue pixel
+            img = PILImage.new('RGB', (2, 1))
+            img.putpixel((0, 0), (255, 128, 7))
+            img.putpixel((1, 0), (0, 0, 255))
+            img.save(os.path.join(self.test_dir, 'packed.bmp'))
+
+            db_img = Image(
+                filename='packed.bmp',
+                user_id=u.id,
+                width=2,
+                height=1,
+                scroll_direction='left',
+                scroll_speed=12
+            )
+            db.session.add(db_img)
+            db.session.commit()
+            self.img_id = db_img.id
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _get(self, pixel_format=None):
+        url = f'/api/image/{self.img_id}/packed'
+        if pixel_format:
+            url += f'?format={pixel_format}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/octet-stream')
+        return response.data
+
+    def test_header(self):
+        data = self._get('rgb565')
+        magic, version, fmt, width, height, direction, speed = FRAME_HEADER.unpack_from(data)
+        self.assertEqual(magic, FRAME_MAGIC)
+        self.assertEqual(version, 1)
+        self.assertEqual(fmt, PIXEL_FORMATS['rgb565'])
+        self.assertEqual((width, height), (2, 1))
+        self.assertEqual(direction, SCROLL_DIRECTIONS['left'])
+        self.assertEqual(speed, 12)
+
+    def test_rgb888_default(self):
+        data = self._get()
+        self.assertEqual(data[FRAME_HEADER.size:], bytes([255, 128, 7, 0, 0, 255]))
+
+    def test_grb(self):
+        data = self._get('grb')
+        self.assertEqual(data[FRAME_HEADER.size:], bytes([128, 255, 7, 0, 0, 255]))
+
+    def test_rgb565(self):
+        data = self._get('rgb565')
+        # (255, 128, 7) -> 0xFC00, (0, 0, 255) -> 0x001F, big-endian
+        self.assertEqual(data[FRAME_HEADER.size:], bytes([0xFC, 0x00, 0x00, 0x1F]))
+
+    def test_unknown_format(self):
+        response = self.client.get(f'/api/image/{self.img_id}/packed?format=cmyk')
+        self.assertEqual(response.status_code, 400)
+
+    def test_nonexistent_image(self):
+        response = self.client.get('/api/image/999/packed')
+        self.assertEqual(response.status_code, 404)
+
+    def test_pack_pixels_converts_mode(self):
+        img = PILImage.new('RGBA', (1, 1), (10, 20, 30, 0))
+        self.assertEqual(pack_pixels(img, 'rgb888'), bytes([10, 20, 30]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import tempfile
+import shutil
+import os
+import random
+from app import create_app, db
+from models import User, Image
+from palette import palettize, expand_palette, run_lengths
+from PIL import Image as PILImage
+
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+class TestPalette(unittest.TestCase):
+    def test_round_trip(self):
+        rgb = bytes(BLUE) + bytes(RED) * 2 + bytes(BLUE)
+        palette, indices = palettize(rgb)
+        # Colours in ascending order
+        self.assertEqual(palette, bytes(BLUE) + bytes(RED))
+        self.assertEqual(indices, bytes([0, 1, 1, 0]))
+        self.assertEqual(expand_palette(palette, indices), rgb)
+
+    def test_too_many_colors(self):
+        rgb = bytes(range(256)) * 3 + bytes(3)
+        self.assertIsNone(palettize(rgb))
+        self.assertIsNotNone(palettize(rgb[:-3]))
+
+    def test_run_lengths(self):
+        self.assertEqual(run_lengths(bytes([0, 0, 0, 2, 1, 1])), [[0, 3], [2, 1], [1, 2]])
+        self.assertEqual(run_lengths(b''), [])
+
+class PaletteAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': []
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+            self.user_id = u.id
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _add_image(self, pil_image, filename='img.bmp'):
+        pil_image.save(os.path.join(self.test_dir, filename))
+        with self.app.app_context():
+            img = Image(filename=filename, user_id=self.user_id, width=pil_image.width, height=pil_image.height)
+            db.session.add(img)
+            db.session.commit()
+            return img.id
+
+    def _two_colour_image(self):
+        img = PILImage.new('RGB', (4, 2), RED)
+        img.putpixel((3, 1), BLUE)
+        return img
+
+    def test_palette_format(self):
+        image_id = self._add_image(self._two_colour_image())
+        data = self.client.get(f'/api/image/{image_id}/rgb?format=palette').get_json()
+        self.assertEqual(data['format'], 'palette')
+        self.assertEqual(data['palette'], [list(BLUE), list(RED)])
+        self.assertEqual(data['indices'], [1] * 7 + [0])
+        self.assertNotIn('pixels', data)
+
+    def test_run_length_encoded(self):
+        image_id = self._add_image(self._two_colour_image())
+        data = self.client.get(f'/api/image/{image_id}/rgb?format=palette&rle=1').get_json()
+        self.assertEqual(data['runs'], [[1, 7], [0, 1]])
+
+    def test_default_format_unchanged(self):
+        image_id = self._add_image(self._two_colour_image())
+        data = self.client.get(f'/api/image/{image_id}/rgb').get_json()
+        self.assertEqual(data['format'], 'rgb')
+        self.assertEqual(data['pixels'][-1], list(BLUE))
+
+    def test_many_colours_fall_back_to_rgb(self):
+        rng = random.Random(0)
+        image_id = self._add_image(PILImage.frombytes('RGB', (32, 16), rng.randbytes(32 * 16 * 3)))
+        data = self.client.get(f'/api/image/{image_id}/rgb?format=palette').get_json()
+        self.assertEqual(data['format'], 'rgb')
+        self.assertEqual(len(data['pixels']), 32 * 16)
+
+    def test_formats_have_distinct_etags(self):
+        image_id = self._add_image(self._two_colour_image())
+        plain = self.client.get(f'/api/image/{image_id}/rgb').headers['ETag']
+        indexed = self.client.get(f'/api/image/{image_id}/rgb?format=palette').headers['ETag']
+        self.assertNotEqual(plain, indexed)
+
+    def test_unknown_format(self):
+        image_id = self._add_image(self._two_colour_image())
+        self.assertEqual(self.client.get(f'/api/image/{image_id}/rgb?format=hsv').status_code, 400)
+
+    def test_cached_as_palette(self):
+        image_id = self._add_image(PILImage.new('RGB', (32, 16), RED))
+        self.client.get(f'/api/image/{image_id}/rgb')
+        # 512 index bytes and one colour instead of 1536 bytes of RGB
+        self.assertEqual(self.app.pixel_cache.stats()['bytes'], 32 * 16 + 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import tempfile
+import shutil
+import os
+from app import create_app, db
+from models import User, Image
+from pixel_cache import PixelCache
+from PIL import Image as PILImage
+
+class PixelCacheTestCase(unittest.TestCase):
+    def test_hit_and_miss_counters(self):
+        cache = PixelCache(max_bytes=100)
+        self.assertIsNone(cache.get(('a', 1)))
+        cache.put(('a', 1), b'abc', 3)
+        self.assertEqual(cache.get(('a', 1)), b'abc')
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['bytes'], 3)
+
+    def test_evicts_least_recently_used_by_size(self):
+        cache = PixelCache(max_bytes=10)
+        cache.put(('a', 1), b'a' * 4, 4)
+        cache.put(('b', 1), b'b' * 4, 4)
+        # Touch 'a' so 'b' becomes the eviction candidate
+        cache.get(('a', 1))
+        cache.put(('c', 1), b'c' * 4, 4)
+
+        self.assertIsNotNone(cache.get(('a', 1)))
+        self.assertIsNone(cache.get(('b', 1)))
+        self.assertIsNotNone(cache.get(('c', 1)))
+        self.assertEqual(cache.current_bytes, 8)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_oversized_value_not_stored(self):
+        cache = PixelCache(max_bytes=4)
+        cache.put(('big', 1), b'x' * 5, 5)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.current_bytes, 0)
+
+    def test_replace_updates_size(self):
+        cache = PixelCache(max_bytes=10)
+        cache.put(('a', 1), b'xxxx', 4)
+        cache.put(('a', 1), b'xx', 2)
+        self.assertEqual(cache.current_bytes, 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_invalidate_drops_all_variants_of_file(self):
+        cache = PixelCache(max_bytes=100)
+        cache.put(('a.bmp', 1), b'rgb', 3)
+        cache.put(('a.bmp', 1, 'packed', 'rgb565'), b'56', 2)
+        cache.put(('b.bmp', 1), b'rgb', 3)
+
+        self.assertEqual(cache.invalidate('a.bmp'), 2)
+        self.assertIsNone(cache.get(('a.bmp', 1)))
+        self.assertIsNotNone(cache.get(('b.bmp', 1)))
+        self.assertEqual(cache.current_bytes, 3)
+
+    def test_get_or_load_calls_loader_once(self):
+        cache = PixelCache(max_bytes=100)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return b'value', 5
+
+        self.assertEqual(cache.get_or_load(('k', 1), loader), b'value')
+        self.assertEqual(cache.get_or_load(('k', 1), loader), b'value')
+        self.assertEqual(len(calls), 1)
+
+class PixelCacheAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'PIXEL_CACHE_MAX_BYTES': 1024
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+
+            PILImage.new('RGB', (4, 4), color='green').save(os.path.join(self.test_dir, 'cached.bmp'))
+            db_img = Image(filename='cached.bmp', user_id=u.id, width=4, height=4)
+            db.session.add(db_img)
+            db.session.commit()
+            self.img_id = db_img.id
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_config_sets_budget(self):
+        self.assertEqual(self.app.pixel_cache.max_bytes, 1024)
+
+    def test_rgb_is_served_from_compact_buffer(self):
+        response = self.client.get(f'/api/image/{self.img_id}/rgb')
+        self.assertEqual(response.get_json()['pixels'][0], [0, 128, 0])
+        self.client.get(f'/api/image/{self.img_id}/rgb')
+
+        stats = self.app.pixel_cache.stats()
+        self.assertEqual(stats['entries'], 1)
+        # One colour: a 3-byte palette plus 16 one-byte indices
+        self.assertEqual(stats['bytes'], 19)
+        self.assertEqual(stats['hits'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
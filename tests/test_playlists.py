@@ -0,0 +1,190 @@
+import unittest
+import tempfile
+import shutil
+import os
+from sqlalchemy import event, text
+from app import create_app, db
+from models import User, Image, Playlist, PlaylistItem
+from packing import BUNDLE_HEADER, BUNDLE_ITEM_HEADER, BUNDLE_MAGIC, PIXEL_FORMATS
+from PIL import Image as PILImage
+
+class PlaylistTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': [{'name': 'Wall', 'width': 2, 'height': 2, 'max_width': 8, 'max_height': 8}]
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            for username in ['test', 'other']:
+                u = User(username=username)
+                u.set_password('password')
+                db.session.add(u)
+            db.session.commit()
+            user = User.query.filter_by(username='test').first()
+
+            self.image_ids = []
+            for name, color, size in [('red', 'red', (2, 2)), ('blue', 'blue', (1, 1))]:
+                PILImage.new('RGB', size, color=color).save(os.path.join(self.test_dir, f'{name}.bmp'))
+                img = Image(filename=f'{name}.bmp', user_id=user.id, width=size[0], height=size[1],
+                            scroll_direction='none', scroll_speed=0)
+                db.session.add(img)
+                db.session.commit()
+                self.image_ids.append(img.id)
+
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _create(self, items=None):
+        if items is None:
+            items = [{'image_id': self.image_ids[0], 'dwell_ms': 1500}, self.image_ids[1]]
+        return self.client.post('/api/playlists', json={'name': 'Lobby', 'display_name': 'Wall', 'items': items})
+
+    def _parse_bundle(self, data):
+        magic, version, fmt, count = BUNDLE_HEADER.unpack_from(data)
+        self.assertEqual(magic, BUNDLE_MAGIC)
+        offset = BUNDLE_HEADER.size
+        items = []
+        for _ in range(count):
+            image_id, width, height, dwell, direction, speed, length = BUNDLE_ITEM_HEADER.unpack_from(data, offset)
+            offset += BUNDLE_ITEM_HEADER.size
+            items.append((image_id, width, height, dwell, data[offset:offset + length]))
+            offset += length
+        self.assertEqual(offset, len(data))
+        return fmt, items
+
+    def test_create_playlist(self):
+        response = self._create()
+        self.assertEqual(response.status_code, 201)
+        data = response.get_json()
+        self.assertEqual(data['display_name'], 'Wall')
+        self.assertEqual(data['items'], [
+            {'image_id': self.image_ids[0], 'dwell_ms': 1500},
+            {'image_id': self.image_ids[1], 'dwell_ms': 5000},
+        ])
+
+    def test_create_validation(self):
+        response = self.client.post('/api/playlists', json={'display_name': 'Nope', 'items': self.image_ids})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._create(items=[999]).status_code, 400)
+        self.assertEqual(self._create(items=[]).status_code, 400)
+
+    def test_bundle(self):
+        playlist_id = self._create().get_json()['id']
+        response = self.client.get(f'/api/playlist/{playlist_id}/bundle?format=grb')
+        self.assertEqual(response.status_code, 200)
+
+        fmt, items = self._parse_bundle(response.data)
+        self.assertEqual(fmt, PIXEL_FORMATS['grb'])
+        self.assertEqual(items, [
+            (self.image_ids[0], 2, 2, 1500, bytes([0, 255, 0]) * 4),
+            (self.image_ids[1], 1, 1, 5000, bytes([0, 0, 255])),
+        ])
+
+    def test_bundle_query_count_independent_of_size(self):
+        def count_queries(playlist_id):
+            statements = []
+
+            def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+
+            with self.app.app_context():
+                engine = db.engine
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            try:
+                self.client.get(f'/api/playlist/{playlist_id}/bundle')
+            finally:
+                event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+            return len(statements)
+
+        small = self._create(items=self.image_ids[:1]).get_json()['id']
+        large = self._create(items=self.image_ids * 5).get_json()['id']
+        self.assertEqual(count_queries(small), count_queries(large))
+
+    def test_bundle_not_modified_until_member_changes(self):
+        playlist_id = self._create().get_json()['id']
+        etag = self.client.get(f'/api/playlist/{playlist_id}/bundle').headers['ETag']
+
+        response = self.client.get(f'/api/playlist/{playlist_id}/bundle', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        with self.app.app_context():
+            img = db.session.get(Image, self.image_ids[1])
+            img.scroll_direction = 'left'
+            img.scroll_speed = 5
+            db.session.commit()
+
+        response = self.client.get(f'/api/playlist/{playlist_id}/bundle', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_replaces_items(self):
+        playlist_id = self._create().get_json()['id']
+        self.client.get(f'/api/playlist/{playlist_id}/bundle')
+
+        response = self.client.put(f'/api/playlist/{playlist_id}', json={'items': [self.image_ids[1]]})
+        self.assertEqual(response.status_code, 200)
+
+        _, items = self._parse_bundle(self.client.get(f'/api/playlist/{playlist_id}/bundle').data)
+        self.assertEqual([item[0] for item in items], [self.image_ids[1]])
+
+    def test_update_requires_owner(self):
+        playlist_id = self._create().get_json()['id']
+        self.client.get('/logout')
+        self.client.post('/login', data={'username': 'other', 'password': 'password'})
+        response = self.client.put(f'/api/playlist/{playlist_id}', json={'items': [self.image_ids[1]]})
+        self.assertEqual(response.status_code, 403)
+
+    def test_display_bundle_uses_latest_playlist(self):
+        self._create()
+        latest = self._create(items=[self.image_ids[1]]).get_json()['id']
+
+        response = self.client.get('/api/display/Wall/bundle')
+        self.assertEqual(response.status_code, 200)
+        _, items = self._parse_bundle(response.data)
+        self.assertEqual([item[0] for item in items], [self.image_ids[1]])
+
+        self.assertEqual(self.client.get('/api/display/Nope/bundle').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/playlist/{latest}').status_code, 200)
+
+    def test_deleting_member_removes_it_from_playlists(self):
+        playlist_id = self._create().get_json()['id']
+        bundle = self.client.get(f'/api/playlist/{playlist_id}/bundle')
+        with self.app.app_context():
+            updated_at = db.session.get(Playlist, playlist_id).updated_at
+
+        response = self.client.delete(f'/api/image/{self.image_ids[0]}')
+        self.assertEqual(response.status_code, 200)
+
+        data = self.client.get(f'/api/playlist/{playlist_id}').get_json()
+        self.assertEqual([item['image_id'] for item in data['items']], [self.image_ids[1]])
+        response = self.client.get(f'/api/playlist/{playlist_id}/bundle',
+                                   headers={'If-None-Match': bundle.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item[0] for item in self._parse_bundle(response.data)[1]], [self.image_ids[1]])
+        with self.app.app_context():
+            self.assertGreater(db.session.get(Playlist, playlist_id).updated_at, updated_at)
+            self.assertEqual(PlaylistItem.query.filter_by(image_id=self.image_ids[0]).count(), 0)
+
+    def test_deleting_member_with_foreign_keys_enforced(self):
+        # As on database servers, which always enforce foreign keys
+        with self.app.app_context():
+            db.session.execute(text('PRAGMA foreign_keys=ON'))
+            db.session.commit()
+        playlist_id = self._create().get_json()['id']
+
+        response = self.client.delete(f'/api/image/{self.image_ids[1]}')
+        self.assertEqual(response.status_code, 200)
+        data = self.client.get(f'/api/playlist/{playlist_id}').get_json()
+        self.assertEqual([item['image_id'] for item in data['items']], [self.image_ids[0]])
+
+if __name__ == '__main__':
+    unittest.main()
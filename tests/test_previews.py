@@ -0,0 +1,137 @@
+import unittest
+import tempfile
+import shutil
+import os
+import io
+from app import create_app, db
+from models import User, Image
+from previews import PreviewCache, render_preview
+from PIL import Image as PILImage
+
+RED = (255, 0, 0)
+
+class TestRenderPreview(unittest.TestCase):
+    def test_small_images_upscaled_by_whole_factor(self):
+        rgb = bytes(RED) + bytes(3) * 3
+        preview = render_preview(2, 2, rgb, 100)
+        self.assertEqual(preview.size, (100, 100))
+        # Every source pixel is a sharp 50x50 square
+        self.assertEqual(preview.getpixel((49, 49)), RED)
+        self.assertEqual(preview.getpixel((50, 49)), (0, 0, 0))
+
+    def test_aspect_ratio_kept(self):
+        self.assertEqual(render_preview(32, 16, bytes(32 * 16 * 3), 128).size, (128, 64))
+        self.assertEqual(render_preview(30, 16, bytes(30 * 16 * 3), 128).size, (120, 64))
+
+    def test_large_images_scaled_down(self):
+        self.assertEqual(render_preview(512, 256, bytes(512 * 256 * 3), 128).size, (128, 64))
+
+class TestPreviewCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _render(self, calls):
+        def render():
+            calls.append(1)
+            return PILImage.new('RGB', (8, 8), RED)
+        return render
+
+    def test_renders_once(self):
+        cache = PreviewCache(self.test_dir, 1024 * 1024)
+        calls = []
+        path = cache.get_or_create('a.png', self._render(calls), 'PNG')
+        self.assertEqual(cache.get_or_create('a.png', self._render(calls), 'PNG'), path)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(os.path.exists(path))
+
+    def test_least_recently_used_evicted(self):
+        cache = PreviewCache(self.test_dir, 1024 * 1024)
+        calls = []
+        cache.get_or_create('a.png', self._render(calls), 'PNG')
+        size = cache.stats()['bytes']
+        cache.max_bytes = size * 2
+        cache.get_or_create('b.png', self._render(calls), 'PNG')
+        cache.get_or_create('a.png', self._render(calls), 'PNG')
+        cache.get_or_create('c.png', self._render(calls), 'PNG')
+
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ['a.png', 'c.png'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_existing_files_adopted(self):
+        PreviewCache(self.test_dir, 1024 * 1024).get_or_create('a.png', self._render([]), 'PNG')
+        cache = PreviewCache(self.test_dir, 1024 * 1024)
+        calls = []
+        cache.get_or_create('a.png', self._render(calls), 'PNG')
+        self.assertEqual(calls, [])
+        self.assertEqual(cache.stats()['files'], 1)
+
+class PreviewAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': []
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+
+            img = PILImage.new('RGB', (32, 16))
+            img.putpixel((0, 0), RED)
+            img.save(os.path.join(self.test_dir, 'test.bmp'))
+            db_img = Image(filename='test.bmp', user_id=u.id, width=32, height=16)
+            db.session.add(db_img)
+            db.session.commit()
+            self.img_id = db_img.id
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_png_preview(self):
+        response = self.client.get(f'/api/image/{self.img_id}/preview')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        preview = PILImage.open(io.BytesIO(response.data))
+        self.assertEqual(preview.size, (128, 64))
+        self.assertEqual(preview.convert('RGB').getpixel((3, 3)), RED)
+
+    def test_webp_and_size(self):
+        response = self.client.get(f'/api/image/{self.img_id}/preview?size=64&format=webp')
+        self.assertEqual(response.mimetype, 'image/webp')
+        self.assertEqual(PILImage.open(io.BytesIO(response.data)).size, (64, 32))
+
+    def test_invalid_arguments(self):
+        self.assertEqual(self.client.get(f'/api/image/{self.img_id}/preview?size=100').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/image/{self.img_id}/preview?format=gif').status_code, 400)
+
+    def test_preview_generated_once(self):
+        self.client.get(f'/api/image/{self.img_id}/preview')
+        self.client.get(f'/api/image/{self.img_id}/preview')
+        stats = self.app.preview_cache.stats()
+        self.assertEqual((stats['misses'], stats['hits'], stats['files']), (1, 1, 1))
+
+    def test_conditional_get(self):
+        etag = self.client.get(f'/api/image/{self.img_id}/preview').headers['ETag']
+        response = self.client.get(f'/api/image/{self.img_id}/preview', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_listing_references_preview(self):
+        data = self.client.get('/api/images?fields=id,preview_url').get_json()
+        url = data['images'][0]['preview_url']
+        self.assertTrue(url.endswith(f'/api/image/{self.img_id}/preview'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
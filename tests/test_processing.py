@@ -0,0 +1,136 @@
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from unittest.mock import patch
+from app import create_app, db
+from models import User, Image
+from packing import FRAME_HEADER
+from processing import (display_options, tone_lut, resize_nearest, quantize, order_pixels, process_pixels,
+                        target_size)
+from PIL import Image as PILImage
+
+class TestProcessing(unittest.TestCase):
+    def test_tone_lut(self):
+        lut = tone_lut(1.0, 255)
+        self.assertEqual(list(lut[[0, 128, 255]]), [0, 128, 255])
+        lut = tone_lut(2.0, 100)
+        self.assertEqual(list(lut[[0, 128, 255]]), [0, 25, 100])
+
+    def test_resize_matches_pil_nearest(self):
+        img = PILImage.effect_noise((13, 7), 64).convert('RGB')
+        pixels = np.asarray(img)
+        for size in [(5, 3), (26, 14), (13, 2)]:
+            expected = np.asarray(img.resize(size, resample=PILImage.NEAREST))
+            np.testing.assert_array_equal(resize_nearest(pixels, size), expected)
+
+    def test_quantize_color_depth(self):
+        pixels = np.array([[[0, 100, 255]]], dtype=np.uint8)
+        self.assertEqual(quantize(pixels, color_depth=1).tolist(), [[[0, 0, 255]]])
+        self.assertIs(quantize(pixels), pixels)
+
+    def test_quantize_palette(self):
+        pixels = np.array([[[250, 10, 10], [20, 20, 200]]], dtype=np.uint8)
+        palette = ((255, 0, 0), (0, 0, 255))
+        self.assertEqual(quantize(pixels, palette=palette).tolist(), [[[255, 0, 0], [0, 0, 255]]])
+
+    def test_quantize_palette_in_blocks(self):
+        # Blocks smaller than a row must give the same result as one pass
+        pixels = np.asarray(PILImage.effect_noise((9, 5), 96).convert('RGB'))
+        palette = [(r, g, b) for r in (0, 128, 255) for g in (0, 255) for b in (0, 255)]
+        expected = quantize(pixels, palette=palette, dither=True)
+        with patch('processing.QUANTIZE_BLOCK', 4 * len(palette)):
+            np.testing.assert_array_equal(quantize(pixels, palette=palette, dither=True), expected)
+        distances = ((pixels[:, :, None, :].astype(int) - np.array(palette)) ** 2).sum(axis=-1)
+        np.testing.assert_array_equal(quantize(pixels, palette=palette), np.array(palette)[distances.argmin(axis=-1)])
+
+    def test_ordered_dither_mixes_levels(self):
+        # Mid grey at 1 bit per channel dithers into a mix of black and white
+        pixels = np.full((4, 4, 3), 128, dtype=np.uint8)
+        values = set(quantize(pixels, color_depth=1, dither=True).ravel().tolist())
+        self.assertEqual(values, {0, 255})
+
+    def test_order_pixels(self):
+        pixels = np.arange(6).reshape(2, 3, 1).repeat(3, axis=2)
+        self.assertEqual(order_pixels(pixels, 'serpentine')[:, :, 0].ravel().tolist(), [0, 1, 2, 5, 4, 3])
+        self.assertEqual(order_pixels(pixels, 'vertical_serpentine')[:, :, 0].ravel().tolist(), [0, 3, 4, 1, 2, 5])
+
+    def test_process_pixels_fits_display(self):
+        rgb = bytes([255, 0, 0]) * 64 * 32
+        width, height, out = process_pixels(64, 32, rgb, {'width': 32, 'height': 16, 'max_brightness': 128})
+        self.assertEqual((width, height), (32, 16))
+        self.assertEqual(out, bytes([128, 0, 0]) * 32 * 16)
+
+    def test_target_size(self):
+        display = {'width': 32, 'height': 16}
+        self.assertEqual(target_size(64, 64, display), (16, 16))
+        self.assertEqual(target_size(100, 32, display, 'left', 10), (50, 16))
+        self.assertEqual(target_size(10, 10, display), (10, 10))
+
+    def test_invalid_options(self):
+        for options in [{'gamma': 0}, {'max_brightness': 300}, {'color_depth': 9}, {'layout': 'spiral'},
+                        {'palette': ['#12345']}, {'palette': []}]:
+            with self.assertRaises(ValueError):
+                display_options(dict(options, width=1, height=1))
+
+class DisplayPackedAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': [
+                {'name': 'Panel', 'width': 2, 'height': 2, 'gamma': 2.0, 'max_brightness': 200,
+                 'layout': 'serpentine'},
+                {'name': 'Broken', 'width': 2, 'height': 2, 'layout': 'spiral'}
+            ]
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+
+            # Row 0: white, black; row 1: red, green
+            img = PILImage.new('RGB', (2, 2))
+            img.putdata([(255, 255, 255), (0, 0, 0), (255, 0, 0), (0, 255, 0)])
+            img.save(os.path.join(self.test_dir, 'test.bmp'))
+            db_img = Image(filename='test.bmp', user_id=u.id, width=2, height=2)
+            db.session.add(db_img)
+            db.session.commit()
+            self.img_id = db_img.id
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_processed_for_display(self):
+        response = self.client.get(f'/api/image/{self.img_id}/packed?display=Panel')
+        self.assertEqual(response.status_code, 200)
+        payload = response.data[FRAME_HEADER.size:]
+        # Brightness capped at 200, odd row reversed for zigzag wiring
+        self.assertEqual(payload, bytes([200, 200, 200, 0, 0, 0, 0, 200, 0, 200, 0, 0]))
+
+    def test_processed_result_is_cached(self):
+        self.client.get(f'/api/image/{self.img_id}/packed?display=Panel')
+        misses = self.app.pixel_cache.misses
+        self.client.get(f'/api/image/{self.img_id}/packed?display=Panel&format=rgb888')
+        self.assertEqual(self.app.pixel_cache.misses, misses)
+
+    def test_etag_differs_from_unprocessed(self):
+        plain = self.client.get(f'/api/image/{self.img_id}/packed')
+        processed = self.client.get(f'/api/image/{self.img_id}/packed?display=Panel')
+        self.assertNotEqual(plain.headers['ETag'], processed.headers['ETag'])
+
+    def test_unknown_or_invalid_display(self):
+        self.assertEqual(self.client.get(f'/api/image/{self.img_id}/packed?display=Nope').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/image/{self.img_id}/packed?display=Broken').status_code, 500)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import tempfile
+import shutil
+import os
+from app import create_app, db
+from models import User, Image
+from storage import RAW_HEADER, encode_raw, decode_raw, map_raw_file
+from PIL import Image as PILImage
+
+class MapRawFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, data):
+        filepath = os.path.join(self.test_dir, 'pixels.fpx')
+        with open(filepath, 'wb') as f:
+            f.write(data)
+        return filepath
+
+    def test_uncompressed_is_mapped(self):
+        rgb = bytes(range(12))
+        width, height, pixels = map_raw_file(self._write(encode_raw(2, 2, rgb)))
+        self.assertEqual((width, height), (2, 2))
+        self.assertIsInstance(pixels, memoryview)
+        self.assertEqual(bytes(pixels), rgb)
+
+    def test_compressed_is_decoded(self):
+        rgb = b'\x07' * 12
+        width, height, pixels = map_raw_file(self._write(encode_raw(2, 2, rgb, compress=True)))
+        self.assertEqual(pixels, rgb)
+
+    def test_rejects_size_mismatch(self):
+        with self.assertRaises(ValueError):
+            map_raw_file(self._write(encode_raw(2, 2, bytes(12))[:-3]))
+
+class RawServingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+
+            PILImage.new('RGB', (4, 2), color='blue').save(os.path.join(self.test_dir, 'stored.bmp'))
+            with open(os.path.join(self.test_dir, 'stored.fpx'), 'wb') as f:
+                f.write(encode_raw(2, 1, bytes([1, 2, 3, 4, 5, 6])))
+
+            bmp_img = Image(filename='stored.bmp', user_id=u.id, width=4, height=2,
+                            scroll_direction='up', scroll_speed=3)
+            raw_img = Image(filename='stored.fpx', user_id=u.id, width=2, height=1)
+            db.session.add_all([bmp_img, raw_img])
+            db.session.commit()
+            self.bmp_id = bmp_img.id
+            self.raw_id = raw_img.id
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_bmp_artifact_is_converted_once(self):
+        response = self.client.get(f'/api/image/{self.bmp_id}/raw')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/octet-stream')
+        self.assertEqual(response.headers['X-Image-Width'], '4')
+        self.assertEqual(response.headers['X-Scroll-Direction'], 'up')
+        self.assertEqual(response.headers['X-Scroll-Speed'], '3')
+        self.assertEqual(decode_raw(response.data), (4, 2, bytes([0, 0, 255]) * 8))
+        response.close()
+
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, 'stored.plain.fpx')))
+
+    def test_raw_artifact_served_directly(self):
+        response = self.client.get(f'/api/image/{self.raw_id}/raw')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[RAW_HEADER.size:], bytes([1, 2, 3, 4, 5, 6]))
+        response.close()
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, 'stored.plain.fpx')))
+
+    def test_range_request(self):
+        start = RAW_HEADER.size
+        response = self.client.get(f'/api/image/{self.raw_id}/raw',
+                                   headers={'Range': f'bytes={start}-{start + 2}'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, bytes([1, 2, 3]))
+        response.close()
+
+    def test_not_modified(self):
+        response = self.client.get(f'/api/image/{self.raw_id}/raw')
+        etag = response.headers['ETag']
+        response.close()
+
+        response = self.client.get(f'/api/image/{self.raw_id}/raw', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_rgb_uses_mapped_pixels(self):
+        response = self.client.get(f'/api/image/{self.raw_id}/rgb')
+        self.assertEqual(response.get_json()['pixels'], [[1, 2, 3], [4, 5, 6]])
+
+        response = self.client.get(f'/api/image/{self.raw_id}/packed?format=grb')
+        self.assertEqual(response.data[-6:], bytes([2, 1, 3, 5, 4, 6]))
+
+if __name__ == '__main__':
+    unittest.main()
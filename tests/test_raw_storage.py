@@ -0,0 +1,99 @@
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import base64
+from unittest.mock import patch
+from app import create_app, db
+from models import User, Image
+from storage import RAW_HEADER, encode_raw, decode_raw
+from PIL import Image as PILImage
+
+class RawFormatTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        rgb = bytes(range(18))
+        data = encode_raw(3, 2, rgb)
+        self.assertEqual(len(data), RAW_HEADER.size + 18)
+        self.assertEqual(decode_raw(data), (3, 2, rgb))
+
+    def test_round_trip_compressed(self):
+        rgb = b'\x00' * 3 * 64 * 32
+        data = encode_raw(64, 32, rgb, compress=True)
+        self.assertLess(len(data), len(rgb))
+        self.assertEqual(decode_raw(data), (64, 32, rgb))
+
+    def test_rejects_bad_data(self):
+        with self.assertRaises(ValueError):
+            decode_raw(b'BM' + b'\x00' * 20)
+        with self.assertRaises(ValueError):
+            decode_raw(encode_raw(2, 2, b'\x00' * 12)[:-1])
+
+class RawStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'STORAGE_FORMAT': 'raw',
+            'STORAGE_COMPRESS': True
+        })
+        # Save synchronously so files exist when the request returns
+        self.app.executor = None
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+        img_byte_arr = io.BytesIO()
+        PILImage.new('RGB', (4, 2), color='red').save(img_byte_arr, format='PNG')
+        data_url = 'data:image/png;base64,' + base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+        self.img_id = self.client.post('/save_drawing', json={'image': data_url}).get_json()['id']
+        with self.app.app_context():
+            self.filename = db.session.get(Image, self.img_id).filename
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_saved_as_raw_file(self):
+        self.assertTrue(self.filename.endswith('.fpx'))
+        with open(os.path.join(self.test_dir, self.filename), 'rb') as f:
+            self.assertEqual(decode_raw(f.read()), (4, 2, bytes([255, 0, 0]) * 8))
+
+    def test_rgb_read_without_image_decoder(self):
+        with patch('blueprints.api.PILImage.open', side_effect=AssertionError('decoder used')):
+            response = self.client.get(f'/api/image/{self.img_id}/rgb')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['pixels'], [[255, 0, 0]] * 8)
+
+    def test_download_generates_bmp_lazily(self):
+        bmp_filename = self.filename[:-len('.fpx')] + '.bmp'
+        bmp_path = os.path.join(self.test_dir, bmp_filename)
+        self.assertFalse(os.path.exists(bmp_path))
+
+        response = self.client.get(f'/api/download/{self.img_id}')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.location.endswith(f'/api/files/{os.path.basename(self.filename)[:16]}/{bmp_filename}'))
+        with PILImage.open(bmp_path) as bmp:
+            self.assertEqual(bmp.size, (4, 2))
+            self.assertEqual(bmp.getpixel((0, 0)), (255, 0, 0))
+
+    def test_listing_points_at_download(self):
+        data = self.client.get('/api/images').get_json()
+        self.assertTrue(data['images'][0]['url'].endswith(f'/api/download/{self.img_id}'))
+
+    def test_delete_removes_generated_bmp(self):
+        self.client.get(f'/api/download/{self.img_id}')
+        self.client.delete(f'/api/image/{self.img_id}')
+        self.assertEqual([files for _, _, files in os.walk(self.test_dir) if files], [])
+
+if __name__ == '__main__':
+    unittest.main()
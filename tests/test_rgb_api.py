@@ -26,6 +26,8 @@ class RGBAPITestCase(unittest.TestCase):
             db.session.commit()
 
     def tearDown(self):
+        # Let background saves finish before their directory is removed
+        self.app.executor.shutdown(wait=True)
         shutil.rmtree(self.test_dir)
         with self.app.app_context():
             db.session.remove()
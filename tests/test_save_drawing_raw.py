@@ -0,0 +1,93 @@
+import unittest
+import tempfile
+import shutil
+from unittest.mock import patch
+from app import create_app, db
+from models import User, Image
+from storage import encode_raw
+
+RED = (255, 0, 0)
+
+class SaveDrawingRawTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': [],
+            'UPLOAD_MAX_PIXELS': 64 * 64
+        })
+        self.app.executor = None
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _post(self, body, query=''):
+        return self.client.post('/save_drawing' + query, data=body, content_type='application/octet-stream')
+
+    def test_raw_body_is_saved_without_decoding(self):
+        rgb = bytes(RED) * 4 + bytes(3) * 4
+        with patch('blueprints.main.PILImage.open') as pil_open:
+            response = self._post(encode_raw(4, 2, rgb), '?display_name=Panel&scroll_direction=left&scroll_speed=5')
+            pil_open.assert_not_called()
+
+        data = response.get_json()
+        self.assertTrue(data['success'])
+        with self.app.app_context():
+            img = db.session.get(Image, data['id'])
+            self.assertEqual((img.width, img.height), (4, 2))
+            self.assertEqual((img.display_name, img.scroll_direction, img.scroll_speed), ('Panel', 'left', 5))
+
+        pixels = self.client.get(f"/api/image/{data['id']}/rgb").get_json()['pixels']
+        self.assertEqual(pixels[0], list(RED))
+        self.assertEqual(pixels[-1], [0, 0, 0])
+
+    def test_raw_body_edits_image(self):
+        image_id = self._post(encode_raw(2, 1, bytes(6)), '?display_name=Panel').get_json()['id']
+        data = self._post(encode_raw(2, 1, bytes(RED) * 2), f'?image_id={image_id}').get_json()
+        self.assertEqual((data['id'], data['version']), (image_id, 2))
+        with self.app.app_context():
+            # Fields that were not sent are kept
+            self.assertEqual(db.session.get(Image, image_id).display_name, 'Panel')
+
+    def test_malformed_bodies_rejected(self):
+        bodies = [
+            b'FPXL',
+            encode_raw(2, 2, bytes(12))[:-1],
+            encode_raw(2, 2, bytes(12), compress=True),
+            encode_raw(0, 2, b''),
+            b'NOPE' + encode_raw(1, 1, bytes(3))[4:],
+        ]
+        for body in bodies:
+            response = self._post(body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertFalse(response.get_json()['success'])
+        with self.app.app_context():
+            self.assertEqual(Image.query.count(), 0)
+
+    def test_too_many_pixels_rejected_from_header(self):
+        # Only the header is sent; the size is checked before the payload
+        response = self._post(encode_raw(65, 64, b''))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('too large', response.get_json()['error'])
+
+    def test_json_data_url_still_accepted(self):
+        response = self.client.post('/save_drawing', json={
+            'image': 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMCAO+ip1sAAAAASUVORK5CYII='
+        })
+        self.assertTrue(response.get_json()['success'])
+
+if __name__ == '__main__':
+    unittest.main()
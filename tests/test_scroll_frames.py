@@ -0,0 +1,139 @@
+import unittest
+import tempfile
+import shutil
+import os
+from app import create_app, db
+from models import User, Image
+from packing import STREAM_HEADER, STREAM_MAGIC, PIXEL_FORMATS, frame_interval_ms
+from utils import render_scroll_frames
+from PIL import Image as PILImage
+
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+BLACK = (0, 0, 0)
+
+class TestRenderScrollFrames(unittest.TestCase):
+    def setUp(self):
+        self.display_config = {'name': 'Tiny', 'width': 2, 'height': 1}
+        # 3x1 image: red, blue, blue
+        self.img = PILImage.new('RGB', (3, 1), BLUE)
+        self.img.putpixel((0, 0), RED)
+
+    def test_no_scroll_single_centred_frame(self):
+        img = PILImage.new('RGB', (1, 1), RED)
+        frames = render_scroll_frames(img, {'width': 3, 'height': 1}, 'none')
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(list(frames[0].getdata()), [BLACK, RED, BLACK])
+
+    def test_scroll_left_steps_window_right(self):
+        frames = render_scroll_frames(self.img, self.display_config, 'left')
+        self.assertEqual(len(frames), 3)
+        self.assertEqual([list(f.getdata()) for f in frames], [
+            [RED, BLUE],
+            [BLUE, BLUE],
+            [BLUE, RED],
+        ])
+
+    def test_scroll_right_steps_window_left(self):
+        frames = render_scroll_frames(self.img, self.display_config, 'right')
+        self.assertEqual([list(f.getdata()) for f in frames], [
+            [RED, BLUE],
+            [BLUE, RED],
+            [BLUE, BLUE],
+        ])
+
+    def test_vertical_scroll_pads_short_image(self):
+        img = PILImage.new('RGB', (1, 1), RED)
+        frames = render_scroll_frames(img, {'width': 1, 'height': 2}, 'up')
+        # Period is the display height because the image is shorter
+        self.assertEqual(len(frames), 2)
+        self.assertEqual([list(f.getdata()) for f in frames], [[RED, BLACK], [BLACK, RED]])
+
+    def test_frames_match_display_size(self):
+        img = PILImage.new('RGB', (100, 10))
+        frames = render_scroll_frames(img, {'width': 32, 'height': 16}, 'left')
+        self.assertEqual(len(frames), 100)
+        self.assertTrue(all(f.size == (32, 16) for f in frames))
+
+    def test_frame_interval(self):
+        self.assertEqual(frame_interval_ms(0), 0)
+        self.assertEqual(frame_interval_ms(10), 100)
+        self.assertEqual(frame_interval_ms(3000), 1)
+
+class ScrollFramesAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': [
+                {'name': 'Tiny', 'width': 2, 'height': 1, 'max_width': 8, 'max_height': 8},
+                {'name': 'Wide', 'width': 4, 'height': 1, 'max_width': 8, 'max_height': 8}
+            ]
+        })
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+
+            img = PILImage.new('RGB', (3, 1), BLUE)
+            img.putpixel((0, 0), RED)
+            img.save(os.path.join(self.test_dir, 'banner.bmp'))
+            db_img = Image(
+                filename='banner.bmp',
+                user_id=u.id,
+                width=3,
+                height=1,
+                display_name='Tiny',
+                scroll_direction='left',
+                scroll_speed=20
+            )
+            db.session.add(db_img)
+            db.session.commit()
+            self.img_id = db_img.id
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_stream_for_image_display(self):
+        response = self.client.get(f'/api/image/{self.img_id}/frames')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/octet-stream')
+
+        magic, version, fmt, width, height, count, interval = STREAM_HEADER.unpack_from(response.data)
+        self.assertEqual(magic, STREAM_MAGIC)
+        self.assertEqual(fmt, PIXEL_FORMATS['rgb888'])
+        self.assertEqual((width, height, count, interval), (2, 1, 3, 50))
+
+        payload = response.data[STREAM_HEADER.size:]
+        self.assertEqual(len(payload), 3 * 2 * 3)
+        self.assertEqual(payload[:6], bytes(RED + BLUE))
+
+    def test_stream_for_other_display(self):
+        response = self.client.get(f'/api/image/{self.img_id}/frames?display=Wide&format=rgb565')
+        self.assertEqual(response.status_code, 200)
+        _, _, fmt, width, height, count, _ = STREAM_HEADER.unpack_from(response.data)
+        self.assertEqual(fmt, PIXEL_FORMATS['rgb565'])
+        # Image is narrower than the display, so the period is the display width
+        self.assertEqual((width, height, count), (4, 1, 4))
+        self.assertEqual(len(response.data), STREAM_HEADER.size + 4 * 4 * 2)
+
+    def test_stream_is_cached(self):
+        self.client.get(f'/api/image/{self.img_id}/frames')
+        misses = self.app.pixel_cache.misses
+        self.client.get(f'/api/image/{self.img_id}/frames')
+        self.assertEqual(self.app.pixel_cache.misses, misses)
+
+    def test_unknown_display(self):
+        response = self.client.get(f'/api/image/{self.img_id}/frames?display=Nope')
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
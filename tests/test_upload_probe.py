@@ -0,0 +1,153 @@
+import unittest
+import tempfile
+import shutil
+import io
+import base64
+from unittest.mock import patch
+from app import create_app, db
+from models import User, Image
+from utils import open_upload_image
+from PIL import Image as PILImage
+from PIL import ImageFile
+
+DISPLAY = {'name': 'Panel', 'width': 32, 'height': 16, 'max_width': 64, 'max_height': 32}
+
+def encode(img, fmt='PNG'):
+    buf = io.BytesIO()
+    img.save(buf, fmt)
+    buf.seek(0)
+    return buf
+
+class TestOpenUploadImage(unittest.TestCase):
+    def test_jpeg_decoded_at_reduced_scale(self):
+        stream = encode(PILImage.new('RGB', (1024, 512), 'red'), 'JPEG')
+        image = open_upload_image(stream, 16 * 1024 * 1024, DISPLAY)
+        # 1/8 scale is the smallest that is still at least 32x16
+        self.assertEqual(image.size, (128, 64))
+        image.load()
+        self.assertEqual(image.size, (128, 64))
+
+    def test_png_keeps_size(self):
+        image = open_upload_image(encode(PILImage.new('RGB', (100, 50))), 16 * 1024 * 1024, DISPLAY)
+        self.assertEqual(image.size, (100, 50))
+
+    def test_too_many_pixels_rejected_before_decode(self):
+        stream = encode(PILImage.new('RGB', (200, 200)))
+        with patch.object(ImageFile.ImageFile, 'load') as load:
+            with self.assertRaises(ValueError):
+                open_upload_image(stream, 100 * 100)
+            load.assert_not_called()
+
+    def test_draft_counts_towards_pixel_limit(self):
+        # 1024x512 would exceed the limit, but only 128x64 pixels are decoded
+        stream = encode(PILImage.new('RGB', (1024, 512)), 'JPEG')
+        open_upload_image(stream, 128 * 64, DISPLAY)
+
+    def test_scrolling_image_beyond_display_maximum(self):
+        stream = encode(PILImage.new('RGB', (200, 16)))
+        with self.assertRaises(ValueError) as cm:
+            open_upload_image(stream, 16 * 1024 * 1024, DISPLAY, 'left', 10)
+        self.assertIn('200x16', str(cm.exception))
+
+        # Still images are scaled down to fit instead
+        stream.seek(0)
+        open_upload_image(stream, 16 * 1024 * 1024, DISPLAY)
+
+    def test_side_beyond_header_limit_rejected(self):
+        # Few enough pixels, but wider than the uint16 width of the raw pixel header
+        stream = encode(PILImage.new('RGB', (70000, 1)))
+        with self.assertRaises(ValueError) as cm:
+            open_upload_image(stream, 16 * 1024 * 1024)
+        self.assertIn('65535', str(cm.exception))
+
+    def test_frame_strip_beyond_header_limit_rejected(self):
+        frames = [PILImage.new('RGB', (1, 40000), color) for color in ('red', 'blue')]
+        stream = io.BytesIO()
+        frames[0].save(stream, 'GIF', save_all=True, append_images=frames[1:], duration=100)
+        stream.seek(0)
+        with self.assertRaises(ValueError):
+            open_upload_image(stream, 16 * 1024 * 1024)
+
+class UploadProbeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': [dict(DISPLAY)],
+            'UPLOAD_MAX_PIXELS': 300 * 300
+        })
+        self.app.executor = None
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _image_count(self):
+        with self.app.app_context():
+            return Image.query.count()
+
+    def test_upload_over_pixel_limit(self):
+        response = self.client.post('/upload', data={
+            'file': (encode(PILImage.new('RGB', (400, 400))), 'big.png')
+        }, follow_redirects=True)
+        self.assertIn(b'Image is too large', response.data)
+        self.assertEqual(self._image_count(), 0)
+
+    def test_upload_over_display_maximum(self):
+        response = self.client.post('/upload', data={
+            'file': (encode(PILImage.new('RGB', (200, 16))), 'banner.png'),
+            'display_index': '0',
+            'scroll_direction': 'left',
+            'scroll_speed': '10'
+        }, follow_redirects=True)
+        self.assertIn(b'the maximum is 64x32', response.data)
+        self.assertEqual(self._image_count(), 0)
+
+    def test_large_jpeg_upload_is_drafted(self):
+        response = self.client.post('/upload', data={
+            'file': (encode(PILImage.new('RGB', (1024, 512), 'blue'), 'JPEG'), 'photo.jpg'),
+            'display_index': '0'
+        }, follow_redirects=True)
+        self.assertIn(b'File uploaded successfully', response.data)
+        with self.app.app_context():
+            self.assertEqual((Image.query.one().width, Image.query.one().height), (32, 16))
+
+    def test_drawing_over_pixel_limit(self):
+        data_url = 'data:image/png;base64,' + base64.b64encode(
+            encode(PILImage.new('RGB', (400, 400))).getvalue()).decode('utf-8')
+        response = self.client.post('/save_drawing', json={'image': data_url})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.get_json()['success'])
+        self.assertEqual(self._image_count(), 0)
+
+    def test_drawing_beyond_header_limit(self):
+        data_url = 'data:image/png;base64,' + base64.b64encode(
+            encode(PILImage.new('RGB', (70000, 1))).getvalue()).decode('utf-8')
+        response = self.client.post('/save_drawing', json={'image': data_url})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.get_json()['success'])
+        self.assertEqual(self._image_count(), 0)
+
+    def test_import_beyond_header_limit(self):
+        response = self.client.post('/api/images/import', data={
+            'files': [(encode(PILImage.new('RGB', (70000, 1))), 'wide.png'),
+                      (encode(PILImage.new('RGB', (4, 4))), 'small.png')]
+        }, content_type='multipart/form-data')
+        data = response.get_json()
+        self.assertEqual((data['imported'], data['failed']), (1, 1))
+        self.assertIn('65535', data['items'][0]['error'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -73,6 +73,11 @@ class TestUploadResize(unittest.TestCase):
         self.assertEqual(image_record.width, 16)
         self.assertEqual(image_record.height, 16)
 
+        # The file is written in the background; wait for the ingest worker
+        self.app.executor.shutdown(wait=True)
+        db.session.refresh(image_record)
+        self.assertEqual(image_record.status, 'ready')
+
         # Verify file exists
         filepath = os.path.join(self.upload_folder, image_record.filename)
         self.assertTrue(os.path.exists(filepath))
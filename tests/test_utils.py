@@ -1,7 +1,10 @@
 import unittest
 from unittest.mock import MagicMock, patch
 import os
-from utils import save_image_artifact
+import shutil
+import tempfile
+from flask import Flask
+from utils import save_image_artifact, content_hash, _finish_artifact
 from PIL import Image as PILImage
 
 class TestUtils(unittest.TestCase):
@@ -15,22 +18,26 @@ class TestUtils(unittest.TestCase):
         self.mock_pil_image.width = 100
         self.mock_pil_image.height = 50
         self.mock_pil_image.mode = 'RGB'
+        self.mock_pil_image.tobytes.return_value = b'\xff\x00\x00' * 5000
 
         self.user_id = 1
-        self.upload_folder = '/tmp/test_uploads'
+        self.upload_folder = tempfile.mkdtemp()
+
+        self.app = Flask(__name__)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
 
     def tearDown(self):
+        self.app_context.pop()
         patch.stopall()
+        shutil.rmtree(self.upload_folder)
 
     def test_save_image_artifact_sync(self):
         # Test synchronous saving
-        self.mock_pil_image.save = MagicMock()
-
-        save_image_artifact(
+        db_image = save_image_artifact(
             pil_image=self.mock_pil_image,
             user_id=self.user_id,
             upload_folder=self.upload_folder,
-            filename_prefix="test_",
             metadata={'display_name': 'My Pic'},
             executor=None
         )
@@ -38,8 +45,6 @@ class TestUtils(unittest.TestCase):
         # Check if file save was called
         self.mock_pil_image.save.assert_called_once()
         args, _ = self.mock_pil_image.save.call_args
-        self.assertTrue(args[0].startswith(os.path.join(self.upload_folder, 'test_')))
-        self.assertTrue(args[0].endswith('.bmp'))
         self.assertEqual(args[1], 'BMP')
 
         # Check DB calls
@@ -47,15 +52,22 @@ class TestUtils(unittest.TestCase):
         call_kwargs = self.mock_image_class.call_args[1]
         self.assertEqual(call_kwargs['user_id'], self.user_id)
         self.assertEqual(call_kwargs['display_name'], 'My Pic')
+        self.assertEqual(call_kwargs['status'], 'ready')
+        digest = call_kwargs['content_hash']
+        self.assertEqual(len(digest), 64)
+        self.assertEqual(call_kwargs['filename'], f'{digest[:2]}/{digest[2:4]}/{digest}.bmp')
+
+        # The file is in place and no temporary file is left behind
+        shard = os.path.join(self.upload_folder, digest[:2], digest[2:4])
+        self.assertEqual(os.listdir(shard), [f'{digest}.bmp'])
 
         self.mock_db.session.add.assert_called_once()
         self.mock_db.session.commit.assert_called_once()
+        self.assertIs(db_image, self.mock_image_class.return_value)
 
     def test_save_image_artifact_async(self):
-        # Test async saving
+        # Test async saving: the request only commits a pending record
         mock_executor = MagicMock()
-        mock_future = MagicMock()
-        mock_executor.submit.return_value = mock_future
 
         save_image_artifact(
             pil_image=self.mock_pil_image,
@@ -65,39 +77,74 @@ class TestUtils(unittest.TestCase):
         )
 
         mock_executor.submit.assert_called_once()
-        mock_future.result.assert_called_once()
+        self.assertIs(mock_executor.submit.call_args[0][0], _finish_artifact)
+        self.mock_pil_image.save.assert_not_called()
+        self.assertEqual(self.mock_image_class.call_args[1]['status'], 'pending')
+        self.mock_db.session.commit.assert_called_once()
+
+    def test_finish_artifact_marks_ready(self):
+        filepath = os.path.join(self.upload_folder, 'done.bmp')
+        mock_cache = MagicMock()
+
+        _finish_artifact(self.app, 1, self.mock_pil_image, filepath, mock_cache)
+
+        self.assertTrue(os.path.exists(filepath))
+        db_image = self.mock_db.session.get.return_value
+        self.assertEqual(db_image.status, 'ready')
+        self.mock_db.session.commit.assert_called_once()
+        mock_cache.invalidate.assert_called_once_with(filepath)
+
+    def test_finish_artifact_failure(self):
+        # Test async saving failure: record marked failed, partial file removed
+        self.mock_pil_image.save.side_effect = OSError("Disk full")
+        filepath = os.path.join(self.upload_folder, 'broken.bmp')
+
+        _finish_artifact(self.app, 1, self.mock_pil_image, filepath, None)
+
+        self.assertEqual(os.listdir(self.upload_folder), [])
+        db_image = self.mock_db.session.get.return_value
+        self.assertEqual(db_image.status, 'failed')
         self.mock_db.session.commit.assert_called_once()
 
-    def test_save_image_artifact_async_failure(self):
-        # Test async saving failure (DB rollback)
+    def test_save_image_artifact_invalidates_cache(self):
+        mock_cache = MagicMock()
+
+        save_image_artifact(
+            pil_image=self.mock_pil_image,
+            user_id=self.user_id,
+            upload_folder=self.upload_folder,
+            cache=mock_cache
+        )
+
+        filename = self.mock_image_class.call_args[1]['filename']
+        mock_cache.invalidate.assert_called_once_with(os.path.join(self.upload_folder, filename))
+
+    def test_save_image_artifact_deduplicates(self):
         mock_executor = MagicMock()
-        mock_future = MagicMock()
-        mock_executor.submit.return_value = mock_future
-        mock_future.result.side_effect = Exception("Save failed")
-
-        # Mock DB image instance so we can check delete
-        mock_db_instance = MagicMock()
-        self.mock_image_class.return_value = mock_db_instance
-
-        with self.assertRaises(Exception):
-            save_image_artifact(
-                pil_image=self.mock_pil_image,
-                user_id=self.user_id,
-                upload_folder=self.upload_folder,
-                executor=mock_executor
-            )
 
-        self.mock_db.session.add.assert_called_once()
-        # logic: commit() after add. exception. delete(). commit().
-        self.assertEqual(self.mock_db.session.commit.call_count, 2)
+        save_image_artifact(self.mock_pil_image, self.user_id, self.upload_folder)
+        first = self.mock_image_class.call_args[1]
+        save_image_artifact(self.mock_pil_image, self.user_id, self.upload_folder, executor=mock_executor)
+        second = self.mock_image_class.call_args[1]
+
+        # Same pixels: same file, written once, second record is ready at once
+        self.assertEqual(first['filename'], second['filename'])
+        self.mock_pil_image.save.assert_called_once()
+        mock_executor.submit.assert_not_called()
+        self.assertEqual(second['status'], 'ready')
 
-        self.mock_db.session.delete.assert_called_with(mock_db_instance)
+    def test_content_hash_depends_on_dimensions(self):
+        wide = PILImage.new('RGB', (4, 1))
+        tall = PILImage.new('RGB', (1, 4))
+        self.assertEqual(wide.tobytes(), tall.tobytes())
+        self.assertNotEqual(content_hash(wide), content_hash(tall))
 
     def test_convert_to_rgb(self):
         self.mock_pil_image.mode = 'RGBA'
         converted_mock = MagicMock()
         converted_mock.width = 100
         converted_mock.height = 50
+        converted_mock.tobytes.return_value = b'\x00' * 15000
         self.mock_pil_image.convert.return_value = converted_mock
 
         save_image_artifact(
@@ -0,0 +1,138 @@
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import base64
+from app import create_app, db
+from models import User, Image, ImageVariant
+from storage import read_raw_file
+from PIL import Image as PILImage
+from test_async_ingest import DeferredExecutor
+
+DISPLAYS = [
+    {'name': 'Small', 'width': 4, 'height': 2},
+    {'name': 'Dim', 'width': 8, 'height': 4, 'max_brightness': 100, 'layout': 'serpentine'},
+]
+
+class VariantTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'UPLOAD_FOLDER': self.test_dir,
+            'DISPLAYS': [dict(d) for d in DISPLAYS],
+            'RENDER_PROCESSES': 2
+        })
+        # Save synchronously; variants are rendered on the process pool
+        self.app.executor = None
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            u = User(username='test')
+            u.set_password('password')
+            db.session.add(u)
+            db.session.commit()
+        self.client.post('/login', data={'username': 'test', 'password': 'password'})
+
+    def tearDown(self):
+        self.app.render_pool.shutdown(wait=True)
+        shutil.rmtree(self.test_dir)
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _save_drawing(self, color='white', **fields):
+        # 8x4 image with a red 2x2 block in the top-left corner
+        img = PILImage.new('RGB', (8, 4), color=color)
+        img.paste((255, 0, 0), (0, 0, 2, 2))
+        img_byte_arr = io.BytesIO()
+        img.save(img_byte_arr, format='PNG')
+        data_url = 'data:image/png;base64,' + base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+        return self.client.post('/save_drawing', json={'image': data_url, **fields}).get_json()
+
+    def _variants(self, image_id):
+        with self.app.app_context():
+            return {v.display_name: (v.width, v.height, v.version, v.filename)
+                    for v in ImageVariant.query.filter_by(image_id=image_id)}
+
+    def test_workers_not_forked_from_web_process(self):
+        self.assertEqual(self.app.render_pool._mp_context.get_start_method(), 'forkserver')
+
+    def test_ingest_renders_every_display(self):
+        image_id = self._save_drawing()['id']
+        variants = self._variants(image_id)
+        self.assertEqual(set(variants), {'Small', 'Dim'})
+        self.assertEqual(variants['Small'][:3], (4, 2, 1))
+        self.assertEqual(variants['Dim'][:3], (8, 4, 1))
+
+        width, height, rgb = read_raw_file(os.path.join(self.test_dir, variants['Small'][3]))
+        self.assertEqual((width, height), (4, 2))
+        self.assertEqual(rgb[:3], bytes([255, 0, 0]))
+
+    def test_rgb_served_from_variant(self):
+        image_id = self._save_drawing()['id']
+        data = self.client.get(f'/api/image/{image_id}/rgb?display=Dim').get_json()
+        self.assertEqual((data['width'], data['height'], data['display_name']), (8, 4, 'Dim'))
+        self.assertEqual(data['pixels'][0], [100, 0, 0])
+        # Second row is reversed for serpentine wiring
+        self.assertEqual(data['pixels'][8], [100, 100, 100])
+        self.assertEqual(data['pixels'][15], [100, 0, 0])
+
+        data = self.client.get(f'/api/image/{image_id}/rgb?display=Small').get_json()
+        self.assertEqual((data['width'], data['height']), (4, 2))
+
+        response = self.client.get(f'/api/image/{image_id}/rgb?display=Nope')
+        self.assertEqual(response.status_code, 400)
+
+    def test_missing_variant_rendered_on_demand(self):
+        image_id = self._save_drawing()['id']
+        self.app.config['DISPLAYS'].append({'name': 'Tiny', 'width': 2, 'height': 1})
+
+        data = self.client.get(f'/api/image/{image_id}/rgb?display=Tiny').get_json()
+        self.assertEqual((data['width'], data['height']), (2, 1))
+        self.assertIn('Tiny', self._variants(image_id))
+
+    def test_changed_display_settings_rerender(self):
+        image_id = self._save_drawing()['id']
+        self.app.config['DISPLAYS'][1]['max_brightness'] = 50
+        data = self.client.get(f'/api/image/{image_id}/rgb?display=Dim').get_json()
+        self.assertEqual(data['pixels'][0], [50, 0, 0])
+
+    def test_edit_replaces_variants(self):
+        image_id = self._save_drawing()['id']
+        old_file = self._variants(image_id)['Small'][3]
+
+        self._save_drawing(color='blue', image_id=image_id)
+        variants = self._variants(image_id)
+        self.assertEqual(variants['Small'][2], 2)
+        self.assertNotEqual(variants['Small'][3], old_file)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, old_file)))
+
+    def test_delete_removes_variant_files(self):
+        image_id = self._save_drawing()['id']
+        paths = [os.path.join(self.test_dir, v[3]) for v in self._variants(image_id).values()]
+
+        self.client.delete(f'/api/image/{image_id}')
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        with self.app.app_context():
+            self.assertEqual(ImageVariant.query.count(), 0)
+
+    def test_background_ingest_renders_variants(self):
+        self.app.executor = DeferredExecutor()
+        image_id = self._save_drawing()['id']
+        self.assertEqual(self._variants(image_id), {})
+
+        self.app.executor.run_all()
+        self.assertEqual(set(self._variants(image_id)), {'Small', 'Dim'})
+
+    def test_invalid_display_is_skipped(self):
+        self.app.config['DISPLAYS'].append({'name': 'Broken', 'width': 2, 'height': 2, 'layout': 'spiral'})
+        image_id = self._save_drawing()['id']
+        self.assertEqual(set(self._variants(image_id)), {'Small', 'Dim'})
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Image, image_id).status, 'ready')
+
+if __name__ == '__main__':
+    unittest.main()
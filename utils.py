@@ -1,26 +1,69 @@
+import hashlib
+import io
 import os
+import re
 from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import insert
 from extensions import db
-from models import Image
+from models import Image, ImageVersion, ImageVariant
 from PIL import Image as PILImage
+from processing import target_size, display_settings, process_pixels
+from storage import (RAW_EXTENSION, RAW_FLAG_ZLIB, RAW_HEADER, RAW_MAGIC, RAW_VERSION, MAX_DIMENSION,
+                     storage_extension, is_raw_file, encode_raw, decode_raw, read_raw_header, read_raw_file,
+                     write_atomic)
 
-def save_image_artifact(pil_image, user_id, upload_folder, filename_prefix="image_", metadata=None, executor=None):
+# Stem of a content-addressed file name, see content_filename()
+CONTENT_HASH_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+def save_image_artifact(pil_image, user_id, upload_folder, metadata=None, executor=None, cache=None,
+                        storage_format='bmp', compress=False, image=None, displays=None, render_pool=None,
+                        frame_durations=None, max_versions=None):
     """
     Saves a PIL Image to disk and creates a corresponding database record.
 
+    Files are content-addressed: the name is the SHA-256 of the decoded RGB
+    buffer, sharded into two levels of subdirectories. Saving pixels that are
+    already stored only adds a record pointing at the existing file.
+
+    With an executor the record is committed with status 'pending' and returned
+    immediately; encoding and writing the file happen on the executor, which
+    marks the record 'ready' once the file is durable on disk, or 'failed'.
+
+    Passing an existing image stores pil_image as its next version instead: the
+    current file is recorded as an ImageVersion, so displays can later fetch
+    only the pixels that changed. Metadata keys that are absent are kept. With
+    an executor the record is left unchanged, and keeps serving the current
+    version, until the new file is durable; a failed write leaves it as it was.
+
+    Once the file is written, a variant is rendered for each of displays (see
+    build_display_variants()), in the background when an executor is given.
+
+    Animated images are passed as a frame strip (see frame_strip()) together
+    with frame_durations; the record's height is then the height of one frame.
+    Variants are rendered from the first frame.
+
     Args:
         pil_image: The PIL Image object to save.
         user_id: The ID of the user saving the image.
         upload_folder: The directory path where the image file should be saved.
-        filename_prefix: Prefix for the generated filename (default: "image_").
         metadata: Dictionary containing optional metadata ('display_name', 'scroll_direction', 'scroll_speed').
         executor: Optional concurrent.futures.Executor for asynchronous file saving. If None, saving is synchronous.
+        cache: Optional PixelCache. Entries for the written file are invalidated once it is on disk.
+        storage_format: 'bmp' for a BMP file, or 'raw' for a raw pixel file (see storage.py).
+        compress: Whether raw pixel files are zlib-compressed. Ignored for BMP.
+        image: Optional existing Image database model instance to update.
+        displays: Optional list of display configurations to render variants for.
+        render_pool: Optional executor, e.g. a ProcessPoolExecutor, that renders the variants in parallel.
+        frame_durations: Optional list of per-frame durations in milliseconds for a frame strip.
+        max_versions: Optional number of earlier versions to keep when editing, see apply_image_version().
 
     Returns:
-        The created Image database model instance.
+        The created or updated Image database model instance.
 
     Raises:
-        Exception: Re-raises exceptions from file saving or database operations.
+        Exception: Re-raises exceptions from database operations, and from file
+        saving when saving synchronously.
     """
     if metadata is None:
         metadata = {}
@@ -29,49 +72,758 @@ def save_image_artifact(pil_image, user_id, upload_folder, filename_prefix="imag
     if pil_image.mode != 'RGB':
         pil_image = pil_image.convert('RGB')
 
-    timestamp = int(datetime.now(timezone.utc).timestamp())
-    filename = f"{filename_prefix}{user_id}_{timestamp}.bmp"
+    # Decode now: the source stream may be closed once the request ends
+    pil_image.load()
+
+    frame_count = len(frame_durations) if frame_durations else 1
+    frame_height = pil_image.height // frame_count
+    if frame_count == 1:
+        frame_durations = None
+
+    digest = content_hash(pil_image, frame_count)
+    filename = content_filename(digest, storage_extension(storage_format))
     filepath = os.path.join(upload_folder, filename)
 
-    width = pil_image.width
-    height = pil_image.height
+    # Identical pixels are already on disk; nothing to write
+    background = executor
+    if os.path.exists(filepath):
+        executor = None
+    elif not executor:
+        write_image_file(pil_image, filepath, compress)
+
+    edit = None
+    if image is None:
+        db_image = Image(
+            filename=filename,
+            content_hash=digest,
+            user_id=user_id,
+            width=pil_image.width,
+            height=frame_height,
+            frame_count=frame_count,
+            frame_durations=frame_durations,
+            display_name=metadata.get('display_name'),
+            scroll_direction=metadata.get('scroll_direction', 'none'),
+            scroll_speed=metadata.get('scroll_speed', 0),
+            status='pending' if executor else 'ready'
+        )
+        db.session.add(db_image)
+        db.session.commit()
+    else:
+        db_image = image
+        edit = {
+            'filename': filename,
+            'content_hash': digest,
+            'width': pil_image.width,
+            'height': frame_height,
+            'frame_count': frame_count,
+            'frame_durations': frame_durations,
+            'metadata': metadata,
+            'max_versions': max_versions
+        }
+        if not executor:
+            pruned = apply_image_version(db_image, **edit)
+            db.session.commit()
+            remove_unreferenced_artifacts(pruned, upload_folder, cache)
 
-    future = None
     if executor:
-        future = executor.submit(pil_image.save, filepath, 'BMP')
+        # Edits keep serving the current version until the new file is durable
+        app = current_app._get_current_object()
+        executor.submit(_finish_artifact, app, db_image.id, pil_image, filepath, cache, compress,
+                        displays, upload_folder, render_pool, frame_height, edit, digest)
+        return db_image
+
+    if cache is not None:
+        cache.invalidate(filepath)
+    if displays:
+        if background:
+            app = current_app._get_current_object()
+            images = [first_frame_task(db_image.id, pil_image, frame_height)]
+            background.submit(build_variants_task, app, images, displays, upload_folder, render_pool)
+        else:
+            try:
+                _, width, height, rgb = first_frame_task(db_image.id, pil_image, frame_height)
+                build_display_variants(db_image, width, height, rgb, displays, upload_folder, render_pool)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Variant rendering failed for image {db_image.id}: {e}")
+
+    return db_image
+
+def apply_image_version(db_image, filename, content_hash, width, height, frame_count=1, frame_durations=None,
+                        metadata=None, max_versions=None):
+    """
+    Makes a stored file the current version of db_image. The file of the
+    current version is recorded as an ImageVersion and the version number is
+    bumped. Metadata keys that are absent are kept. The caller commits.
+
+    Only the newest max_versions earlier versions are kept; displays that are
+    further behind get a full frame from the delta endpoint instead.
+
+    Returns:
+        List of (filename, content_hash) of the pruned versions, to pass to
+        remove_unreferenced_artifacts() once committed.
+    """
+    metadata = metadata or {}
+    db_image.versions.append(ImageVersion(
+        version=db_image.version,
+        filename=db_image.filename,
+        content_hash=db_image.content_hash,
+        width=db_image.width,
+        height=db_image.height
+    ))
+    db_image.version += 1
+    db_image.filename = filename
+    db_image.content_hash = content_hash
+    db_image.width = width
+    db_image.height = height
+    db_image.frame_count = frame_count
+    db_image.frame_durations = frame_durations
+    db_image.display_name = metadata.get('display_name', db_image.display_name)
+    db_image.scroll_direction = metadata.get('scroll_direction', db_image.scroll_direction)
+    db_image.scroll_speed = metadata.get('scroll_speed', db_image.scroll_speed)
+    db_image.status = 'ready'
+
+    pruned = []
+    if max_versions is not None and len(db_image.versions) > max_versions:
+        # versions is ordered oldest first; delete-orphan deletes the removed rows
+        for old in db_image.versions[:len(db_image.versions) - max_versions]:
+            pruned.append((old.filename, old.content_hash))
+            db_image.versions.remove(old)
+    return pruned
+
+def content_hash(pil_image, frame_count=1):
+    """
+    Returns the hex SHA-256 of an RGB image's dimensions and pixel buffer.
+    Frame strips also hash their frame count, so they never share a file with
+    a still image of the same pixels.
+    """
+    size = f"{pil_image.width}x{pil_image.height}"
+    if frame_count > 1:
+        size += f"/{frame_count}"
+    digest = hashlib.sha256(f"{size}:".encode('ascii'))
+    digest.update(pil_image.tobytes())
+    return digest.hexdigest()
+
+def read_frames(pil_image, max_frames):
+    """
+    Decodes every frame of a (possibly animated) image, e.g. an animated GIF.
+
+    Args:
+        pil_image: The opened PIL Image object.
+        max_frames: Largest number of frames that may be decoded.
+
+    Returns:
+        Tuple of (frames, durations): a list of RGB PIL Images, and a list of
+        per-frame durations in milliseconds, or None for still images.
+
+    Raises:
+        ValueError: If the image has more than max_frames frames.
+    """
+    frame_count = getattr(pil_image, 'n_frames', 1)
+    if frame_count <= 1:
+        return [pil_image], None
+    if frame_count > max_frames:
+        raise ValueError(f"Animation has {frame_count} frames, the maximum is {max_frames}")
+
+    frames = []
+    durations = []
+    for index in range(frame_count):
+        pil_image.seek(index)
+        frames.append(pil_image.convert('RGB'))
+        # GIFs without a delay are shown at the common browser default
+        duration = pil_image.info.get('duration') or 100
+        durations.append(max(1, min(int(duration), 0xFFFF)))
+    return frames, durations
+
+def frame_strip(frames):
+    """
+    Stacks equally sized frames vertically into one image, the storage layout
+    of animated images.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    width, height = frames[0].size
+    strip = PILImage.new('RGB', (width, height * len(frames)))
+    for index, frame in enumerate(frames):
+        strip.paste(frame, (0, index * height))
+    return strip
+
+def first_frame_task(image_id, pil_image, frame_height):
+    """
+    Returns the (image_id, width, height, rgb) tuple build_variants_task()
+    expects for the first frame of a frame strip.
+    """
+    rgb = pil_image.tobytes()
+    return image_id, pil_image.width, frame_height, rgb[:pil_image.width * frame_height * 3]
+
+def content_filename(digest, extension='bmp'):
+    """
+    Returns the sharded relative path for a content hash, e.g. 'ab/cd/abcd....bmp'.
+    """
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+def file_fingerprint(filename, upload_folder):
+    """
+    Returns a short fingerprint of a stored file's content, for immutable URLs.
+
+    Content-addressed files (and the files generated from them) already carry
+    the hash of their pixels in their name, so no disk access is needed. Other
+    files are fingerprinted by name and modification time.
+    """
+    stem = os.path.basename(filename).split('.', 1)[0]
+    if CONTENT_HASH_PATTERN.fullmatch(stem):
+        return stem[:16]
+    try:
+        mtime = os.path.getmtime(os.path.join(upload_folder, filename))
+    except OSError:
+        mtime = None
+    return hashlib.sha1(f"{filename}:{mtime}".encode('utf-8')).hexdigest()[:16]
+
+def write_image_file(pil_image, filepath, compress=False):
+    """
+    Durably writes pil_image to filepath, see storage.write_atomic().
+
+    Files with the raw pixel extension are written as raw pixel files, anything
+    else as BMP.
+    """
+    if is_raw_file(filepath):
+        data = encode_raw(pil_image.width, pil_image.height, pil_image.tobytes(), compress)
+        write_atomic(filepath, lambda f: f.write(data))
     else:
-        pil_image.save(filepath, 'BMP')
-
-    db_image = Image(
-        filename=filename,
-        user_id=user_id,
-        width=width,
-        height=height,
-        display_name=metadata.get('display_name'),
-        scroll_direction=metadata.get('scroll_direction', 'none'),
-        scroll_speed=metadata.get('scroll_speed', 0)
-    )
-
-    db.session.add(db_image)
+        write_atomic(filepath, lambda f: pil_image.save(f, 'BMP'))
+
+def read_image_file(filepath):
+    """
+    Reads a file written by write_image_file().
+
+    Returns:
+        Tuple of (width, height, packed RGB888 bytes).
+    """
+    if is_raw_file(filepath):
+        return read_raw_file(filepath)
+    with PILImage.open(filepath) as image:
+        return image.width, image.height, image.convert('RGB').tobytes()
+
+def ensure_bmp_file(filepath):
+    """
+    Returns the path of a BMP version of the artifact at filepath.
+
+    BMP artifacts are returned as is. For raw pixel files a BMP is generated
+    next to the file on first use and reused afterwards.
+    """
+    if not is_raw_file(filepath):
+        return filepath
+    bmp_path = os.path.splitext(filepath)[0] + '.bmp'
+    if not os.path.exists(bmp_path):
+        width, height, rgb = read_raw_file(filepath)
+        write_image_file(PILImage.frombytes('RGB', (width, height), rgb), bmp_path)
+    return bmp_path
+
+def ensure_raw_file(filepath):
+    """
+    Returns the path of an uncompressed raw pixel file for the artifact at filepath.
+
+    Uncompressed raw artifacts are returned as is. For BMP and compressed raw
+    artifacts one is generated next to the file on first use and reused
+    afterwards, so it can be served straight from the page cache.
+    """
+    if is_raw_file(filepath) and not read_raw_header(filepath)[0] & RAW_FLAG_ZLIB:
+        return filepath
+    raw_path = os.path.splitext(filepath)[0] + '.plain.' + RAW_EXTENSION
+    if not os.path.exists(raw_path):
+        width, height, rgb = read_image_file(filepath)
+        data = encode_raw(width, height, rgb)
+        write_atomic(raw_path, lambda f: f.write(data))
+    return raw_path
+
+def build_display_variants(db_image, width, height, rgb, displays, upload_folder, render_pool=None):
+    """
+    Renders an image for each display (see processing.process_pixels()) and
+    stores the results as ImageVariant records, replacing earlier variants for
+    the same displays.
+
+    Variant files are uncompressed raw pixel files under 'variants/',
+    content-addressed like images. Displays with invalid settings are skipped.
+
+    Args:
+        db_image: The Image database model instance the pixels belong to.
+        width: Image width in pixels.
+        height: Image height in pixels.
+        rgb: Packed RGB888 pixels of the image's current version.
+        displays: List of display configurations.
+        upload_folder: The directory path where image files are stored.
+        render_pool: Optional executor that renders the displays in parallel.
+
+    Returns:
+        List of the ImageVariant instances that were stored.
+    """
+    rgb = bytes(rgb)
+    jobs = []
+    for display in displays:
+        try:
+            settings = display_settings(display)
+        except ValueError as e:
+            current_app.logger.error(f"Skipping variant for display {display.get('name')}: {e}")
+            continue
+        args = (width, height, rgb, display, db_image.scroll_direction, db_image.scroll_speed)
+        job = render_pool.submit(process_pixels, *args) if render_pool else None
+        jobs.append((display, settings, job, args))
+
+    existing = {variant.display_name: variant for variant in db_image.variants}
+    replaced = []
+    variants = []
+    for display, settings, job, args in jobs:
+        v_width, v_height, v_rgb = job.result() if job else process_pixels(*args)
+
+        digest = hashlib.sha256(f"{v_width}x{v_height}:".encode('ascii'))
+        digest.update(v_rgb)
+        filename = 'variants/' + content_filename(digest.hexdigest(), RAW_EXTENSION)
+        filepath = os.path.join(upload_folder, filename)
+        if not os.path.exists(filepath):
+            data = encode_raw(v_width, v_height, v_rgb)
+            write_atomic(filepath, lambda f: f.write(data))
+
+        variant = existing.get(display['name'])
+        if variant is None:
+            variant = ImageVariant(display_name=display['name'])
+            db_image.variants.append(variant)
+        elif variant.filename != filename:
+            replaced.append(variant.filename)
+        variant.version = db_image.version
+        variant.settings = settings
+        variant.filename = filename
+        variant.width = v_width
+        variant.height = v_height
+        variants.append(variant)
+
+    db.session.commit()
+    remove_unreferenced_variants(replaced, upload_folder)
+    return variants
+
+def remove_unreferenced_variants(filenames, upload_folder, cache=None):
+    """
+    Removes the variant files among filenames that no ImageVariant references anymore.
+    """
+    for filename in set(filenames):
+        if ImageVariant.query.filter_by(filename=filename).count() > 0:
+            continue
+        filepath = os.path.join(upload_folder, filename)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        if cache is not None:
+            cache.invalidate(filepath)
+
+def derived_paths(filepath):
+    """
+    Returns the paths of files that ensure_bmp_file() and ensure_raw_file() may
+    have generated for the artifact at filepath.
+    """
+    stem = os.path.splitext(filepath)[0]
+    return [stem + '.bmp', stem + '.plain.' + RAW_EXTENSION]
+
+def playlist_cache_key(playlist_id):
+    """
+    Returns the PixelCache key prefix of a playlist's cached bundles.
+    """
+    return f'playlist:{playlist_id}'
+
+def delete_image_artifact(db_image, upload_folder, cache=None):
+    """
+    Deletes an Image record, its stored versions and its playlist items, and
+    each of their files once no other record references it. Playlists the
+    image was on count as edited.
+
+    Args:
+        db_image: The Image database model instance to delete.
+        upload_folder: The directory path where image files are stored.
+        cache: Optional PixelCache. Entries for a removed file and bundles of
+            the affected playlists are invalidated.
+
+    Returns:
+        True if the file of the current version was removed from disk.
+    """
+    current = (db_image.filename, db_image.content_hash)
+    artifacts = {current} | {(v.filename, v.content_hash) for v in db_image.versions}
+    variant_files = [variant.filename for variant in db_image.variants]
+
+    # The image's playlist items are deleted with it; removing an item does not touch the playlist row
+    playlists = {item.playlist for item in db_image.playlist_items}
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for playlist in playlists:
+        playlist.updated_at = now
+    playlist_ids = [playlist.id for playlist in playlists]
+
+    db.session.delete(db_image)
     db.session.commit()
+    remove_unreferenced_variants(variant_files, upload_folder, cache)
+    if cache is not None:
+        for playlist_id in playlist_ids:
+            cache.invalidate(playlist_cache_key(playlist_id))
+
+    return current in remove_unreferenced_artifacts(artifacts, upload_folder, cache)
+
+def remove_unreferenced_artifacts(artifacts, upload_folder, cache=None):
+    """
+    Removes the image files among artifacts that no Image or ImageVersion
+    references anymore, together with any files generated from them.
+
+    Args:
+        artifacts: Iterable of (filename, content_hash) tuples.
+        upload_folder: The directory path where image files are stored.
+        cache: Optional PixelCache. Entries for a removed file are invalidated.
+
+    Returns:
+        Set of the (filename, content_hash) tuples that were removed.
+    """
+    removed = set()
+    for filename, digest in set(artifacts):
+        if digest is not None and Image.references_to(digest) > 0:
+            continue
+        filepath = os.path.join(upload_folder, filename)
+        # Also remove any files generated from the artifact on demand
+        for path in {filepath, *derived_paths(filepath)}:
+            if os.path.exists(path):
+                os.remove(path)
+        if cache is not None:
+            cache.invalidate(filepath)
+        removed.add((filename, digest))
+    return removed
 
-    if future:
+def _finish_artifact(app, image_id, pil_image, filepath, cache, compress=False, displays=None,
+                     upload_folder=None, render_pool=None, frame_height=None, edit=None, digest=None):
+    """
+    Background half of save_image_artifact: writes the file, updates the record
+    status, or applies the edit, and renders the display variants. If the
+    record was deleted in the meantime, the file is removed again unless
+    another record references it.
+    """
+    with app.app_context():
         try:
-            future.result()
+            write_image_file(pil_image, filepath, compress)
+            status = 'ready'
         except Exception as e:
-            # Rollback DB if file save fails asynchronously
-            # We catch generic Exception because future.result() can raise anything
-            # But we should be careful about what we swallow. Here we re-raise.
+            app.logger.error(f"File save error for image {image_id}: {e}")
+            status = 'failed'
+
+        if cache is not None:
+            cache.invalidate(filepath)
+
+        db_image = db.session.get(Image, image_id)
+        pruned = []
+        if db_image is None:
+            if status == 'ready':
+                pruned = [(os.path.relpath(filepath, upload_folder), digest)]
+            status = 'deleted'
+        else:
+            if edit is None:
+                db_image.status = status
+            elif status == 'ready':
+                pruned = apply_image_version(db_image, **edit)
+            db.session.commit()
+        remove_unreferenced_artifacts(pruned, upload_folder, cache)
+
+    if status == 'ready' and displays:
+        images = [first_frame_task(image_id, pil_image, frame_height or pil_image.height)]
+        build_variants_task(app, images, displays, upload_folder, render_pool)
+
+def build_variants_task(app, images, displays, upload_folder, render_pool=None):
+    """
+    Background task that renders the display variants of one or more images.
+
+    Args:
+        app: The Flask application.
+        images: List of (image_id, width, height, rgb) tuples. With rgb None,
+            the first frame is read from the image's stored file.
+        displays: List of display configurations.
+        upload_folder: The directory path where image files are stored.
+        render_pool: Optional executor that renders the displays in parallel.
+    """
+    with app.app_context():
+        for image_id, width, height, rgb in images:
+            db_image = db.session.get(Image, image_id)
+            if db_image is None:
+                continue
             try:
-                db.session.delete(db_image)
-                db.session.commit()
-            except Exception:
-                # If rollback fails, we log it (if we had a logger) or just pass
-                # simpler to let the original exception propagate but try to cleanup
-                pass
-            raise e
+                if rgb is None:
+                    _, _, rgb = read_image_file(os.path.join(upload_folder, db_image.filename))
+                    rgb = rgb[:width * height * 3]
+                build_display_variants(db_image, width, height, rgb, displays, upload_folder, render_pool)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Variant rendering failed for image {image_id}: {e}")
 
-    return db_image
+def open_upload_image(stream, max_pixels, display_config=None, scroll_direction='none', scroll_speed=0):
+    """
+    Opens an uploaded image without decoding more pixels than needed.
+
+    Only the header is read at first. The size the image will be fitted to is
+    checked against the display's 'max_width' and 'max_height' before any
+    pixel data is decoded. Formats that support it (JPEG) are then set up to
+    decode at a reduced scale that is still at least that size. Finally the
+    number of pixels the decoder will produce, over all frames of an
+    animation, is checked against max_pixels, which guards against
+    decompression bombs.
+
+    Args:
+        stream: File-like object with the encoded image.
+        max_pixels: Largest number of pixels that may be decoded.
+        display_config: Optional display configuration the image is fitted to.
+        scroll_direction: Direction of scrolling, used to compute the fitted size.
+        scroll_speed: Speed of scrolling.
+
+    Returns:
+        The opened (still undecoded) PIL Image object.
+
+    Raises:
+        ValueError: If the image exceeds the display limits, max_pixels or,
+            once stored as a frame strip, MAX_DIMENSION.
+        PIL.UnidentifiedImageError: If the data is not a supported image.
+    """
+    image = PILImage.open(stream)
+    width, height = image.size
+    frame_count = getattr(image, 'n_frames', 1)
+    stored_size = (width, height)
+
+    if display_config:
+        target_width, target_height = target_size(width, height, display_config, scroll_direction, scroll_speed)
+        max_width = display_config.get('max_width', display_config['width'])
+        max_height = display_config.get('max_height', display_config['height'])
+        if target_width > max_width or target_height > max_height:
+            raise ValueError(f"Image would be {target_width}x{target_height} on {display_config.get('name')}, "
+                             f"the maximum is {max_width}x{max_height}")
+        if (target_width, target_height) != (width, height):
+            # Let the decoder downscale (JPEG: by 1/2, 1/4 or 1/8) without going below the target
+            image.draft('RGB', (target_width, target_height))
+        stored_size = (target_width, target_height)
+
+    # Frames are stored stacked vertically, see frame_strip()
+    check_dimensions(stored_size[0], stored_size[1] * frame_count)
+    if image.width * image.height * frame_count > max_pixels:
+        raise ValueError(f"Image is too large ({width}x{height} pixels, {frame_count} frames)"
+                         if frame_count > 1 else f"Image is too large ({width}x{height} pixels)")
+    return image
+
+def check_dimensions(width, height):
+    """
+    Raises ValueError if an image of width x height pixels cannot be stored,
+    because the raw pixel and packed frame headers hold sizes as uint16.
+    """
+    if width > MAX_DIMENSION or height > MAX_DIMENSION:
+        raise ValueError(f"Image is too large ({width}x{height} pixels, "
+                         f"at most {MAX_DIMENSION} pixels per side)")
+
+def open_pixel_upload(data, max_pixels):
+    """
+    Reads pixels sent by the editor as a raw pixel file body: the 10-byte
+    header of storage.py (width and height) followed by packed RGB888 rows.
+
+    The dimensions are checked against max_pixels before the pixels are
+    touched, and the body must be uncompressed and exactly the declared size.
+
+    Args:
+        data: The request body (bytes).
+        max_pixels: Largest number of pixels allowed.
+
+    Returns:
+        RGB PIL Image object.
+
+    Raises:
+        ValueError: If the body is malformed or the image exceeds max_pixels.
+    """
+    if len(data) < RAW_HEADER.size:
+        raise ValueError("Truncated pixel data")
+    magic, version, flags, width, height = RAW_HEADER.unpack_from(data)
+    if magic != RAW_MAGIC or version != RAW_VERSION or flags:
+        raise ValueError("Pixel data must be an uncompressed raw pixel file")
+    if width == 0 or height == 0:
+        raise ValueError("Image is empty")
+    if width * height > max_pixels:
+        raise ValueError(f"Image is too large ({width}x{height} pixels)")
+    check_dimensions(width, height)
+    width, height, rgb = decode_raw(data)
+    return PILImage.frombytes('RGB', (width, height), rgb)
+
+def decode_upload(data, max_pixels, display_config=None, scroll_direction='none', scroll_speed=0, max_frames=1):
+    """
+    Decodes an uploaded image and fits it to a display, see open_upload_image().
+    Every frame of an animation is decoded, as /upload does, and the frames
+    are returned as a frame strip (see frame_strip()).
+    Module-level so that it can run in worker processes.
+
+    Returns:
+        Tuple of (width, frame height, packed RGB888 bytes of the strip,
+        per-frame durations in milliseconds or None for still images).
+
+    Raises:
+        ValueError: If the image exceeds the limits of open_upload_image() or
+            has more than max_frames frames.
+    """
+    image = open_upload_image(io.BytesIO(data), max_pixels, display_config, scroll_direction, scroll_speed)
+    frames, durations = read_frames(image, max_frames)
+    if display_config:
+        frames = [resize_image_to_display(frame, display_config, scroll_direction, scroll_speed)
+                  for frame in frames]
+    strip = frame_strip(frames)
+    if strip.mode != 'RGB':
+        strip = strip.convert('RGB')
+    return strip.width, strip.height // len(frames), strip.tobytes(), durations
+
+def import_image_batch(items, user_id, upload_folder, metadata=None, display_config=None, max_pixels=None,
+                       storage_format='bmp', compress=False, executor=None, render_pool=None, max_frames=1,
+                       chunk_size=16):
+    """
+    Imports many images at once.
+
+    Items are processed in chunks of chunk_size, so at most one chunk of
+    decoded images is held in memory. In each chunk, images are decoded and
+    fitted in parallel on render_pool, files are written concurrently on
+    executor, once per distinct content, and the Image records are inserted
+    with one bulk INSERT. The whole batch is committed in a single transaction.
+    Items that fail to decode or write are reported and skipped.
+
+    Args:
+        items: List of (name, encoded image bytes). Items rejected earlier are
+            passed as (name, exception) and reported as failed.
+        user_id: The ID of the user importing the images.
+        upload_folder: The directory path where image files are stored.
+        metadata: Dictionary with optional 'display_name', 'scroll_direction' and 'scroll_speed' for every image.
+        display_config: Optional display configuration every image is fitted to.
+        max_pixels: Largest number of pixels that may be decoded per image.
+        storage_format: 'bmp' or 'raw', see save_image_artifact().
+        compress: Whether raw pixel files are zlib-compressed.
+        executor: Optional executor for concurrent file writes.
+        render_pool: Optional executor, e.g. a ProcessPoolExecutor, for parallel decoding.
+        max_frames: Largest number of frames an animated image may have; animations
+            are stored as frame strips like save_image_artifact() does.
+        chunk_size: Number of items decoded, written and inserted at a time.
+
+    Returns:
+        Tuple of (report, imported). report holds one dict per item, in order,
+        with 'name', 'status' ('imported' or 'failed') and 'id' or 'error'.
+        imported lists (image_id, width, height, None) for every imported item,
+        the form build_variants_task() reads from the stored file.
+
+    Raises:
+        Exception: Re-raises database errors; files written by the batch are removed first.
+    """
+    if metadata is None:
+        metadata = {}
+    options = {
+        'user_id': user_id,
+        'upload_folder': upload_folder,
+        'metadata': metadata,
+        'display_config': display_config,
+        'max_pixels': max_pixels,
+        'storage_format': storage_format,
+        'compress': compress,
+        'executor': executor,
+        'render_pool': render_pool,
+        'max_frames': max_frames
+    }
+
+    report = []
+    imported = []
+    written = []
+    try:
+        for start in range(0, len(items), chunk_size):
+            _import_chunk(items[start:start + chunk_size], report, imported, written, **options)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for filepath in written:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        raise
+    return report, imported
+
+def _import_chunk(items, report, imported, written, user_id, upload_folder, metadata, display_config, max_pixels,
+                  storage_format, compress, executor, render_pool, max_frames):
+    """
+    Decodes, writes and inserts one chunk of import_image_batch(), appending
+    to its report and imported lists and to the written file paths.
+    """
+    scroll_direction = metadata.get('scroll_direction', 'none')
+    scroll_speed = metadata.get('scroll_speed', 0)
+
+    args = [(data, max_pixels, display_config, scroll_direction, scroll_speed, max_frames) for _, data in items]
+    jobs = [render_pool.submit(decode_upload, *a) if render_pool and not isinstance(a[0], Exception) else None
+            for a in args]
+    decoded = []
+    for job, a in zip(jobs, args):
+        if isinstance(a[0], Exception):
+            decoded.append(a[0])
+            continue
+        try:
+            decoded.append(job.result() if job else decode_upload(*a))
+        except Exception as e:
+            decoded.append(e)
+
+    # Write each distinct file once; duplicates in the batch and on disk share it
+    pending = {}
+    names = []
+    for result in decoded:
+        if isinstance(result, Exception):
+            names.append(None)
+            continue
+        width, height, rgb, durations = result
+        frame_count = len(durations) if durations else 1
+        pil_image = PILImage.frombytes('RGB', (width, height * frame_count), rgb)
+        digest = content_hash(pil_image, frame_count)
+        filename = content_filename(digest, storage_extension(storage_format))
+        filepath = os.path.join(upload_folder, filename)
+        if filepath not in pending and not os.path.exists(filepath):
+            pending[filepath] = pil_image
+        names.append((digest, filename, filepath))
+
+    writes = {}
+    if executor:
+        writes = {filepath: executor.submit(write_image_file, pil_image, filepath, compress)
+                  for filepath, pil_image in pending.items()}
+    failed_writes = {}
+    for filepath, pil_image in pending.items():
+        try:
+            if executor:
+                writes[filepath].result()
+            else:
+                write_image_file(pil_image, filepath, compress)
+            written.append(filepath)
+        except Exception as e:
+            failed_writes[filepath] = e
+
+    rows = []
+    for result, name in zip(decoded, names):
+        if name is None or name[2] in failed_writes:
+            continue
+        width, height, _, durations = result
+        rows.append({
+            'filename': name[1],
+            'content_hash': name[0],
+            'user_id': user_id,
+            'width': width,
+            'height': height,
+            'frame_count': len(durations) if durations else 1,
+            'frame_durations': durations,
+            'display_name': metadata.get('display_name'),
+            'scroll_direction': scroll_direction,
+            'scroll_speed': scroll_speed,
+            'status': 'ready'
+        })
+
+    ids = []
+    if rows:
+        ids = db.session.scalars(insert(Image).returning(Image.id, sort_by_parameter_order=True), rows).all()
+
+    new_ids = iter(ids)
+    for (item_name, _), result, name in zip(items, decoded, names):
+        if name is None:
+            report.append({'name': item_name, 'status': 'failed', 'error': str(result) or type(result).__name__})
+        elif name[2] in failed_writes:
+            report.append({'name': item_name, 'status': 'failed', 'error': str(failed_writes[name[2]])})
+        else:
+            image_id = next(new_ids)
+            report.append({'name': item_name, 'status': 'imported', 'id': image_id})
+            # Variants are rendered later from the stored file, not from the pixels held here
+            imported.append((image_id, result[0], result[1], None))
 
 def resize_image_to_display(pil_image, display_config, scroll_direction='none', scroll_speed=0):
     """
@@ -89,53 +841,58 @@ def resize_image_to_display(pil_image, display_config, scroll_direction='none',
     if not display_config:
         return pil_image
 
-    width = pil_image.width
-    height = pil_image.height
+    size = target_size(pil_image.width, pil_image.height, display_config, scroll_direction, scroll_speed)
+    if size == pil_image.size:
+        return pil_image
+    return pil_image.resize(size, resample=PILImage.NEAREST)
 
-    d_width = display_config['width']
-    d_height = display_config['height']
+def render_scroll_frames(pil_image, display_config, scroll_direction='none'):
+    """
+    Renders the sequence of display-sized windows a device shows while scrolling.
 
-    scrolling = scroll_speed > 0 and scroll_direction != 'none'
+    The image is centred on the non-scrolling axis and padded with black up to
+    the display size. On the scrolling axis the content wraps around, stepping
+    one pixel per frame, so the sequence loops seamlessly.
 
-    if not scrolling:
-        # 1. If smaller (or equal) in both dimensions, keep size.
-        if width <= d_width and height <= d_height:
-            return pil_image
+    Args:
+        pil_image: PIL Image object.
+        display_config: Dictionary containing 'width' and 'height'.
+        scroll_direction: Direction of scrolling ('none', 'left', 'right', 'up', 'down').
 
-        # 2. Resize to fit within display dimensions
-        # Use simple aspect ratio scaling to fit within d_width x d_height
-        ratio = min(d_width / width, d_height / height)
-        new_width = int(width * ratio)
-        new_height = int(height * ratio)
+    Returns:
+        List of PIL Images, each exactly display width x height.
+    """
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
 
-        # Ensure dimensions are at least 1
-        new_width = max(1, new_width)
-        new_height = max(1, new_height)
+    d_width = display_config['width']
+    d_height = display_config['height']
+    horizontal = scroll_direction in ['left', 'right']
+    vertical = scroll_direction in ['up', 'down']
 
-        return pil_image.resize((new_width, new_height), resample=PILImage.NEAREST)
+    # One scroll period: the image padded to at least the display size
+    period_w = max(pil_image.width, d_width) if horizontal else d_width
+    period_h = max(pil_image.height, d_height) if vertical else d_height
+    offset_x = 0 if horizontal else (d_width - pil_image.width) // 2
+    offset_y = 0 if vertical else (d_height - pil_image.height) // 2
 
+    # Lay out two periods back to back so every window is a single crop
+    strip = PILImage.new('RGB', (period_w * 2 if horizontal else period_w, period_h * 2 if vertical else period_h))
+    strip.paste(pil_image, (offset_x, offset_y))
+    if horizontal:
+        strip.paste(pil_image, (period_w, offset_y))
+    elif vertical:
+        strip.paste(pil_image, (offset_x, period_h))
     else:
-        # Scrolling enabled
-        if scroll_direction in ['left', 'right']: # Horizontal
-            # Non-scrolling side is height.
-            if height > d_height:
-                # Resize so height = d_height
-                new_h = d_height
-                # Aspect ratio: new_w / new_h = width / height => new_w = (width / height) * new_h
-                new_w = int((width / height) * new_h)
-                new_w = max(1, new_w)
-                return pil_image.resize((new_w, new_h), resample=PILImage.NEAREST)
-            return pil_image
-
-        elif scroll_direction in ['up', 'down']: # Vertical
-            # Non-scrolling side is width.
-            if width > d_width:
-                # Resize so width = d_width
-                new_w = d_width
-                # Aspect ratio: new_h = (height / width) * new_w
-                new_h = int((height / width) * new_w)
-                new_h = max(1, new_h)
-                return pil_image.resize((new_w, new_h), resample=PILImage.NEAREST)
-            return pil_image
-
-    return pil_image
+        return [strip]
+
+    frames = []
+    period = period_w if horizontal else period_h
+    for step in range(period):
+        # Content moving left/up means the window advances right/down
+        position = step if scroll_direction in ['left', 'up'] else (period - step) % period
+        if horizontal:
+            frames.append(strip.crop((position, 0, position + d_width, d_height)))
+        else:
+            frames.append(strip.crop((0, position, d_width, position + d_height)))
+    return frames